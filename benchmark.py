@@ -0,0 +1,240 @@
+'''
+Benchmarks the converters on the treebanks that come with the repository: swe/swedish.py on each bank of swe/UD, and
+eng/english.py on GENTLE, read back from eng/UD+ without the columns and nodes the conversion added. English is run in
+fail-fast mode without stored answers, so that it asks nothing: the sentences with a question are left out as
+problematic, and only the non-interactive part of the grammar is measured.
+
+Each converter is run in its own process on each bank, with --stats (see instrument.py) and without the parse and result
+caches, and the sentences and tokens per second, the peak memory and the time of each stage are written to a JSON file.
+--scale runs each bank replicated N times as well, for the scaling of the converters with the size of the corpus, and
+--compare checks the throughput and memory against the results of an earlier run, e.g. of another commit:
+
+    python3 benchmark.py --scale 1 4 16 --output before.json
+    (edit)
+    python3 benchmark.py --scale 1 4 16 --output after.json --compare before.json
+
+--synthetic runs the converters on treebanks made by synthetic.py instead, one bank of --synthetic-sentences sentences
+for each sentence length given, named synthetic-LENGTH. The tokens per second should not drop with the length of the
+sentences, nor with --scale, if the conversion is linear in both:
+
+    python3 benchmark.py --synthetic 10 100 1000 --scale 1 4 --repeat 1
+'''
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import synthetic
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# language -> the directory of its converter, the converter, the glob of its bundled treebank files relative to the
+# directory, whose parent directory is the bank, and whether the files are converted ones to read back
+CORPORA = {
+    'swe': ('swe', 'swedish.py', 'UD/swe/*/*.conllu', False),
+    'eng': ('eng', 'english.py', 'UD+/eng/GENTLE/test.conllu', True),
+}
+# the options that keep the English converter from asking questions
+NON_INTERACTIVE = {'eng': ['--fail-fast', '--learn', 'off', '--decisions', 'decisions.json']}
+
+
+def bundled_banks(language) -> dict:
+    '''
+    the bundled treebank files of a language by bank.
+    '''
+    directory, _, pattern, _ = CORPORA[language]
+    banks = {}
+    for filepath in sorted(glob.glob(os.path.join(REPO_DIR, directory, pattern))):
+        banks.setdefault(os.path.basename(os.path.dirname(filepath)), []).append(filepath)
+    return banks
+
+
+def unconverted(line: str) -> str:
+    '''
+    a line of a converted file as it was before the conversion: without the ms feats column, and nothing for the
+    abstract nodes, whose ids are decimal.
+    '''
+    columns = line.rstrip('\r\n').split('\t')
+    if len(columns) < 10:
+        return line
+    if '.' in columns[0]:
+        return ''
+    return '\t'.join(columns[:10]) + '\n'
+
+
+def replicate(filepaths, scale, directory, converted=False) -> list:
+    '''
+    writes the files replicated scale times to directory, the sent_ids of the copies get a suffix to stay unique.
+    :param converted: whether the files are converted ones, which are read back as they were before the conversion.
+    :return: the paths of the copies.
+    '''
+    copies = []
+    for filepath in filepaths:
+        copy = os.path.join(directory, os.path.basename(filepath))
+        with open(filepath, encoding='utf8') as f:
+            lines = [unconverted(line) for line in f] if converted else f.readlines()
+        with open(copy, 'w', encoding='utf8') as f:
+            for n in range(scale):
+                suffix = f'-r{n}' if n else ''
+                for line in lines:
+                    if suffix and line.startswith('# sent_id = '):
+                        line = line.rstrip('\r\n') + suffix + '\n'
+                    f.write(line)
+        copies.append(copy)
+    return copies
+
+
+def run_converter(language, filepaths, directory, jobs=1) -> dict:
+    '''
+    converts files in a process of their own, in directory, and returns the --stats of the run with the wall time of
+    the process.
+    '''
+    converter_dir, converter = CORPORA[language][:2]
+    stats_path = os.path.join(directory, 'stats.json')
+    if os.path.exists(stats_path):
+        os.remove(stats_path)
+    command = [sys.executable, os.path.join(REPO_DIR, converter_dir, converter), '--no-cache', '--no-result-cache',
+               '--jobs', str(jobs), '--stats', stats_path, '--output-dir', os.path.join(directory, 'UD+'),
+               '--input', *filepaths] + NON_INTERACTIVE.get(language, [])
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=directory, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, encoding='utf8', errors='replace')
+    wall = time.perf_counter() - start
+    # the English converter exits with an error in fail-fast mode when questions were left out, its stats are
+    # written all the same, they are missing if the converter failed
+    if not os.path.exists(stats_path):
+        raise RuntimeError(f'{converter} failed on {filepaths}:\n{process.stderr[-2000:]}')
+    with open(stats_path, encoding='utf8') as f:
+        stats = json.load(f)
+    stats['process_wall'] = wall
+    return stats
+
+
+def synthetic_banks(language, lengths, sentences, directory) -> dict:
+    '''
+    writes a synthetic treebank of the language to directory for each sentence length, and returns them by bank.
+    '''
+    banks = {}
+    for length in lengths:
+        filepath = os.path.join(directory, f'synthetic_{language}-{length}.conllu')
+        with open(filepath, 'w', encoding='utf8') as f:
+            synthetic.Generator(language, length=length).write(f, sentences)
+        banks[f'synthetic-{length}'] = [filepath]
+    return banks
+
+
+def benchmark(language, bank, filepaths, scale, repeat, jobs, converted=False) -> dict:
+    '''
+    runs the converter of a language repeat times on a bank replicated scale times. The throughput is that of the
+    fastest run, the peak memory the largest.
+    '''
+    with tempfile.TemporaryDirectory(prefix=f'benchmark-{language}-{bank}-') as directory:
+        copies = replicate(filepaths, scale, directory, converted)
+        runs = [run_converter(language, copies, directory, jobs) for _ in range(repeat)]
+    best = min(runs, key=lambda stats: stats['wall'])
+    tokens = best['counters'].get('tokens', 0)
+    return {'language': language, 'bank': bank, 'scale': scale, 'jobs': best['jobs'],
+            'sentences': best['sentences'],
+            'problematic': sum(stats['problematic'] for stats in best['files']),
+            'tokens': tokens,
+            'wall': round(best['wall'], 6),
+            'wall_median': round(statistics.median(stats['wall'] for stats in runs), 6),
+            'process_wall': round(best['process_wall'], 6),
+            'sentences_per_second': round(best['sentences'] / best['wall'], 1),
+            'tokens_per_second': round(tokens / best['wall'], 1),
+            'peak_rss_kb': max(stats['peak_rss_kb'] for stats in runs),
+            'stages': best['stages']}
+
+
+def compare(results, baseline, tolerance) -> list:
+    '''
+    the regressions of results against the results of an earlier run: a throughput lower, or a peak memory higher, by
+    more than the tolerance, a fraction.
+    '''
+    earlier = {(result['language'], result['bank'], result['scale'], result['jobs']): result
+               for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = earlier.get((result['language'], result['bank'], result['scale'], result['jobs']))
+        if old is None:
+            continue
+        name = f"{result['language']} {result['bank']} x{result['scale']}"
+        if result['sentences_per_second'] < old['sentences_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['sentences_per_second']} sentences/s, was "
+                               f"{old['sentences_per_second']}")
+        if old['peak_rss_kb'] and result['peak_rss_kb'] > old['peak_rss_kb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {result['peak_rss_kb']} KB, was {old['peak_rss_kb']} KB")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, encoding='utf8',
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the converters on the bundled treebanks.')
+    parser.add_argument('--languages', nargs='+', choices=list(CORPORA), default=list(CORPORA),
+                        help='the converters to benchmark (default: all).')
+    parser.add_argument('--banks', nargs='+',
+                        help='only benchmark these banks, with --synthetic the bundled ones are only run if named here.')
+    parser.add_argument('--scale', nargs='+', type=int, default=[1],
+                        help='the number of times each bank is replicated, one run for each (default: 1).')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='the number of runs of each benchmark, the fastest one is reported (default: 3).')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='the worker processes of the converters, English always uses one (default: 1).')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='the JSON file the results are written to (default: benchmark.json).')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='the results of an earlier run to check these against, exits with an error if any '
+                             'benchmark regressed.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the fraction by which throughput may drop or memory grow before it is a regression '
+                             '(default: 0.1).')
+    parser.add_argument('--synthetic', nargs='+', type=int, metavar='LENGTH',
+                        help='benchmark synthetic treebanks with sentences of these lengths, see synthetic.py.')
+    parser.add_argument('--synthetic-sentences', type=int, default=500,
+                        help='the number of sentences of each synthetic treebank (default: 500).')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='benchmark-synthetic-') as synthetic_dir:
+        runs = []
+        for language in args.languages:
+            for bank, filepaths in bundled_banks(language).items():
+                if args.banks and bank in args.banks or not args.banks and not args.synthetic:
+                    runs.append((language, bank, filepaths, CORPORA[language][3]))
+            if args.synthetic:
+                banks = synthetic_banks(language, args.synthetic, args.synthetic_sentences, synthetic_dir)
+                runs.extend((language, bank, filepaths, False) for bank, filepaths in banks.items())
+
+        for language, bank, filepaths, converted in runs:
+            for scale in args.scale:
+                result = benchmark(language, bank, filepaths, scale, args.repeat, args.jobs, converted)
+                results.append(result)
+                print(f"{language} {bank} x{scale}: {result['sentences']} sentences, "
+                      f"{result['sentences_per_second']} sentences/s, {result['tokens_per_second']} tokens/s, "
+                      f"peak {result['peak_rss_kb'] / 1024:.0f} MB", file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf8') as f:
+        json.dump({'commit': git_commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(), 'platform': platform.platform(),
+                   'results': results}, f, indent=1)
+
+    if args.compare:
+        with open(args.compare, encoding='utf8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
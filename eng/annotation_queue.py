@@ -0,0 +1,160 @@
+'''
+A queue of the questions english.py has for the annotators, served over HTTP so that the conversion does not wait at a
+terminal for each of them, and so that several annotators can answer at once. Each annotator opens the page of the
+service in a browser, which shows the next question nobody is answering and stores the answer in the decision store:
+
+    python3 english.py --serve 8000
+    (then open http://localhost:8000/ in one or more browsers)
+
+A question is held for the annotator it was shown to, who is told apart by a cookie, for LEASE seconds, after which it is
+shown to the next one if it was not answered. GET /questions lists the questions waiting as JSON.
+'''
+import json
+import time
+import html
+import uuid
+import queue
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds a question shown to an annotator is kept from the others
+LEASE = 600
+
+
+class AnnotationQueue:
+
+    def __init__(self, decisions):
+        '''
+        :param decisions: the DecisionStore the answers are recorded in.
+        '''
+        self.decisions = decisions
+        self.lock = threading.Lock()
+        # key -> Unanswered question, in the order the questions came up
+        self.questions = {}
+        # key -> (annotator, when it was shown to them)
+        self.shown = {}
+        # the keys of the answered questions, for the conversion to go on with their sentences
+        self.answered = queue.Queue()
+
+    def put(self, question):
+        '''
+        queues an Unanswered question.
+        '''
+        with self.lock:
+            self.questions[question.key] = question
+
+    def next(self, annotator):
+        '''
+        the question held for an annotator, or else the oldest question not held for another one. None if there is
+        none.
+        '''
+        now = time.time()
+        with self.lock:
+            free = None
+            for key in self.questions:
+                holder, shown = self.shown.get(key, (None, 0))
+                if now - shown > LEASE:
+                    holder = None
+                if holder == annotator:
+                    free = key
+                    break
+                if holder is None and free is None:
+                    free = key
+            if free is None:
+                return None
+            self.shown[free] = (annotator, now)
+            return self.questions[free]
+
+    def answer(self, key, answer) -> bool:
+        '''
+        records the answer to a queued question.
+        :return: False if the question is not waiting or the answer is not one of its possible responses.
+        '''
+        with self.lock:
+            if key not in self.questions or answer not in self.questions[key].possible_responses:
+                return False
+            question = self.questions.pop(key)
+            self.shown.pop(key, None)
+            with self.decisions.lock:
+                self.decisions.record(key, question.prompt, answer, question.signature)
+                self.decisions.asked += 1
+        self.answered.put(key)
+        return True
+
+    def waiting(self) -> list:
+        with self.lock:
+            return [{'key': key, 'prompt': question.prompt, 'responses': question.possible_responses,
+                     'suggestion': question.suggestion}
+                    for key, question in self.questions.items()]
+
+
+class AnnotationHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        annotation_queue = self.server.annotation_queue
+        if self.path == '/questions':
+            self._send(200, 'application/json', json.dumps(annotation_queue.waiting(), ensure_ascii=False))
+            return
+        if self.path != '/':
+            self._send(404, 'text/plain', 'not found')
+            return
+
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        annotator = cookie['annotator'].value if 'annotator' in cookie else uuid.uuid4().hex
+        question = annotation_queue.next(annotator)
+        if question is None:
+            body = (f'<p>No questions waiting, {len(annotation_queue.waiting())} being answered.</p>'
+                    f'<meta http-equiv="refresh" content="5">')
+        else:
+            buttons = ''.join(f'<button name="answer" value="{html.escape(response)}"'
+                              f'{" autofocus" if response == question.suggestion else ""}>{html.escape(response)}</button> '
+                              for response in question.possible_responses)
+            suggestion = '' if question.suggestion is None else \
+                f'<p>Always answered "{html.escape(question.suggestion)}" for this construction.</p>'
+            key = question.key
+            body = (f'<p>{html.escape(key)}</p><pre>{html.escape(question.prompt)}</pre>{suggestion}'
+                    f'<form method="post" action="/answer"><input type="hidden" name="key" value="{html.escape(key)}">'
+                    f'{buttons}</form>')
+        self._send(200, 'text/html; charset=utf-8', f'<!DOCTYPE html><html><body>{body}</body></html>',
+                   {'Set-Cookie': f'annotator={annotator}; Path=/'})
+
+    def do_POST(self):
+        if self.path != '/answer':
+            self._send(404, 'text/plain', 'not found')
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        fields = parse_qs(self.rfile.read(length).decode('utf8'))
+        key, answer = fields.get('key', [''])[0], fields.get('answer', [''])[0]
+        if not self.server.annotation_queue.answer(key, answer):
+            self._send(400, 'text/plain', f'no question {key} waiting for the answer {answer}')
+            return
+        self.send_response(303)
+        self.send_header('Location', '/')
+        self.end_headers()
+
+    def _send(self, status, content_type, body, headers=None):
+        data = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # the conversion reports on stderr, requests are not logged
+        pass
+
+
+def serve(annotation_queue, host='localhost', port=8000) -> ThreadingHTTPServer:
+    '''
+    starts serving the queue in a background thread.
+    :return: the server, to shut it down once all the questions are answered.
+    '''
+    server = ThreadingHTTPServer((host, port), AnnotationHandler)
+    server.annotation_queue = annotation_queue
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,174 @@
+'''
+A store of the answers the annotator gave to the questions english.py asks, so that reruns of the conversion replay them
+instead of asking again. An answer is kept under the sent_id of the sentence, the id of the head the question is about
+and the type of the question, with a hash of the construction it was given for (the prompt, which shows the sentence, the
+head and its children). When the construction changes, e.g. after an edit to the treebank, the question is asked again.
+The store is a JSON file that is written after every new answer, so that no answer is lost if a session is interrupted.
+
+Answers are also kept with the signature of their construction (the question, the lemma and upos of the head, and the
+lemmas of its auxiliaries and deprels of its children in order), and the store learns from signatures that were always
+given the same answer, at least learn_after times: with learn='suggest' that answer is offered as the default, with
+learn='auto' it is given without asking. Learned answers are stored as such and do not count towards the signatures.
+
+With --serve, answers are recorded by the threads of the web server while the conversion asks for others, so the store
+is only read and written under its lock.
+'''
+import os
+import json
+import hashlib
+import threading
+from collections import Counter, defaultdict
+
+import utils
+
+
+class Unanswered(Exception):
+    '''
+    Raised by DecisionStore.ask() in fail-fast mode for a question that has no stored answer.
+    '''
+
+    def __init__(self, key, prompt, possible_responses, signature=None, suggestion=None):
+        super().__init__(key)
+        self.key = key
+        self.prompt = prompt
+        self.possible_responses = possible_responses
+        self.signature = signature
+        # the answer learned for the signature, if any
+        self.suggestion = suggestion
+
+
+def construction_hash(prompt: str) -> str:
+    return hashlib.blake2b(prompt.encode('utf8'), digest_size=8).hexdigest()
+
+
+class DecisionStore:
+
+    def __init__(self, path='decisions.json', fail_fast=False, learn='off', learn_after=3):
+        '''
+        :param fail_fast: whether to raise Unanswered for questions without a stored answer instead of asking them.
+        :param learn: 'off', 'suggest' or 'auto', what to do with the answer learned for the signature of a question.
+        :param learn_after: the number of times a signature has to be given the same answer for it to be learned.
+        '''
+        if learn not in {'off', 'suggest', 'auto'}:
+            raise ValueError(f'learn should be off, suggest or auto, not {learn}')
+        self.path = path
+        self.fail_fast = fail_fast
+        self.learn = learn
+        self.learn_after = learn_after
+        # reentrant, as ask() records learned answers and record() saves
+        self.lock = threading.RLock()
+        try:
+            with open(path, encoding='utf8') as f:
+                self.decisions = json.load(f)
+        except FileNotFoundError:
+            self.decisions = {}
+        # signature -> how many times each answer was given for it by the annotators
+        self.signatures = defaultdict(Counter)
+        for decision in self.decisions.values():
+            self._count(decision, 1)
+        # (key, prompt) of the questions that were not answered in fail-fast mode
+        self.unanswered = []
+        self.replayed = self.asked = self.learned = self.suggested = 0
+        # the keys answered in this run, which are not counted as replayed when a sentence is converted again
+        self.recorded = set()
+
+    def _count(self, decision, n):
+        if decision.get('signature') and not decision.get('learned'):
+            answers = self.signatures[decision['signature']]
+            answers[decision['answer']] += n
+            if not answers[decision['answer']]:
+                del answers[decision['answer']]
+
+    def learned_answer(self, signature, possible_responses):
+        '''
+        the answer always given for a signature, if it was given at least learn_after times, otherwise None.
+        '''
+        answers = self.signatures.get(signature)
+        if not answers or len(answers) != 1:
+            return None
+        (answer, times), = answers.items()
+        return answer if times >= self.learn_after and answer in possible_responses else None
+
+    def ask(self, sent_id, head_id, question, possible_responses, prompt, signature=None):
+        '''
+        the answer to a question, from the store if it was answered for the same construction, otherwise from the
+        annotator, or the answer learned for its signature.
+        :param question: the type of the question, e.g. 'would'.
+        :param signature: the signature of the construction, a string.
+        '''
+        key = f'{sent_id} {head_id} {question}'
+        construction = construction_hash(prompt)
+        with self.lock:
+            decision = self.decisions.get(key)
+            if decision is not None and decision['construction'] == construction \
+                    and decision['answer'] in possible_responses:
+                self.replayed += key not in self.recorded
+                return decision['answer']
+
+            suggestion = None
+            if signature and self.learn != 'off':
+                suggestion = self.learned_answer(signature, possible_responses)
+            if suggestion is not None and self.learn == 'auto':
+                self.learned += 1
+                self.record(key, prompt, suggestion, signature, learned=True)
+                return suggestion
+
+            if self.fail_fast:
+                self.unanswered.append((key, prompt))
+                raise Unanswered(key, prompt, possible_responses, signature, suggestion)
+
+        # the annotator is asked without holding the lock
+        if suggestion is None:
+            answer = utils.get_response(possible_responses, prompt)
+        else:
+            answer = utils.get_response(possible_responses,
+                                        f'{prompt}\n(always answered "{suggestion}" for this construction, press enter '
+                                        f'to answer it) ', default=suggestion)
+        with self.lock:
+            self.suggested += suggestion is not None and answer == suggestion
+            self.asked += 1
+            self.record(key, prompt, answer, signature)
+        return answer
+
+    def record(self, key, prompt, answer, signature=None, learned=False):
+        '''
+        stores the answer to the question with the given key and prompt, as given by DecisionStore.ask() or Unanswered.
+        :param learned: whether the answer was learned rather than given by an annotator.
+        '''
+        decision = {'construction': construction_hash(prompt), 'answer': answer}
+        if signature:
+            decision['signature'] = signature
+        if learned:
+            decision['learned'] = True
+        with self.lock:
+            if key in self.decisions:
+                self._count(self.decisions[key], -1)
+            self.decisions[key] = decision
+            self.recorded.add(key)
+            self._count(decision, 1)
+            self.save()
+
+    def report(self) -> str:
+        '''
+        how many questions were asked and how many prompts were avoided, by replaying or learning answers.
+        '''
+        total = self.replayed + self.learned + self.asked
+        return (f'{self.replayed} answers replayed, {self.learned} learned from their construction, {self.asked} '
+                f'questions asked ({self.suggested} with the learned answer): {self.replayed + self.learned} of {total} '
+                f'prompts avoided')
+
+    def save(self):
+        '''
+        writes the store to a temporary file of its own, which replaces the store once it is complete.
+        '''
+        # named after the process and thread, so that no other save writes to it
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with self.lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf8') as f:
+                    json.dump(self.decisions, f, indent=1, ensure_ascii=False, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
@@ -1,10 +1,16 @@
 import os
+import sys
+# the modules shared by the languages, see morphosyntax/__init__.py
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import conllu
 from consts import *
 import utils
+from morphosyntax import runtime, instrument
+from morphosyntax.runtime import combine_fixed_nodes, copy_feats, set_leaf_feats
+from morphosyntax.sentence import Node, Sentence
+from decisions import DecisionStore, Unanswered
+from annotation_queue import AnnotationQueue, serve
 from typing import List
-from copy import deepcopy
 from collections import defaultdict
 from eng_relations import case_feat_map, marker_feat_map
 
@@ -17,36 +23,58 @@ NOMINAL = {'NOUN', 'PROPN', 'PRON', 'NUM'}
 
 clausal_rels = {'conj','csubj','xcomp','ccomp','advcl','acl','advcl:relcl','acl:relcl'}
 
+# the answers of the annotator, replayed on reruns. None to always ask.
+decisions = None
 
-def create_abstract_nsubj(head: conllu.Token, auxes: List[conllu.Token]):
+
+# the deprels of the children that make a construction for the questions, the others (objects, obliques, punctuation,
+# etc.) are left out of its signature so that answers generalize
+SIGNATURE_DEPRELS = {'aux', 'aux:pass', 'cop', 'nsubj', 'nsubj:pass', 'expl', 'mark'}
+
+
+def construction_signature(question, head: Node) -> str:
+    '''
+    what the answer to a question about head is learned for: the question, the lemma and upos of head, the lemmas of
+    its auxiliaries and the deprels of its SIGNATURE_DEPRELS children, in order.
+    '''
+    children = [node for node in parse_list.nodes if node.head == head.id]
+    aux_lemmas = [child.lemma for child in children if child.upos in {'AUX', 'PART'}]
+    deprels = [child.deprel for child in children if child.deprel in SIGNATURE_DEPRELS]
+    return '|'.join([question, head.lemma, head.upos, ' '.join(aux_lemmas), ' '.join(deprels)])
+
+
+def ask(question, head: Node, possible_responses, prompt):
+    '''
+    asks the annotator a question about head in the sentence being converted, unless it was answered for the same
+    construction in an earlier run.
+    :param question: the type of the question, one of 'inversion', 'would' and 'could'.
+    '''
+    if decisions is None:
+        return utils.get_response(possible_responses, prompt)
+    return decisions.ask(parse_list.metadata['sent_id'], head.id, question, possible_responses, prompt,
+                         construction_signature(question, head))
+
+
+def create_abstract_nsubj(head: Node, auxes: List[Node]):
     '''
     When the subject is missing but agreement features appear on its head, an abstract node carrying features only is
-    created
+    created. It goes right before its head, as the empty node head.id-1.1 (0.1 when the head is the first word).
     '''
-    abstract_nsubj = conllu.Token()
-    abstract_nsubj['id'] = head['id'] - 0.9
-    abstract_nsubj['form'] = '-'
-    abstract_nsubj['lemma'] = '-'
-    abstract_nsubj['upos'] = '-'
-    abstract_nsubj['xpos'] = '-'
-    abstract_nsubj['deps'] = '-'
-    abstract_nsubj['misc'] = '-'
-    abstract_nsubj['head'] = head['id']
-    abstract_nsubj['deprel'] = 'nsubj'
-    abstract_nsubj['ms feats'] = {}
+    abstract_nsubj = Node(id=(head.id - 1, '.', 1), form='-', lemma='-', upos='-', xpos='-', feats=None,
+                          head=head.id, deprel='nsubj', deps='-', misc='-', ms_feats={})
 
     if auxes:
-        first_aux_id = min([child['id'] for child in auxes])
-        feats_source = [aux for aux in auxes if aux['id'] == first_aux_id][0]
+        first_aux_id = min([child.id for child in auxes])
+        feats_source = [aux for aux in auxes if aux.id == first_aux_id][0]
     else:
         feats_source = head
 
     for attr in ['Number', 'Person', 'Gender']:
-        abstract_nsubj['ms feats'][attr] = feats_source['feats'].get(attr, head['feats'].get(attr, None))
-    abstract_nsubj['ms feats'] = {k:v for k,v in abstract_nsubj['ms feats'].items() if v}
+        abstract_nsubj.ms_feats[attr] = feats_source.feats.get(attr, head.feats.get(attr, None))
+    abstract_nsubj.ms_feats = {k:v for k,v in abstract_nsubj.ms_feats.items() if v}
 
     # in case of some pragmatical omission of subject with no agreement on the predicate - do not create abstract node
-    if not abstract_nsubj['ms feats']:
+    if not abstract_nsubj.ms_feats:
         return None
 
     return abstract_nsubj
@@ -56,7 +84,7 @@ def get_rel_feat(word):
     return marker_feat_map.get(word, case_feat_map.get(word, word))
 
 
-def get_relation_feats(relation_nodes: List[conllu.Token], verb=True, clause=False) -> dict:
+def get_relation_feats(relation_nodes: List[Node], verb=True, clause=False) -> dict:
     '''
     Generating morpho_syntactic features for relations. For nominals, cases are put under the 'Case' feature, and
     conjunctions under 'RelType'. For verbs, all values are under 'RelType'.
@@ -64,62 +92,166 @@ def get_relation_feats(relation_nodes: List[conllu.Token], verb=True, clause=Fal
     '''
     feats = {}
 
-    relation_nodes = deepcopy(relation_nodes)
-    for node in relation_nodes:
-        node['lemma'] = node.get('fixed lemma', node.get('lemma'))
+    # the lemma of a node heading a fixed expression is the whole expression
+    lemma = {node.id: node.fixed_lemma or node.lemma for node in relation_nodes}
 
     if not verb:
         if clause:
             # if it's a noun heading a clause I assume adpositions are defaultly markers
             marker_nodes = [node for node in relation_nodes
-                        if node['deprel'] == 'mark'
-                        or node['lemma'] in marker_feat_map]
+                        if node.deprel == 'mark'
+                        or lemma[node.id] in marker_feat_map]
             case_nodes = [node for node in relation_nodes
-                        if (node['deprel'] == 'case'
-                        or node['lemma'] in case_feat_map)
+                        if (node.deprel == 'case'
+                        or lemma[node.id] in case_feat_map)
                         and node not in marker_nodes]
         else:
             # else, I assume adpositions are defaultly cases
             case_nodes = [node for node in relation_nodes
-                        if node['deprel'] == 'case'
-                        or node['lemma'] in case_feat_map]
+                        if node.deprel == 'case'
+                        or lemma[node.id] in case_feat_map]
             marker_nodes = [node for node in relation_nodes
-                        if (node['deprel'] == 'mark'
-                        or node['lemma'] in marker_feat_map)
+                        if (node.deprel == 'mark'
+                        or lemma[node.id] in marker_feat_map)
                         and node not in case_nodes]
         assert not [node for node in relation_nodes if node not in marker_nodes and node not in case_nodes]
         if marker_nodes:
-            feats['RelType'] = ','.join([marker_feat_map.get(node['lemma'], node['lemma']) for node in marker_nodes])
+            feats['RelType'] = ','.join([marker_feat_map.get(lemma[node.id], lemma[node.id]) for node in marker_nodes])
         if case_nodes:
-            feats['Case'] = ','.join([case_feat_map.get(node['lemma'], node['lemma']) for node in case_nodes])
+            feats['Case'] = ','.join([case_feat_map.get(lemma[node.id], lemma[node.id]) for node in case_nodes])
 
     else:
         marker_nodes = relation_nodes
-        feats['RelType'] = ','.join([get_rel_feat(node['lemma']) for node in marker_nodes])
+        feats['RelType'] = ','.join([get_rel_feat(lemma[node.id]) for node in marker_nodes])
 
     return feats
 
 
-def get_nTAM_feats(aux_nodes: List[conllu.Token], head_feats: dict, verb=True) -> dict:
+def do_aux(feats, nodes, head, children, verb, pending):
+    if not verb:
+        raise ValueError('a noun with "do"?!')
+
+    assert len(nodes) == 1
+    feats['Tense'] = nodes[0].feats['Tense']
+
+
+def be_aux(feats, nodes, head, children, verb, pending):
+    head_feats = head.feats
+    if len(nodes) == 1:
+        if verb:
+            if head_feats['VerbForm'] == 'Ger' or (head_feats['VerbForm'], head_feats['Tense']) == ('Part', 'Pres'):
+                feats['Aspect'] = 'Prog'
+            elif (head_feats['VerbForm'], head_feats['Tense']) == ('Part', 'Past'):
+                feats['Voice'] = 'Pass'
+            else:
+                raise ValueError('untreated be-type aux')
+        higher_be = nodes[0]
+
+    elif len(nodes) == 2:
+        feats['Aspect'] = 'Prog'
+        if verb:
+            feats['Voice'] = 'Pass'
+        higher_be = [node for node in nodes if not node.form.endswith('ing')][0]
+
+    else:
+        raise NotImplementedError('too many be-nodes?')
+
+    if 'Voice' not in feats and verb:
+        feats['Voice'] = 'Act'
+
+    # if there are no auxiliaries left, copy the remaining TAM feats from the "higher" auxiliary
+    if not pending-{'be', 'not'} and feats.get('VerbForm', None) != 'Inf':
+        if 'Tense' in higher_be.feats:
+            feats['Tense'] = higher_be.feats['Tense']
+        if not verb:
+            if 'Mood' not in feats and 'Mood' in higher_be.feats:
+                feats['Mood'] = higher_be.feats['Mood']
+            if 'VerbForm' not in feats and 'VerbForm' in higher_be.feats:
+                feats['VerbForm'] = higher_be.feats['VerbForm']
+
+
+def get_aux(feats, nodes, head, children, verb, pending):
+    get_node = nodes[0]
+    assert 'pass' in get_node.deprel
+    feats['Voice'] = 'Pass'
+
+    if not pending-{'get', 'not'}:
+        feats['Tense'] = get_node.feats.get('Tense')
+        feats['VerbForm'] = get_node.feats.get('VerbForm')
+
+
+def have_aux(feats, nodes, head, children, verb, pending):
+    if not verb or (head.feats['VerbForm'], head.feats['Tense']) == ('Part', 'Past'):
+        feats['Aspect'] += ',Perf'
+    else:
+        raise ValueError('untreated have-type aux')
+
+    # if there are no auxiliaries left, copy the remaining TAM feats from the "higher" auxiliary
+    if not pending-{'have', 'not'} and feats.get('VerbForm', None) != 'Inf':
+        assert len(nodes) == 1
+        feats['Tense'] = nodes[0].feats['Tense']
+
+
+def will_aux(feats, nodes, head, children, verb, pending):
+    feats['Tense'] = 'Fut'
+
+
+def would_aux(feats, nodes, head, children, verb, pending):
+    # Would stands for both conditional and FITP. Let the annotator decide.
+    response = ask('would', head, ['c', 'f'],
+                            f'what does the "would" stand for in this sentence:\n"{parse_list.metadata["text"]}"\nhead:"{head.form}"\nchildren:"{" ".join([child.form for child in children])}"\nc - conditional, f - future in the past')
+    if response == 'c':
+        feats['Mood'] += ',Cnd'
+    else:
+        feats['Tense'] = 'Past'
+        feats['Aspect'] += ',Prosp'
+
+
+# the auxiliaries treated by a handler, in the order they are applied. A handler gets the feats to set, the auxiliaries
+# with its lemma, the head and its children, whether the head is a verb and the lemmas not treated yet.
+AUX_RULES = [
+    ('do', do_aux),
+    ('be', be_aux),
+    ('get', get_aux),
+    ('have', have_aux),
+    ('will', will_aux),
+    ('would', would_aux),
+]
+AUX_DISPATCH = {lemma: (position, handler) for position, (lemma, handler) in enumerate(AUX_RULES)}
+
+# the modality of modal auxiliaries, treated after AUX_RULES
+MODALITY = {
+    'can': 'Pot',
+    'could': 'Pot',
+    'may': 'Prms',
+    'might': 'Prms',
+    'shall': 'Des',
+    'should': 'Des',
+    'must': 'Nec',
+}
+
+
+def get_nTAM_feats(aux_nodes: List[Node], head: Node, children: List[Node], verb=True) -> dict:
     '''
-    generating morpho-syntactic features for a head node based on its own morphological features (head_feats) and its
-    auxiliaries (all concatenated as list in aux_nodes).
+    generating morpho-syntactic features for a head node based on its own morphological features (head.feats) and its
+    auxiliaries (all concatenated as list in aux_nodes). children are all the children of the head, punctuation included,
+    and are used to detect questions and to show the annotator the construction.
     This methods works for both verbal and nominal predicates.
     '''
     feats = defaultdict(str)
 
-    subj_ids = [child['id'] for child in children if child['deprel'] in {'nsubj', 'expl'}]
+    subj_ids = [child.id for child in children if child.deprel in {'nsubj', 'expl'}]
     if subj_ids:
         subj_id = min(subj_ids)
-        first_aux_id = min([child['id'] for child in aux_nodes])
+        first_aux_id = min([child.id for child in aux_nodes])
         if first_aux_id < subj_id:
-            if any([child['form'] == '?' for child in children]):
+            if any([child.form == '?' for child in children]):
                 feats['Mood'] = 'Int'
             else:
                 # subject inversion is most likely a question, but it can also signify conditionality or can be done for
                 # pragmatical reasons. The annotator decides.
-                response = utils.get_response(['q', 'c', 'n'],
-                                        f'Does the word "{head["form"]}" heads a question in the sentence "{parse_tree.metadata["text"]}"\nq - question, c - conditional, n - NOTA')
+                response = ask('inversion', head, ['q', 'c', 'n'],
+                                        f'Does the word "{head.form}" heads a question in the sentence "{parse_list.metadata["text"]}"\nq - question, c - conditional, n - NOTA')
                 if response == 'q':
                     feats['Mood'] = 'Int'
                 elif response == 'c':
@@ -127,350 +259,306 @@ def get_nTAM_feats(aux_nodes: List[conllu.Token], head_feats: dict, verb=True) -
                 elif response == 'n':
                     pass
 
-    aux_lemmas = {aux['lemma'] for aux in aux_nodes}
+    by_lemma = defaultdict(list)
+    for aux in aux_nodes:
+        by_lemma[aux.lemma].append(aux)
+
     if verb:
-        if 'to' in aux_lemmas:
+        if 'to' in by_lemma:
             feats['VerbForm'] = 'Inf'
         else:
             feats['VerbForm'] = 'Fin'
-    aux_lemmas.discard('to')
+    by_lemma.pop('to', None)
 
     # setting the polarity of the main verb, assuming that there is no modality that require internal feature structure.
     # down the line this will be rectified if there are modal auxiliaries.
-    if 'not' in aux_lemmas:
+    if 'not' in by_lemma:
         feats['Polarity'] = 'Neg'
     else:
         feats['Polarity'] = 'Pos'
-    # aux_lemmas.discard('not')
-
-    if 'do' in aux_lemmas:
-        if not verb:
-            raise ValueError('a noun with "do"?!')
-
-        do_node = [aux for aux in aux_nodes if aux['lemma'] == 'do']
-        assert len(do_node) == 1
-        do_node = do_node[0]
-        feats['Tense'] = do_node['feats']['Tense']
-    aux_lemmas.discard('do')
-
-    if 'be' in aux_lemmas:
-        be_nodes = [aux for aux in aux_nodes if aux['lemma'] == 'be']
-
-        if len(be_nodes) == 1:
-            if verb:
-                if head_feats['VerbForm'] == 'Ger' or (head_feats['VerbForm'], head_feats['Tense']) == ('Part', 'Pres'):
-                    feats['Aspect'] = 'Prog'
-                elif (head_feats['VerbForm'], head_feats['Tense']) == ('Part', 'Past'):
-                    feats['Voice'] = 'Pass'
-                else:
-                    raise ValueError('untreated be-type aux')
-            higher_be = be_nodes[0]
-
-        elif len(be_nodes) == 2:
-            feats['Aspect'] = 'Prog'
-            if verb:
-                feats['Voice'] = 'Pass'
-            higher_be = [node for node in be_nodes if not node['form'].endwith('ing')][0]
 
-        else:
-            raise NotImplementedError('too many be-nodes?')
-
-        if 'Voice' not in feats and verb:
-            feats['Voice'] = 'Act'
-
-        # if there are no auxiliaries left, copy the remaining TAM feats from the "higher" auxiliary
-        if not aux_lemmas-{'be', 'not'} and feats.get('VerbForm', None) != 'Inf':
-            if 'Tense' in higher_be['feats']:
-                feats['Tense'] = higher_be['feats']['Tense']
-            if not verb:
-                if 'Mood' not in feats and 'Mood' in higher_be['feats']:
-                    feats['Mood'] = higher_be['feats']['Mood']
-                if 'VerbForm' not in feats and 'VerbForm' in higher_be['feats']:
-                    feats['VerbForm'] = higher_be['feats']['VerbForm']
-    aux_lemmas.discard('be')
-
-    if 'get' in aux_lemmas:
-        get_node = [aux for aux in aux_nodes if aux['lemma'] == 'get'][0]
-        assert 'pass' in get_node['deprel']
-        feats['Voice'] = 'Pass'
-
-        if not aux_lemmas-{'get', 'not'}:
-            feats['Tense'] = get_node['feats'].get('Tense')
-            feats['VerbForm'] = get_node['feats'].get('VerbForm')
-    aux_lemmas.discard('get')
-
-    if 'have' in aux_lemmas:
-        if not verb or (head_feats['VerbForm'], head_feats['Tense']) == ('Part', 'Past'):
-            feats['Aspect'] += ',Perf'
-        else:
-            raise ValueError('untreated have-type aux')
-
-        # if there are no auxiliaries left, copy the remaining TAM feats from the "higher" auxiliary
-        if not aux_lemmas-{'have', 'not'} and feats.get('VerbForm', None) != 'Inf':
-            have_node = [aux for aux in aux_nodes if aux['lemma'] == 'have']
-            assert len(have_node) == 1
-            have_node = have_node[0]
-            feats['Tense'] = have_node['feats']['Tense']
-    aux_lemmas.discard('have')
-
-    if 'will' in aux_lemmas:
-        feats['Tense'] = 'Fut'
-    aux_lemmas.discard('will')
-
-    if 'would' in aux_lemmas:
-        # Would stands for both conditional and FITP. Let the annotator decide.
-        response = utils.get_response(['c', 'f'],
-                                f'what does the "would" stand for in this sentence:\n"{parse_tree.metadata["text"]}"\nhead:"{head["form"]}"\nchildren:"{" ".join([child["form"] for child in children])}"\nc - conditional, f - future in the past')
-        if response == 'c':
-            feats['Mood'] += ',Cnd'
-        else:
-            feats['Tense'] = 'Past'
-            feats['Aspect'] += ',Prosp'
-    aux_lemmas.discard('would')
-
-    # treatment of modality
-    if aux_lemmas&{'can','could','may','shall','should','must'}:
-
-        if 'can' in aux_lemmas:
-            modality = 'Pot'
-        aux_lemmas.discard('can')
-
-        if 'could' in aux_lemmas:
-            modality = 'Pot'
-            response = utils.get_response(['c', 'p'],
-                                    f'what does the "could" stand for in this sentence:\n"{parse_tree.metadata["text"]}"\nhead:"{head["form"]}"\nchildren:"{" ".join([child["form"] for child in children])}"\nc - conditional, p - past')
+    # the lemmas still to be treated, the handlers look at them to know whether theirs is the last auxiliary
+    pending = set(by_lemma)
+    for lemma in sorted(pending & AUX_DISPATCH.keys(), key=lambda lemma: AUX_DISPATCH[lemma][0]):
+        AUX_DISPATCH[lemma][1](feats, by_lemma[lemma], head, children, verb, pending)
+        pending.discard(lemma)
+        if instrument.enabled:
+            instrument.count('tam:' + lemma)
+
+    # treatment of modality, the last modal auxiliary of MODALITY gives it
+    modals = [lemma for lemma in MODALITY if lemma in pending]
+    if modals:
+        modality = MODALITY[modals[-1]]
+        if instrument.enabled:
+            instrument.count('tam:modal:' + modals[-1])
+
+        if 'could' in pending:
+            response = ask('could', head, ['c', 'p'],
+                                    f'what does the "could" stand for in this sentence:\n"{parse_list.metadata["text"]}"\nhead:"{head.form}"\nchildren:"{" ".join([child.form for child in children])}"\nc - conditional, p - past')
             if response == 'c':
                 feats['Mood'] += ',Cnd'
             else:
                 feats['Tense'] = 'Pst'
-        aux_lemmas.discard('could')
-
-        if 'may' in aux_lemmas or 'might' in aux_lemmas:
-            modality = 'Prms'
-        aux_lemmas.discard('may')
-        aux_lemmas.discard('might')
-
-        if 'shall' in aux_lemmas or 'should' in aux_lemmas:
-            modality = 'Des'
-        aux_lemmas.discard('shall')
-        aux_lemmas.discard('should')
+        pending.difference_update(modals)
 
-        if 'must' in aux_lemmas:
-            modality = 'Nec'
-        aux_lemmas.discard('must')
-
-        if 'not' in aux_lemmas:
+        if 'not' in pending:
             modality = f'neg({modality})'
             del feats['Polarity']
-        aux_lemmas.discard('not')
 
         feats['Mood'] += ',' + modality
         feats['Mood'] = feats['Mood'].strip(',')
 
-    else:
-        aux_lemmas.discard('not')
+    pending.discard('not')
 
-    if aux_lemmas:
-        raise ValueError(f'untreated auxiliaries. their lemmas: {aux_lemmas}')
+    if pending:
+        raise ValueError(f'untreated auxiliaries. their lemmas: {pending}')
 
     feats = {k: v.strip(',') for k, v in feats.items() if v}
 
     return feats
 
 
-def copy_feats(ms_feats, morpho_feats, values):
-    '''
-    copies features from morpho_feats to ms_feats only is they do not exist in morpho_feats.
-    '''
-    for value in values:
-        ms_feats[value] = ms_feats.get(value, morpho_feats.get(value, None))
-    return ms_feats
-
-
-def set_nodes(nodes):
-    '''
-    conllu.Token is not hashable so sets consist of ids
-    '''
-    return {node['id'] for node in nodes}
+# the feats determiners give their head, by lemma
+DET_FEATS = {
+    'a': {'Definite': 'Ind'},
+    'the': {'Definite': 'Def'},
+    'another': {'Definite': 'Ind'},
+    'no': {'Definite': 'Ind', 'Polarity': 'Neg'},
+    'this': {'Dem': 'Prox'},
+    'that': {'Dem': 'Dist'},
+}
+# determiners whose lemma is changed once they are treated
+DET_LEMMAS = {'another': 'other'}
+# the lemmas of adverbs marking the degree of an adjective or adverb, the first one found is used
+DEGREE_LEMMAS = {'more': 'Cmp', 'most': 'Sup'}
 
 
-def combine_fixed_nodes(head, fixed_children):
-    '''
-    In cases where several function words are combined to one meaning (e.g., because of, more then) they are tagged with
-     a 'fixed' deprel and are combined to one temporary lemma to look for in the relevant map in 'eng_relations.py'.
-    '''
-    if not fixed_children:
-        return head['lemma']
-
-    l = [head] + fixed_children
-    l.sort(key=lambda node: node['id'])
-    return ' '.join([node['lemma'] for node in l])
-
-
-def apply_grammar(head: conllu.Token, children: List[conllu.Token]):
+def apply_grammar(head: Node, children: List[Node]):
     '''
     The main method combining functional children to create the morpho-syntactic features of head.
     '''
+    all_children = children
 
-    children = [child for child in children if not child['deprel'] in {'parataxis', 'reparandum', 'punct'}]
+    children = [child for child in children if not child.deprel in {'parataxis', 'reparandum', 'punct'}]
 
-    fixed_children = [child for child in children if child['deprel'] == 'fixed']
-    head['fixed lemma'] = combine_fixed_nodes(head, fixed_children)
-    children = [child for child in children if child['deprel'] != 'fixed']
+    fixed_children = [child for child in children if child.deprel == 'fixed']
+    head.fixed_lemma = combine_fixed_nodes(head, fixed_children)
+    children = [child for child in children if child.deprel != 'fixed']
 
     added_nodes = []
 
-    verb = head['upos'] in VERBAL
-    noun = head['upos'] in NOMINAL
+    verb = head.upos in VERBAL
+    noun = head.upos in NOMINAL
 
     if verb:
-        head['ms feats'] = {}
+        head.ms_feats = {}
     else:
-        head['ms feats'] = deepcopy(head['feats'])
+        # feature values are strings, so a shallow copy is enough to write to
+        head.ms_feats = dict(head.feats) if head.feats is not None else None
 
     # if there are auxiliaries "consume" them to change head's feats
-    TAM_nodes = [child for child in children if child['upos'] in {'AUX', 'PART'} and child['lemma'] != "'s"]
+    TAM_nodes = [child for child in children if child.upos in {'AUX', 'PART'} and child.lemma != "'s"]
     if TAM_nodes:
-        head['ms feats'].update(get_nTAM_feats(TAM_nodes, head['feats'], verb=verb))
+        head.ms_feats.update(get_nTAM_feats(TAM_nodes, head, all_children, verb=verb))
 
-        if not head['ms feats'].get('Mood', None): head['ms feats']['Mood'] = 'Ind'
-        if not head['ms feats'].get('Polarity', None): head['ms feats']['Polarity'] = 'Pos'
-        if not head['ms feats'].get('VerbForm', None): head['ms feats']['VerbForm'] = 'Fin'
+        if not head.ms_feats.get('Mood', None): head.ms_feats['Mood'] = 'Ind'
+        if not head.ms_feats.get('Polarity', None): head.ms_feats['Polarity'] = 'Pos'
+        if not head.ms_feats.get('VerbForm', None): head.ms_feats['VerbForm'] = 'Fin'
 
     # if there are cases or conjunctures "consume" them as well
     # the last condition is complicated to exclude infinitive "to" while allowing case "'s"
     relation_nodes = [child for child in children if
-                      (child['deprel'] in {'case', 'mark', 'cc'}
-                      or child['lemma'] in marker_feat_map
-                      or child['lemma'] in case_feat_map)
-                      and (child['upos'] != 'PART' or child['lemma'] == "'s")]
+                      (child.deprel in {'case', 'mark', 'cc'}
+                      or child.lemma in marker_feat_map
+                      or child.lemma in case_feat_map)
+                      and (child.upos != 'PART' or child.lemma == "'s")]
     if relation_nodes:
-        to_update = get_relation_feats(relation_nodes, verb=verb, clause=head['deprel'] in clausal_rels)
-        if to_update and not head['ms feats']:
-            head['ms feats'] = to_update
+        to_update = get_relation_feats(relation_nodes, verb=verb, clause=head.deprel in clausal_rels)
+        if to_update and not head.ms_feats:
+            head.ms_feats = to_update
         else:
-            head['ms feats'].update(to_update)
+            head.ms_feats.update(to_update)
 
     # make sure we did not use the same node twice
-    assert not set_nodes(TAM_nodes) & set_nodes(relation_nodes)
-    children = [node for node in children if node not in relation_nodes + TAM_nodes]
+    assert not set(TAM_nodes) & set(relation_nodes)
+    consumed = set(relation_nodes) | set(TAM_nodes)
+    children = [node for node in children if node not in consumed]
 
     if verb:
         # copy values from the morphological feats if they were not set by now
-        head['ms feats'] = copy_feats(head['ms feats'], head['feats'], ['Mood','Tense','Aspect','Voice','VerbForm','Polarity'])
+        head.ms_feats = copy_feats(head.ms_feats, head.feats, ['Mood','Tense','Aspect','Voice','VerbForm','Polarity'])
 
         # set default values for feats underspecified in UD
-        if not head['ms feats'].get('Voice', None): head['ms feats']['Voice'] = 'Act'
+        if not head.ms_feats.get('Voice', None): head.ms_feats['Voice'] = 'Act'
 
         # not sure it's needed. eng is not pro-drop so there always should be an nsubj.
-        if head['ms feats']['VerbForm'] == 'Fin' and 'nsubj' not in [child['deprel'] for child in children]:
+        if head.ms_feats['VerbForm'] == 'Fin' and 'nsubj' not in [child.deprel for child in children]:
             abstract_nsubj = create_abstract_nsubj(head, TAM_nodes)
             if abstract_nsubj:
                 added_nodes.append(abstract_nsubj)
 
-    elif noun or head['upos'] in {'ADV', 'ADJ'}:
+    elif noun or head.upos in {'ADV', 'ADJ'}:
         # treat determiners
-        det_nodes = [child for child in children if child['deprel'] == 'det']
+        det_nodes = [child for child in children if child.deprel == 'det']
         if det_nodes:
             assert len(det_nodes) == 1
             det_node = det_nodes[0]
             children = [node for node in children if node != det_node]
-            if det_node['lemma'] == 'a':
-                head['ms feats']['Definite'] = 'Ind'
-            elif det_node['lemma'] == 'the':
-                head['ms feats']['Definite'] = 'Def'
-            elif det_node['lemma'] == 'another':
-                head['ms feats']['Definite'] = 'Ind'
-                det_node['lemma'] = 'other'
-            elif det_node['lemma'] == 'no':
-                head['ms feats']['Definite'] = 'Ind'
-                head['ms feats']['Polarity'] = 'Neg'
-            elif det_node['lemma'] == 'this':
-                head['ms feats']['Dem'] = 'Prox'
-            elif det_node['lemma'] == 'that':
-                head['ms feats']['Dem'] = 'Dist'
+            if instrument.enabled:
+                instrument.count('det:' + (det_node.lemma if det_node.lemma in DET_FEATS else 'untreated'))
+            if det_node.lemma in DET_FEATS:
+                head.ms_feats.update(DET_FEATS[det_node.lemma])
+                det_node.lemma = DET_LEMMAS.get(det_node.lemma, det_node.lemma)
             else:
-                print(f'a non treated determiner: "{det_node["lemma"]}"')
+                print(f'a non treated determiner: "{det_node.lemma}"')
                 children = [det_node] + children
 
-        if head['upos'] in {'ADV', 'ADJ'} and children:
-            child_lemmas = [child['lemma'] for child in children]
-            if 'more' in child_lemmas:
-                head['ms feats']['Degree'] = 'Cmp'
-            elif 'most' in child_lemmas:
-                head['ms feats']['Degree'] = 'Sup'
-            children = [node for node in children if node['lemma'] not in {'more', 'most'}]
+        if head.upos in {'ADV', 'ADJ'} and children:
+            child_lemmas = {child.lemma for child in children}
+            for lemma, degree in DEGREE_LEMMAS.items():
+                if lemma in child_lemmas:
+                    head.ms_feats['Degree'] = degree
+                    if instrument.enabled:
+                        instrument.count('degree:' + lemma)
+                    break
+            children = [node for node in children if node.lemma not in DEGREE_LEMMAS]
 
-    if head['ms feats']:
-        head['ms feats'] = {k: v for k, v in head['ms feats'].items() if v}
+    if head.ms_feats:
+        head.ms_feats = {k: v for k, v in head.ms_feats.items() if v}
 
-    for child in children:
-        if child['upos'] in {'ADV', 'ADJ', 'INTJ', 'DET'} | VERBAL | NOMINAL and not child.get('ms feats', None):
-            ms_feats = deepcopy(child['feats'])
-            if ms_feats is None:
-                ms_feats = '|'
-            child['ms feats'] = ms_feats
+    set_leaf_feats(children, {'ADV', 'ADJ', 'INTJ', 'DET'} | VERBAL | NOMINAL)
 
-    del head['fixed lemma']
+    head.fixed_lemma = None
 
     return added_nodes
 
 
-def get_where_to_add(added_nodes, id2idx):
-    res = []
-    for node in added_nodes:
-        idx = int(node['id'])
-        if idx == 0:
-            res.append(-1)
-        else:
-            res.append(id2idx[idx])
-    return res
+def convert_sentence(sentence: Sentence):
+    '''
+    converts one sentence in place, setting the ms_feats of its nodes and adding abstract nodes to sentence.added,
+    they are put in place when the sentence is written. runtime.py verifies that the result is still a tree.
+    '''
+    global parse_list
+    parse_list = sentence
+
+    for head, children in utils.span(parse_list.nodes):
+        head: Node = parse_list.by_id[head]
+        children = [parse_list.by_id[child] for child in children]
+        parse_list.added.extend(apply_grammar(head, children))
+
+    # setting ms-feats for content nodes that were not dealt with earlier, function nodes end up with empty ms-feats
+    set_leaf_feats(parse_list.nodes, {'ADJ', 'INTJ'} | VERBAL | NOMINAL)
+
+
+def include(sentence: Sentence) -> bool:
+    '''
+    whether a sentence is converted, the genres in excluded_genres are left out.
+    '''
+    return sentence.metadata['sent_id'].split('_')[1] not in excluded_genres
+
+
+# the errors of the grammar, the sentences they are raised for are written to 'problematic_sentences.conllu'. Unanswered
+# is added in fail-fast mode
+CAPTURED_ERRORS = (AssertionError, ValueError, NotImplementedError)
+# the questions are asked as the sentences are converted
+INTERACTIVE = True
+GRAMMAR_FILES = ['english.py', 'utils.py', '../morphosyntax/sentence.py', '../morphosyntax/runtime.py']
+# the stages of the grammar timed with --stats
+TIMED_FUNCTIONS = ['utils.span', 'apply_grammar', 'get_nTAM_feats', 'get_relation_feats']
+
+
+def convert_queued(texts, annotation_queue):
+    '''
+    converts sentences without waiting for the annotators: a sentence with a question that has no stored answer is put
+    aside with its question in annotation_queue, and converted again when the question is answered. Yields the output of
+    runtime.convert_text() for each sentence in input order, each one as soon as it and all those before it are
+    converted.
+    '''
+    # position -> output of the converted sentences not yielded yet, and question key -> (position, text) of the
+    # sentences waiting for an answer
+    converted, waiting = {}, {}
+    next_position = 0
+
+    def convert(position, text):
+        try:
+            converted[position] = runtime.convert_text(sys.modules[__name__], text)
+        except Unanswered as question:
+            annotation_queue.put(question)
+            waiting[question.key] = (position, text)
+
+    def ready():
+        nonlocal next_position
+        while next_position in converted:
+            yield converted.pop(next_position)
+            next_position += 1
+
+    # the text, or the record from the parse cache, is kept to convert the sentence again, as the conversion changes it
+    for position, text in enumerate(texts):
+        convert(position, text)
+        yield from ready()
+
+    while waiting:
+        print(f'{len(waiting)} sentences waiting for an answer', file=sys.stderr)
+        key = annotation_queue.answered.get()
+        if key in waiting:
+            convert(*waiting.pop(key))
+            yield from ready()
+
 
 if __name__ == '__main__':
-    filepath = os.path.join(ud_dir, lang, bank, splits[bank]['test'])
-    out_path = os.path.join('UD+', lang, bank, 'test.conllu')
-    with open(filepath, encoding='utf8') as f:
-        parse_trees = list(conllu.parse_tree_incr(f))
-        parse_trees = [sent for sent in parse_trees if sent.metadata['sent_id'].split('_')[1] not in excluded_genres]
-    with open(filepath, encoding='utf8') as f:
-        parse_lists = list(conllu.parse_incr(f))
-        parse_lists = [sent for sent in parse_lists if sent.metadata['sent_id'].split('_')[1] not in excluded_genres]
-
-    assert len(parse_lists) == len(parse_trees)
-    with open(out_path, 'w', encoding='utf8') as outfile:
-        for i in range(len(parse_trees)):
-            parse_tree = parse_trees[i]
-            parse_list: conllu.TokenList = parse_lists[i]
-
-            id2idx = {token['id']:i for i, token in enumerate(parse_list) if isinstance(token['id'], int)}
-            idx2id = [token['id'] if isinstance(token['id'], int) else None for token in parse_list]
-
-            heads = utils.span(parse_tree)
-            assert utils.verify_span(heads)
-            to_add = []
-            for head, children in heads[::-1]:
-                head: conllu.Token = parse_list[id2idx[head]]
-                children = [parse_list[id2idx[child]] for child in children]
-                added_nodes = apply_grammar(head, children)
-                if added_nodes:
-                    added_idxs = get_where_to_add(added_nodes, id2idx)
-                    to_add += list(zip(added_nodes, added_idxs))
-
-            for added_node in to_add[::-1]:
-                node, idx = added_node
-                parse_list.insert(idx + 1, node)
-
-            for node in parse_list:
-                # setting ms-feats for content nodes that were not dealt with earlier
-                if node['upos'] in {'ADJ', 'INTJ'} | VERBAL | NOMINAL and not node.get('ms feats', None):
-                    ms_feats = deepcopy(node['feats'])
-                    if ms_feats is None:
-                        ms_feats = '|'
-                    node['ms feats'] = ms_feats
-                # function nodes end up with empty ms-feats
-                else:
-                    node['ms feats'] = node.get('ms feats', None)
-            assert utils.verify_treeness(parse_list)
-
-            to_write = parse_list.serialize()
-            outfile.write(to_write + '\n')
+    parser = runtime.argument_parser('Adds a morpho-syntactic features column to the GENTLE treebank.')
+    parser.add_argument('--decisions', default='decisions.json',
+                        help='file where the answers to the questions are kept and replayed from (default: '
+                             'decisions.json).')
+    parser.add_argument('--no-decisions', action='store_true', help='ask every question, without storing the answers.')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='do not ask questions that have no stored answer, list them and exit with an error instead.')
+    parser.add_argument('--learn', choices=['off', 'suggest', 'auto'], default='suggest',
+                        help='what to do with the answer always given to the same construction: offer it as the default, '
+                             'give it without asking, or nothing (default: suggest).')
+    parser.add_argument('--learn-after', type=int, default=3,
+                        help='the number of times a construction has to be given the same answer to learn it '
+                             '(default: 3).')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='do not wait for the answers to questions, queue them to be answered through a web page on '
+                             'this port while the other sentences are converted (see annotation_queue.py).')
+    parser.add_argument('--host', default='localhost', help='the address the web page is served on (default: localhost).')
+    args = parser.parse_args()
+
+    if args.serve is not None and args.no_decisions:
+        parser.error('--serve needs the decision store the answers are recorded in')
+    if args.fail_fast and args.no_decisions:
+        # without a store every question would be asked at the terminal
+        parser.error('--fail-fast needs the decision store the answers are replayed from')
+    if not args.no_decisions:
+        # questions are queued instead of asked when serving
+        decisions = DecisionStore(args.decisions, fail_fast=args.fail_fast or args.serve is not None,
+                                  learn=args.learn, learn_after=args.learn_after)
+
+    if args.input:
+        files = runtime.input_files(args, [])
+    else:
+        files = [(os.path.join(ud_dir, lang, bank, splits[bank]['test']), os.path.join('UD+', lang, bank, 'test.conllu'))]
+
+    grammar = sys.modules[__name__]
+    if args.serve is not None:
+        annotation_queue = AnnotationQueue(decisions)
+        server = serve(annotation_queue, args.host, args.serve)
+        print(f'questions are served on http://{args.host}:{args.serve}/', file=sys.stderr)
+        runtime.run(grammar, args, files,
+                    convert=lambda texts: convert_queued(texts, annotation_queue))
+        server.shutdown()
+    else:
+        if args.fail_fast:
+            # the other sentences are still converted to find all their unanswered questions
+            CAPTURED_ERRORS += (Unanswered,)
+        runtime.run(grammar, args, files)
+
+    if decisions is not None:
+        print(decisions.report(), file=sys.stderr)
+        if decisions.unanswered and args.serve is None:
+            out_paths = ', '.join(out_path for _, out_path in files)
+            print(f'{len(decisions.unanswered)} questions have no answer, {out_paths} is incomplete:', file=sys.stderr)
+            for key, prompt in decisions.unanswered:
+                print(f'{key}: {prompt}\n', file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,138 @@
+'''
+Tests of the replay and learning of answers by the decision store, run from the root of the repository with
+
+    python3 -m pytest
+'''
+import json
+import threading
+
+import pytest
+
+import decisions
+from decisions import DecisionStore, Unanswered
+
+
+@pytest.fixture
+def annotator(monkeypatch):
+    '''
+    the answers the annotator will give, in order, and the prompts they were asked.
+    '''
+    answers, prompts = [], []
+
+    def get_response(possible_responses, prompt, default=None):
+        prompts.append(prompt)
+        return answers.pop(0)
+
+    monkeypatch.setattr(decisions.utils, 'get_response', get_response)
+    return answers, prompts
+
+
+def test_answers_are_replayed(tmp_path, annotator):
+    answers, prompts = annotator
+    path = str(tmp_path / 'decisions.json')
+    answers.append('yes')
+    store = DecisionStore(path)
+    assert store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt') == 'yes'
+    assert store.asked == 1
+
+    store = DecisionStore(path)
+    assert store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt') == 'yes'
+    assert (store.asked, store.replayed, len(prompts)) == (0, 1, 1)
+
+
+def test_changed_construction_is_asked_again(tmp_path, annotator):
+    answers, prompts = annotator
+    path = str(tmp_path / 'decisions.json')
+    answers.extend(['yes', 'no'])
+    DecisionStore(path).ask('s1', 3, 'would', ['yes', 'no'], 'prompt')
+
+    store = DecisionStore(path)
+    assert store.ask('s1', 3, 'would', ['yes', 'no'], 'another prompt') == 'no'
+    assert store.asked == 1
+    with open(path, encoding='utf8') as f:
+        assert json.load(f)['s1 3 would']['answer'] == 'no'
+
+
+def test_fail_fast_lists_the_unanswered_questions(tmp_path, annotator):
+    store = DecisionStore(str(tmp_path / 'decisions.json'), fail_fast=True)
+    with pytest.raises(Unanswered) as raised:
+        store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt', 'sig')
+    assert raised.value.key == 's1 3 would'
+    assert store.unanswered == [('s1 3 would', 'prompt')]
+    assert annotator[1] == []
+
+
+def test_answer_is_learned_by_signature(tmp_path, annotator):
+    answers, prompts = annotator
+    path = str(tmp_path / 'decisions.json')
+    answers.extend(['yes', 'yes'])
+    store = DecisionStore(path, learn='auto', learn_after=2)
+    store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt 1', 'sig')
+    store.ask('s2', 3, 'would', ['yes', 'no'], 'prompt 2', 'sig')
+
+    assert store.ask('s3', 3, 'would', ['yes', 'no'], 'prompt 3', 'sig') == 'yes'
+    assert (store.asked, store.learned, len(prompts)) == (2, 1, 2)
+    # learned answers are stored as such and do not count towards the signature
+    store = DecisionStore(path, learn='auto', learn_after=2)
+    assert store.decisions['s3 3 would']['learned']
+    assert store.signatures['sig'] == {'yes': 2}
+
+
+def test_learned_answer_is_only_suggested(tmp_path, annotator):
+    answers, prompts = annotator
+    path = str(tmp_path / 'decisions.json')
+    answers.extend(['yes', 'yes'])
+    store = DecisionStore(path, learn='suggest', learn_after=2)
+    store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt 1', 'sig')
+    store.ask('s2', 3, 'would', ['yes', 'no'], 'prompt 2', 'sig')
+
+    store = DecisionStore(path, fail_fast=True, learn='suggest', learn_after=2)
+    with pytest.raises(Unanswered) as raised:
+        store.ask('s3', 3, 'would', ['yes', 'no'], 'prompt 3', 'sig')
+    assert raised.value.suggestion == 'yes'
+
+
+def test_conflicting_answers_are_not_learned(tmp_path, annotator):
+    answers, prompts = annotator
+    answers.extend(['yes', 'no', 'no'])
+    store = DecisionStore(str(tmp_path / 'decisions.json'), learn='auto', learn_after=2)
+    store.ask('s1', 3, 'would', ['yes', 'no'], 'prompt 1', 'sig')
+    store.ask('s2', 3, 'would', ['yes', 'no'], 'prompt 2', 'sig')
+    store.ask('s3', 3, 'would', ['yes', 'no'], 'prompt 3', 'sig')
+    assert (store.asked, store.learned) == (3, 0)
+
+
+def test_answers_recorded_while_asking(tmp_path):
+    '''
+    answers recorded by the threads of the web server while the conversion asks, as with --serve.
+    '''
+    store = DecisionStore(str(tmp_path / 'decisions.json'), fail_fast=True, learn='auto', learn_after=1)
+    errors = []
+
+    def record(thread):
+        try:
+            for i in range(100):
+                store.record(f's{thread}-{i} 1 would', f'prompt {thread} {i}', 'yes', f'sig{i % 20}')
+        except Exception as error:
+            errors.append(error)
+
+    def ask():
+        try:
+            for i in range(500):
+                try:
+                    store.ask(f'q{i}', 1, 'would', ['yes', 'no'], f'prompt {i}', f'sig{i % 25}')
+                except Unanswered:
+                    pass
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=record, args=(thread,)) for thread in range(3)] + \
+              [threading.Thread(target=ask) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(store.path, encoding='utf8') as f:
+        assert json.load(f) == store.decisions
+    assert list(tmp_path.iterdir()) == [tmp_path / 'decisions.json']
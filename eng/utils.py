@@ -1,28 +1,40 @@
 from typing import List, Union
-from copy import deepcopy
 
 
-def span(parse_tree):
+def span(parse_list):
     '''
-    creates a list of all node ids that have children (i.e. that are heads) along with their children's ids.
-    :return: a list of 2-tuples, each of form (head, list_of_children).
-             [(head_id, [child_id, child_id, ...]), (head_id, [child_id, child_id, ...]), ...]
+    yields all node ids that have children (i.e. that are heads) along with their children's ids, bottom-up, so that
+    each node is yielded as a head before it appears as a child.
+    The head/children table is built in a single pass over the 'head' column.
+    Multiword ranges, empty nodes and tokens without a head are left out, like conllu.TokenList.to_tree() does.
+    :return: a generator of 2-tuples, each of form (head, list_of_children).
+             (head_id, [child_id, child_id, ...]), (head_id, [child_id, child_id, ...]), ...
     '''
-    res = []
-    waiting_list = [parse_tree]
-    while waiting_list:
-        curr = waiting_list[0]
-        if curr.children:
-            res.append([curr.token['id'], [child.token['id'] for child in curr.children]])
-            waiting_list += curr.children
-        waiting_list = waiting_list[1:]
-    return res
+    tree = {}
+    for token in parse_list:
+        if isinstance(token.id, int) and token.head is not None and token.head >= 0:
+            tree.setdefault(token.head, []).append(token.id)
+
+    roots = tree.get(0, [])
+    if not roots:
+        raise ValueError("Found no head node, can't build tree")
+    # several roots hang from an artificial node 0, as in conllu.TokenList.to_tree()
+    root = roots[0] if len(roots) == 1 else 0
+
+    # breadth-first order of the tree, the list grows while it is being read
+    order = [root]
+    for node in order:
+        order.extend(tree.get(node, []))
+    for node in reversed(order):
+        if node in tree:
+            yield node, tree[node]
 
 
 def verify_span(heads: List[List[Union[List[int], int]]]):
     '''
     verifies that for a given list of heads and children, all heads appear in ascending id order
-    :param heads: output of utils.span()
+    (a top-down order, e.g. the reversed output of utils.span(); not needed when converting)
+    :param heads: list of (head, list_of_children) pairs
     :return: bool
     '''
     first_head = {}
@@ -36,27 +48,10 @@ def verify_span(heads: List[List[Union[List[int], int]]]):
             return False
     return True
 
-def verify_treeness(parse_list):
-    '''
-    After assignment of ms_feats, making sure that the content nodes still make a tree.
-    '''
-    parse_list = deepcopy(parse_list)
-    new_list = []
-    new_ids = {0}
-    for node in parse_list:
-        node['feats'] = node['ms feats']
-        if node['feats']:
-            new_list.append(node)
-            new_ids.add(node['id'])
-    for node in new_list:
-        if node['head'] not in new_ids:
-            return False
-    return True
-
-
-def get_response(possible_responses, prompt):
+def get_response(possible_responses, prompt, default=None):
     '''
     When one construction may serve several features, let the annotator decide which it is.
+    :param default: the response given by an empty answer, if any.
     '''
     response = None
     while response not in possible_responses:
@@ -64,4 +59,6 @@ def get_response(possible_responses, prompt):
             print(f'invalid response. options are {possible_responses}.')
         print('##### USER INPUT NEEDED #####')
         response = input(prompt)
+        if not response and default is not None:
+            response = default
     return response
@@ -0,0 +1,7 @@
+'''
+The modules shared by the grammars of all languages: the conversion runtime (runtime.py), the sentence representation
+(sentence.py), the parse and result caches (parse_cache.py, result_cache.py) and the instrumentation (instrument.py).
+The scripts of each language directory put the root of the repository on sys.path to import them, e.g.
+
+    from morphosyntax import runtime
+'''
@@ -0,0 +1,211 @@
+'''
+Instrumentation of the conversion: wall and CPU time per stage, counters of the branches of the grammar that fired and
+the peak memory of the processes, collected when runtime.py is run with --stats, --progress or --profile.
+
+Nothing is measured unless enable() is called. The stages are timed by replacing the functions they are made of by
+timed wrappers in their modules, so that a run without instrumentation calls the functions themselves, and grammars
+only count their branches behind a check of the enabled flag:
+
+    if instrument.enabled:
+        instrument.count('det:' + det_node.lemma)
+
+The time of a stage includes that of the stages it calls, e.g. apply_grammar includes get_nTAM_feats. A worker process
+collects its own timers and counters, which take() hands back with each chunk it converts, to be merged into the ones
+of the main process. The hits and misses of the functools caches given to watch_cache() are collected the same way.
+'''
+import time
+import inspect
+from collections import Counter, defaultdict
+
+try:
+    import resource
+except ImportError:
+    # peak memory is not reported where there is no resource module, e.g. on Windows
+    resource = None
+
+# whether the instrumentation is on, the grammars check it before counting
+enabled = False
+# stage -> [wall seconds, CPU seconds, calls]
+timers = defaultdict(lambda: [0.0, 0.0, 0])
+counters = Counter()
+# the peak resident memory of the worker processes in KB, as given by merge()
+workers_peak_rss = 0
+# name -> a function with a functools cache whose hits and misses are reported
+caches = {}
+# name -> the hits and misses of a cache in this process that were already handed over by take_caches()
+taken_caches = defaultdict(lambda: [0, 0])
+# name -> the hits, misses and largest size of a cache, added up from take_caches() in all the processes
+cache_counts = defaultdict(lambda: {'hits': 0, 'misses': 0, 'size': 0})
+
+
+def timed(stage, function):
+    '''
+    a wrapper of function adding the time of each call to the timer of stage. For a generator function, the time spent
+    producing each item is added, not the time spent by the caller between items.
+    '''
+    def timed_function(*args, **kwargs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer = timers[stage]
+            timer[0] += time.perf_counter() - wall
+            timer[1] += time.process_time() - cpu
+            timer[2] += 1
+
+    def timed_generator(*args, **kwargs):
+        yield from timed_iter(stage, function(*args, **kwargs))
+
+    timed_function.__wrapped__ = timed_generator.__wrapped__ = function
+    return timed_generator if inspect.isgeneratorfunction(function) else timed_function
+
+
+def timed_iter(stage, items):
+    '''
+    yields the items of an iterable, adding the time it takes to get each of them to the timer of stage.
+    '''
+    items = iter(items)
+    while True:
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        finally:
+            # looked up each time, as take() resets the timers
+            timer = timers[stage]
+            timer[0] += time.perf_counter() - wall
+            timer[1] += time.process_time() - cpu
+        timer[2] += 1
+        yield item
+
+
+def wrap(module, stages: dict):
+    '''
+    replaces functions of a module by timed wrappers, so that the calls made through the module are timed.
+    :param stages: the name of each function to time -> the name of its stage.
+    '''
+    for name, stage in stages.items():
+        function = getattr(module, name)
+        if not hasattr(function, '__wrapped__'):
+            setattr(module, name, timed(stage, function))
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def watch_cache(name, function):
+    caches[name] = function
+
+
+def take_caches() -> dict:
+    '''
+    the hits and misses of the watched caches in this process since the last call, and their sizes.
+    '''
+    stats = {}
+    for name, function in caches.items():
+        info = function.cache_info()
+        taken = taken_caches[name]
+        stats[name] = {'hits': info.hits - taken[0], 'misses': info.misses - taken[1], 'size': info.currsize}
+        taken[:] = info.hits, info.misses
+    return stats
+
+
+def add_caches(stats: dict):
+    for name, info in stats.items():
+        counts = cache_counts[name]
+        counts['hits'] += info['hits']
+        counts['misses'] += info['misses']
+        counts['size'] = max(counts['size'], info['size'])
+
+
+def cache_report() -> dict:
+    '''
+    the hits, misses and largest size of each watched cache in all the processes, as a dict that can be written as JSON.
+    '''
+    add_caches(take_caches())
+    return {name: dict(counts) for name, counts in cache_counts.items()}
+
+
+def peak_rss() -> int:
+    '''
+    the peak resident memory of this process so far in KB, or 0 if it is not known.
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def take() -> dict:
+    '''
+    the timers, counters, cache hits and peak memory of this process since the last call, the timers and counters are
+    reset.
+    '''
+    stats = {'timers': dict(timers), 'counters': dict(counters), 'caches': take_caches(), 'peak_rss': peak_rss()}
+    timers.clear()
+    counters.clear()
+    return stats
+
+
+def merge(stats: dict):
+    '''
+    adds the timers and counters of take() in a worker process to the ones of this process.
+    '''
+    global workers_peak_rss
+    workers_peak_rss = max(workers_peak_rss, stats['peak_rss'])
+    for stage, (wall, cpu, calls) in stats['timers'].items():
+        timer = timers[stage]
+        timer[0] += wall
+        timer[1] += cpu
+        timer[2] += calls
+    counters.update(stats['counters'])
+    add_caches(stats['caches'])
+
+
+def stage_report() -> dict:
+    '''
+    the timers as a dict that can be written as JSON, the stages with the longest wall time first.
+    '''
+    return {stage: {'wall': round(wall, 6), 'cpu': round(cpu, 6), 'calls': calls}
+            for stage, (wall, cpu, calls) in sorted(timers.items(), key=lambda item: -item[1][0])}
+
+
+class Progress:
+    '''
+    a progress line on stderr with the number of sentences converted, the rate and the estimated time left, rewritten
+    at most every interval seconds.
+    '''
+
+    def __init__(self, total, file, interval=0.5):
+        '''
+        :param total: the number of sentences expected, 0 if it is not known.
+        '''
+        self.total = total
+        self.file = file
+        self.interval = interval
+        self.done = 0
+        self.start = self.shown = time.perf_counter()
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self.shown >= self.interval:
+            self.shown = now
+            self.show(now)
+
+    def show(self, now=None, end=''):
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f'{self.done} sentences, {rate:.0f}/s'
+        if self.total:
+            left = max(self.total - self.done, 0)
+            line = f'{self.done}/{self.total} sentences, {rate:.0f}/s, ETA {left / rate if rate else 0:.0f}s'
+        self.file.write(f'\r{line}\033[K{end}')
+        self.file.flush()
+
+    def close(self):
+        self.show(end='\n')
@@ -0,0 +1,202 @@
+'''
+An on-disk cache of parsed treebank files, so that reruns of the converter do not parse the same unchanged files again.
+A file is cached as the pickled records of its sentences (see sentence.to_record()), which are turned back into
+sentences without reading any CoNLL-U text. Records also keep the digest of the text of their sentence, which is what
+the result cache is keyed by.
+
+Records are streamed both ways, so that a cached file takes no more memory than reading it from text: a file is parsed
+and written to the cache one sentence at a time, as the converter reads it, and a cached file is a sequence of pickled
+chunks of CHUNK_SIZE records, which are read back one chunk at a time.
+
+Entries are looked up by the absolute path of the file and are valid while its size and modification time are the ones
+recorded and they were written by the current version of sentence.py. When the size or modification time differ, the
+content of the file is hashed: if it is unchanged (the file was only touched) the entry is kept, otherwise the file is
+parsed again. When the cache grows past max_bytes, the least recently used entries are removed.
+'''
+import os
+import io
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+from itertools import islice
+
+import conllu
+
+from . import sentence
+from .sentence import from_text, from_record, to_record, text_digest
+
+# cached files are only valid for the reader that produced them
+READER_VERSION = hashlib.blake2b(open(sentence.__file__, 'rb').read(), digest_size=8).hexdigest()
+# the number of records pickled together in a cached file
+CHUNK_SIZE = 256
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(path) -> str:
+    '''
+    the content_hash() of a file, read in blocks.
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class HashingReader(io.RawIOBase):
+    '''
+    a binary file that hashes what is read from it, to hash a file while it is parsed.
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.blake2b(digest_size=16)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.file.readinto(buffer)
+        self.hash.update(memoryview(buffer)[:n])
+        return n
+
+
+class ParseCache:
+
+    def __init__(self, directory='.parse_cache', max_bytes=512 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path, encoding='utf8') as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+        self.hits = self.misses = 0
+
+    def records(self, filepath):
+        '''
+        yields the records of the sentences of a CoNLL-U file, from the cache if it is there and up to date, otherwise
+        from the file, and the file is cached as they are read.
+        '''
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        # entries of another version of sentence.py are stale whatever the file
+        if entry is not None and (entry.get('reader') != READER_VERSION or not entry['key'].endswith(READER_VERSION)):
+            entry = None
+        if entry is not None and (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+            if file_hash(path) + READER_VERSION != entry['key']:
+                entry = None
+
+        read = 0
+        if entry is not None:
+            self.hits += 1
+            entry.update(size=stat.st_size, mtime=stat.st_mtime_ns, used=time.time())
+            self._save_index()
+            try:
+                for record in self._read(entry['key']):
+                    yield record
+                    read += 1
+                return
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                # the cached file is missing or damaged, the rest of the records are read from the file
+                self.hits -= 1
+                self._drop(path)
+
+        self.misses += 1
+        yield from islice(self._parse(path, stat), read, None)
+
+    def sentences(self, filepath):
+        '''
+        yields the sentences of a CoNLL-U file, like sentence.read_sentences().
+        '''
+        for record in self.records(filepath):
+            yield from_record(record)
+
+    def _cache_path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def _read(self, key):
+        '''
+        yields the records of a cached file one chunk at a time.
+        '''
+        with open(self._cache_path(key), 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    if f.tell() != os.fstat(f.fileno()).st_size:
+                        raise
+                    return
+                yield from chunk
+
+    def _parse(self, path, stat):
+        '''
+        yields the records of a file as it is parsed, writing them to the cache in chunks. The file is hashed as it is
+        read, and the entry is only added once all its records were read.
+        '''
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with open(path, 'rb') as raw, os.fdopen(fd, 'wb') as out:
+                reader = HashingReader(raw)
+                text = io.TextIOWrapper(io.BufferedReader(reader), encoding='utf8', newline=None)
+                chunk = []
+                for sentence_text in conllu.parse_sentences(text):
+                    record = to_record(from_text(sentence_text), text_digest(sentence_text))
+                    chunk.append(record)
+                    if len(chunk) == CHUNK_SIZE:
+                        pickle.dump(chunk, out, protocol=pickle.HIGHEST_PROTOCOL)
+                        chunk = []
+                    yield record
+                if chunk:
+                    pickle.dump(chunk, out, protocol=pickle.HIGHEST_PROTOCOL)
+            key = reader.hash.hexdigest() + READER_VERSION
+            os.replace(tmp_path, self._cache_path(key))
+        finally:
+            # the records were not all read, or reading failed
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if path in self.index and self.index[path]['key'] != key:
+            self._drop(path)
+        self.index[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'key': key, 'reader': READER_VERSION,
+                            'bytes': os.path.getsize(self._cache_path(key)), 'used': time.time()}
+        self._evict()
+        self._save_index()
+
+    def _evict(self):
+        '''
+        removes the least recently used entries until the cached files fit in max_bytes, always keeping the newest one.
+        '''
+        total = sum({entry['key']: entry['bytes'] for entry in self.index.values()}.values())
+        for path, entry in sorted(self.index.items(), key=lambda item: item[1]['used'])[:-1]:
+            if total <= self.max_bytes:
+                break
+            if self._drop(path):
+                total -= entry['bytes']
+
+    def _drop(self, path) -> bool:
+        '''
+        removes the entry of a path, and its cached file unless another path with the same content shares it.
+        :return: whether the cached file was removed.
+        '''
+        key = self.index.pop(path)['key']
+        if any(other['key'] == key for other in self.index.values()):
+            return False
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
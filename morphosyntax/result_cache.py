@@ -0,0 +1,142 @@
+'''
+A cache of conversion results per sentence, so that reruns only convert the sentences whose result may have changed.
+A result is stored under the digest of the text of its sentence, in a file for the fingerprint of the code it was
+produced with. Editing the code gives a new fingerprint and therefore a fresh set of results, while the results for the
+last few fingerprints are kept so that undoing an edit does not mean converting everything again.
+
+The results of a fingerprint are kept in an sqlite database keyed by the digests, so that a run only reads the results
+of the sentences it converts, one at a time, and adds its new ones without rewriting the others. New results are only
+committed by save(), at the end of a run.
+
+The relation maps are not part of the fingerprint, as an edit to them usually changes one or two lemmas. The cache keeps
+a snapshot of the maps its results were produced with, and an index from lemmas to the sentences they are relation
+words in. When the maps differ from the snapshot, only the results of the sentences with a changed lemma are dropped.
+'''
+import os
+import pickle
+import sqlite3
+import hashlib
+
+from .sentence import text_digest
+
+
+def fingerprint(paths) -> str:
+    '''
+    a hash of the content of the given files.
+    '''
+    h = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def diff_maps(old: dict, new: dict) -> set:
+    '''
+    the words of the keys whose value differs between two snapshots of the relation maps, e.g. 'på', 'grund' and 'av'
+    for a change to 'på grund av'. A map that is in only one of the snapshots counts as changed in all its keys.
+    '''
+    words = set()
+    for name in old.keys() | new.keys():
+        old_map, new_map = old.get(name, {}), new.get(name, {})
+        for key in old_map.keys() | new_map.keys():
+            if old_map.get(key) != new_map.get(key):
+                words.add(key)
+                words.update(key.split())
+    return words
+
+
+def sentence_key(item) -> bytes:
+    '''
+    the key of a sentence given as raw text or as a record from the parse cache, which keeps the digest of its text.
+    '''
+    return text_digest(item) if isinstance(item, str) else item[-1]
+
+
+class ResultCache:
+
+    def __init__(self, fingerprint, directory='.result_cache', keep=4):
+        self.directory = directory
+        self.path = os.path.join(directory, fingerprint + '.sqlite')
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self.db = self._connect()
+        except sqlite3.DatabaseError:
+            # a damaged file is started again
+            os.remove(self.path)
+            self.db = self._connect()
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'maps'").fetchone()
+        # the relation maps the results were produced with
+        self.maps = pickle.loads(row[0]) if row else {}
+        self.hits = self.misses = 0
+        self.changed = False
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        # results are appended in the order of the rows, only the index of the keys is written in random order, and a
+        # page cache of 16 MB keeps most of it in memory
+        db.executescript('''
+            PRAGMA cache_size = -16384;
+            CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, result BLOB);
+            -- lemma -> keys of the sentences it is a relation word in
+            CREATE TABLE IF NOT EXISTS lemmas (lemma TEXT, key BLOB, PRIMARY KEY (lemma, key)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB);
+        ''')
+        return db
+
+    def get(self, key):
+        row = self.db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, result, lemmas=()):
+        '''
+        :param lemmas: the relation words of the sentence, its result is dropped when the maps change for one of them.
+        '''
+        self.db.execute('INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)',
+                        (key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.db.executemany('INSERT OR IGNORE INTO lemmas VALUES (?, ?)', [(lemma, key) for lemma in lemmas])
+        self.changed = True
+
+    def update_maps(self, maps: dict) -> int:
+        '''
+        drops the results of the sentences with a relation word whose entry differs between the given maps and those
+        the results were produced with.
+        :param maps: the relation maps by name, they are copied as the new snapshot.
+        :return: the number of results dropped.
+        '''
+        dropped = 0
+        if maps != self.maps:
+            if self.maps:
+                for word in diff_maps(self.maps, maps):
+                    dropped += self.db.execute('DELETE FROM results WHERE key IN '
+                                               '(SELECT key FROM lemmas WHERE lemma = ?)', (word,)).rowcount
+                    self.db.execute('DELETE FROM lemmas WHERE lemma = ?', (word,))
+            else:
+                # results without a snapshot cannot be checked
+                dropped = self.db.execute('DELETE FROM results').rowcount
+                self.db.execute('DELETE FROM lemmas')
+            self.maps = {name: dict(relation_map) for name, relation_map in maps.items()}
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('maps', ?)",
+                            (pickle.dumps(self.maps, protocol=pickle.HIGHEST_PROTOCOL),))
+            self.changed = True
+        return dropped
+
+    def save(self):
+        '''
+        commits the new results, and removes the files of all but the last few fingerprints used.
+        '''
+        if self.changed:
+            self.db.commit()
+            self.changed = False
+        self.db.close()
+        # marks the file as the most recently used one
+        os.utime(self.path)
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(('.sqlite', '.pickle'))]
+        for path in sorted(paths, key=os.path.getmtime)[:-self.keep]:
+            os.remove(path)
@@ -0,0 +1,467 @@
+'''
+The conversion runtime shared by the grammars of all languages. It reads the treebanks, converts their sentences with the
+grammar of a language, verifies that the converted sentences are still trees, captures the sentences the grammar fails
+on and writes the UD+ files and 'problematic_sentences.conllu'. Parsed treebanks are cached by parse_cache.py, results
+by result_cache.py, and sentences are converted by several processes with --jobs.
+
+A grammar is a module, e.g. swedish.py, with
+    convert_sentence(sentence)  sets the ms_feats of the nodes of a sentence and adds its abstract nodes to
+                                sentence.added. Returns None, or a string describing why the grammar failed.
+and, if needed,
+    report_sentence(sentence, error)
+                                what the conversion of a sentence did, as a dict that can be written as JSON. Only
+                                called with --report or --verbose, so a run without them spends nothing on reports.
+    format_report(record)       a report as text, for --verbose.
+    TIMED_FUNCTIONS             the names of the functions of the grammar that are timed as stages with --stats, or
+                                module.function for those of the modules it imports.
+    CACHES                      the functions of the grammar with a functools cache by name, whose hits and misses are
+                                written with --stats.
+    include(sentence)           whether a sentence is converted at all, e.g. to leave out some genres.
+    CAPTURED_ERRORS             exceptions that make a sentence problematic rather than stopping the run.
+    INTERACTIVE                 True if the grammar asks the annotator questions. Its sentences are then converted one at
+                                a time in this process and results are not cached.
+    GRAMMAR_FILES               the files the output depends on, relative to the grammar, for the result cache,
+                                including the shared ones it uses, e.g. '../morphosyntax/runtime.py'.
+    RELATION_MAPS               the relation maps by name, and the deprels of the words they are looked up for, so that
+    RELATION_DEPRELS            the result cache only converts again the sentences an edit to the maps affects.
+
+A language gets its converter by writing a grammar and running it with, e.g. for the Hebrew banks in consts.py,
+
+    from consts import ud_dir, banks, splits
+
+    if __name__ == '__main__':
+        args = runtime.argument_parser('Adds a morpho-syntactic features column to the Hebrew treebanks.').parse_args()
+        runtime.run(sys.modules[__name__], args, runtime.treebank_files(ud_dir, banks, splits, 'heb'))
+
+With --stats, the time spent in each stage of the conversion, the counters of the grammar and the peak memory of each
+file are written to a JSON file (see instrument.py), --progress shows the progress of the run, and --profile runs
+cProfile and tracemalloc over the files of one bank.
+
+The runtime knows nothing of the languages: the treebanks of a language are given to it from its consts.py, and the
+grammar brings its own utils.py.
+'''
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import argparse
+import importlib
+import tracemalloc
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+import conllu
+
+from . import instrument
+from .sentence import Writer, from_text, from_record, to_text
+from .parse_cache import ParseCache
+from .result_cache import ResultCache, fingerprint, sentence_key
+
+# the deprels of the words the relation maps are looked up for, for grammars that do not give theirs
+RELATION_DEPRELS = {'case', 'mark', 'cc', 'fixed'}
+
+
+def combine_fixed_nodes(head, fixed_children):
+    '''
+    In cases where several function words are combined to one meaning (e.g., because of, more then) they are tagged with
+    a 'fixed' deprel and are combined to one temporary lemma to look for in the relation maps of the language.
+    '''
+    if not fixed_children:
+        return head.lemma
+
+    l = [head] + fixed_children
+    l.sort(key=lambda node: node.id)
+    return ' '.join([node.lemma for node in l])
+
+
+def copy_feats(ms_feats, morpho_feats, values):
+    '''
+    copies features from morpho_feats to ms_feats only is they do not exist in morpho_feats.
+    '''
+    morpho_feats = {} if morpho_feats is None else morpho_feats
+    for value in values:
+        ms_feats[value] = ms_feats.get(value, morpho_feats.get(value, None))
+    return ms_feats
+
+
+def set_leaf_feats(nodes, upos):
+    '''
+    gives the nodes with one of the upos that have no ms_feats yet their morphological feats as ms_feats. The feats are
+    shared and not copied, the ms feats of a node are never written to once it is a child. A pipe is set for nodes
+    without any feats, to make sure that they are not taken for function nodes.
+    '''
+    for node in nodes:
+        if node.upos in upos and not node.ms_feats:
+            ms_feats = node.feats
+            if ms_feats is None:
+                ms_feats = '|'
+            node.ms_feats = ms_feats
+
+
+def treebank_files(ud_dir, banks, splits, lang=None):
+    '''
+    the (input, output) paths of the splits of the banks of a language, or of all of them. The output goes in the same
+    structure as the input, with 'UD+' as the parent directory rather than 'UD'.
+    :param ud_dir, banks, splits: the treebanks, as given by the 'consts.py' of the language.
+    '''
+    return [(os.path.join(ud_dir, bank_lang, bank, split), os.path.join(ud_dir + '+', bank_lang, bank, split))
+            for bank_lang, all_banks in banks.items() if lang is None or bank_lang == lang
+            for bank in all_banks
+            for split in [s for s in splits[bank].values() if s]]
+
+
+def read_texts(filepath):
+    '''
+    yields the raw text of the sentences of a treebank file one at a time, so that only the sentences
+    being converted are kept in memory.
+    '''
+    with open(filepath, encoding='utf8') as f:
+        yield from conllu.parse_sentences(f)
+
+
+def verify_treeness(nodes):
+    '''
+    After assignment of ms_feats, making sure that the content nodes still make a tree.
+    '''
+    new_ids = {0} | {node.id for node in nodes if node.ms_feats}
+    for node in nodes:
+        if node.ms_feats and node.head is not None and node.head not in new_ids:
+            return False
+    return True
+
+
+def find_missing_head(nodes):
+    '''
+    the nodes with ms feats whose head has none, as 'id->head' separated by pipes.
+    '''
+    new_ids = {0} | {node.id for node in nodes if node.ms_feats}
+    return '|'.join(f'{node.id}->{node.head}' for node in nodes if node.ms_feats and node.head not in new_ids)
+
+
+def format_problematic(error, text):
+    '''
+    returns a sentence the grammar failed on in its original form, preceded by the type of the error.
+    :param text: the sentence as it was read, as raw text or as a record from the parse cache. The converted sentence
+                 is not used, as the grammar may have changed its nodes or added abstract ones before it failed.
+    '''
+    original = text + '\n\n' if isinstance(text, str) else to_text(from_record(text), ms_feats=False)
+    return f'# error_type = {error}\n' + original + '\n'
+
+
+def convert_sentence(grammar, sentence, report=False):
+    '''
+    converts one sentence in place with a grammar and checks that its nodes with ms feats still make a tree.
+    :param report: whether to get the report of the grammar on the sentence.
+    :return: a 2-tuple (error, record). error is None if the sentence was converted, otherwise a string describing why
+             it was not. record is the report, or None.
+    '''
+    record = None
+    try:
+        error = grammar.convert_sentence(sentence)
+        if not error:
+            nodes = sentence.nodes + sentence.added if sentence.added else sentence.nodes
+            if not verify_treeness(nodes):
+                error = f'VER_{find_missing_head(nodes)}'
+        if report and hasattr(grammar, 'report_sentence'):
+            record = grammar.report_sentence(sentence, error)
+    except getattr(grammar, 'CAPTURED_ERRORS', ()) as exception:
+        error = f'EXC_{type(exception).__name__}_{exception}'.replace('\n', ' ')
+    return error, record
+
+
+def convert_text(grammar, text, report=False):
+    '''
+    parses and converts one sentence, given as raw text or as a record from the parse cache.
+    :param report: whether to get the report of the grammar on the sentence.
+    :return: a 3-tuple (error, output, record). error is None if the sentence was converted, in which case output is
+             the UD+ sentence, otherwise output is the entry for 'problematic_sentences.conllu'. record is the report of
+             the grammar, or None, it is returned with the sentence so that reports are written in input order when
+             sentences are converted in parallel. Sentences the grammar does not include give empty outputs.
+    '''
+    sentence = from_text(text) if isinstance(text, str) else from_record(text)
+    if hasattr(grammar, 'include') and not grammar.include(sentence):
+        return None, '', None
+    if instrument.enabled:
+        instrument.count('tokens', len(sentence.nodes))
+    error, record = convert_sentence(grammar, sentence, report)
+    if error:
+        return error, format_problematic(error, text), record
+    return None, to_text(sentence) + '\n', record
+
+
+def convert_chunk(grammar_name, texts, report=False):
+    '''
+    converts a list of raw sentences, this is the unit of work sent to the worker processes. The grammar is given by
+    the name of its module, which is already imported in the workers.
+    :return: a 2-tuple (outputs, stats), the output of convert_text() for each sentence, and the timers and counters of
+             the worker since its last chunk if the instrumentation is on, otherwise None.
+    '''
+    grammar = importlib.import_module(grammar_name)
+    outputs = [convert_text(grammar, text, report) for text in texts]
+    return outputs, instrument.take() if instrument.enabled else None
+
+
+def convert_sentences(grammar, texts, pool=None, jobs=1, chunksize=64, report=False):
+    '''
+    converts a stream of raw sentences, yielding the output of convert_text() for each of them in input order.
+    With a multiprocessing pool of the given number of jobs, chunks of sentences are converted in the worker processes.
+    Only a few chunks per worker are sent ahead of the one being written, so memory stays bounded for large files.
+    '''
+    texts = iter(texts)
+    chunks = iter(lambda: list(islice(texts, chunksize)), [])
+    if pool is None:
+        for chunk in chunks:
+            yield from (convert_text(grammar, text, report) for text in chunk)
+        return
+
+    def outputs(result):
+        outputs, stats = result.get()
+        if stats is not None:
+            instrument.merge(stats)
+        return outputs
+
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(convert_chunk, (grammar.__name__, chunk, report)))
+        if len(pending) > 4 * jobs:
+            yield from outputs(pending.popleft())
+    while pending:
+        yield from outputs(pending.popleft())
+
+
+def relation_lemmas(grammar, text):
+    '''
+    the lemmas of a sentence, given as raw text or as a record from the parse cache, that the relation maps may apply to.
+    '''
+    if isinstance(text, str):
+        rows = [line.split('\t') for line in text.split('\n') if line and line[0] != '#']
+    else:
+        rows = text[2]
+    deprels = getattr(grammar, 'RELATION_DEPRELS', RELATION_DEPRELS)
+    return {row[2] for row in rows if row[7] in deprels}
+
+
+def convert_cached(grammar, texts, results, pool=None, jobs=1, chunksize=64):
+    '''
+    like convert_sentences(), but the results of sentences found in the result cache are used instead of converting
+    them again, and the results of the others are added to it. Sentences are looked up in batches of a few chunks per
+    job, so that memory stays bounded however many of the results are cached.
+    '''
+    texts = iter(texts)
+    for batch in iter(lambda: list(islice(texts, 16 * jobs * chunksize)), []):
+        keys = [sentence_key(text) for text in batch]
+        cached = [results.get(key) for key in keys]
+        converted = convert_sentences(grammar, [text for text, result in zip(batch, cached) if result is None], pool,
+                                      jobs, chunksize)
+        for text, key, result in zip(batch, keys, cached):
+            if result is None:
+                result = next(converted)
+                results.put(key, result, relation_lemmas(grammar, text))
+            yield result
+
+
+def argument_parser(description) -> argparse.ArgumentParser:
+    '''
+    the command line options of run(), to which a language can add its own.
+    '''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of worker processes converting sentences in parallel (default: 1).')
+    parser.add_argument('--chunksize', type=int, default=64,
+                        help='number of sentences sent to a worker process at a time (default: 64).')
+    parser.add_argument('--cache-dir', default='.parse_cache',
+                        help='directory where parsed treebanks are cached between runs (default: .parse_cache).')
+    parser.add_argument('--cache-size', type=int, default=512,
+                        help='maximum size of the parse cache in MB (default: 512).')
+    parser.add_argument('--no-cache', action='store_true', help='always parse the treebanks from text.')
+    parser.add_argument('--result-cache-dir', default='.result_cache',
+                        help='directory where the results of the conversion of each sentence are cached between runs '
+                             '(default: .result_cache).')
+    parser.add_argument('--no-result-cache', action='store_true', help='always convert every sentence.')
+    parser.add_argument('--report', metavar='PATH',
+                        help='write what the grammar did to each sentence to this file, one JSON object per line. '
+                             'Every sentence is converted, without the result cache.')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='print what the grammar did to each sentence. Every sentence is converted, without the '
+                             'result cache.')
+    parser.add_argument('--input', nargs='+', metavar='PATH',
+                        help='convert these files instead of the treebanks, see --output-dir.')
+    parser.add_argument('--output-dir', default='UD+',
+                        help='directory the files given with --input are converted to, under the same names '
+                             '(default: UD+).')
+    parser.add_argument('--stats', metavar='PATH',
+                        help='write the time spent in each stage of the conversion, the counts of the branches of the '
+                             'grammar that fired and the peak memory of each file to this JSON file.')
+    parser.add_argument('--progress', action='store_true',
+                        help='show the number of sentences converted, the rate and the time left on stderr.')
+    parser.add_argument('--profile', metavar='BANK',
+                        help='profile the conversion of the files of this bank with cProfile and tracemalloc, in this '
+                             'process and without the result cache. The profile is written to profile_BANK.prof.')
+    return parser
+
+
+def input_files(args, files):
+    '''
+    the (input, output) paths of the files given with --input, or else files.
+    '''
+    if not args.input:
+        return files
+    os.makedirs(args.output_dir, exist_ok=True)
+    files = [(filepath, os.path.join(args.output_dir, os.path.basename(filepath))) for filepath in args.input]
+    for filepath, out_path in files:
+        if os.path.abspath(filepath) == os.path.abspath(out_path):
+            raise ValueError(f'{filepath} would be converted to itself, give another --output-dir')
+    return files
+
+
+def count_sentences(filepath) -> int:
+    '''
+    the number of sentences of a treebank file, counted by the blank lines that end them, for the progress line.
+    '''
+    count, in_sentence = 0, False
+    with open(filepath, 'rb') as f:
+        for line in f:
+            blank = line.isspace()
+            count += in_sentence and blank
+            in_sentence = not blank
+    return count + in_sentence
+
+
+def instrument_stages(grammar):
+    '''
+    times the stages of the conversion: reading and parsing the treebanks, the stages of the grammar, verifying the trees
+    and writing the sentences.
+    '''
+    instrument.enable()
+    instrument.wrap(sys.modules[__name__], {'read_texts': 'read', 'from_text': 'parse', 'from_record': 'parse',
+                                           'to_text': 'serialize', 'verify_treeness': 'verify_treeness'})
+    instrument.wrap(ParseCache, {'records': 'read'})
+    for name in getattr(grammar, 'TIMED_FUNCTIONS', []):
+        # the functions of a module the grammar imports are given as module.function, e.g. utils.span
+        module_name, _, function = name.rpartition('.')
+        instrument.wrap(getattr(grammar, module_name) if module_name else grammar, {function: function})
+    for name, function in getattr(grammar, 'CACHES', {}).items():
+        instrument.watch_cache(name, function)
+
+
+def profile_report(profiler, bank, filepath) -> dict:
+    '''
+    writes the cProfile profile of a file to profile_BANK.prof and prints the functions that took longest.
+    :return: the peak memory traced by tracemalloc and where most of it was allocated.
+    '''
+    peak = tracemalloc.get_traced_memory()[1]
+    top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+    tracemalloc.stop()
+    path = f'profile_{bank}.prof'
+    profiler.dump_stats(path)
+    print(f'profile of {filepath} written to {path}, {peak / 2**20:.1f} MB traced at most', file=sys.stderr)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(15)
+    return {'input': filepath, 'profile': path, 'peak_traced_kb': peak // 1024,
+            'top_allocations': [str(statistic) for statistic in top]}
+
+
+def run(grammar, args, files, convert=None):
+    '''
+    converts treebank files with a grammar. Sentences are streamed from each input file to its output file one at a
+    time, and sentences which the grammar fails on are written to 'problematic_sentences.conllu' as they are found.
+    :param args: the options parsed by argument_parser().
+    :param files: (input, output) paths, e.g. from treebank_files().
+    :param convert: a function converting the sentences of a file, given as raw texts or records, which yields the
+                    output of convert_text() for each of them in input order, instead of convert_sentences().
+    '''
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    if args.stats:
+        # before the worker processes are started, so that they are instrumented as well
+        instrument_stages(grammar)
+    interactive = getattr(grammar, 'INTERACTIVE', False)
+    jobs = 1 if interactive else args.jobs
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    cache = None if args.no_cache else ParseCache(args.cache_dir, args.cache_size * 2**20)
+    # reports are only made when they are asked for, the cached results have none
+    report = bool(args.report or args.verbose) and hasattr(grammar, 'report_sentence')
+    report_file = open(args.report, 'w', encoding='utf8') if args.report else None
+    results = None
+    if not (args.no_result_cache or interactive or convert or report):
+        grammar_dir = os.path.dirname(os.path.abspath(grammar.__file__))
+        results = ResultCache(fingerprint([os.path.join(grammar_dir, file) for file in grammar.GRAMMAR_FILES]),
+                              args.result_cache_dir)
+        dropped = results.update_maps(getattr(grammar, 'RELATION_MAPS', {}))
+        if dropped:
+            print(f'relation maps changed, {dropped} cached sentences will be converted again', file=sys.stderr)
+
+    progress = instrument.Progress(sum(count_sentences(filepath) for filepath, _ in files), sys.stderr) \
+        if args.progress else None
+    file_stats, profiles = [], []
+
+    with open('problematic_sentences.conllu', 'w', encoding='utf8') as problematic_file, \
+            Writer(problematic_file) as problematic:
+        for filepath, out_path in files:
+            file_wall, file_cpu = time.perf_counter(), time.process_time()
+            sentence_count = problematic_count = 0
+            profiler = None
+            if args.profile and args.profile in filepath.split(os.sep):
+                tracemalloc.start()
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+            # unchanged treebanks are read from the parse cache instead of being parsed again
+            sentences = cache.records(filepath) if cache else read_texts(filepath)
+
+            with open(out_path, 'w', encoding='utf8') as out_file, Writer(out_file) as outfile:
+                # sentences come back in input order whether they are converted here or in the pool
+                if convert is not None:
+                    converted = convert(sentences)
+                elif profiler is not None:
+                    converted = convert_sentences(grammar, sentences, None, 1, args.chunksize, report)
+                elif results is None:
+                    converted = convert_sentences(grammar, sentences, pool, jobs, args.chunksize, report)
+                else:
+                    converted = convert_cached(grammar, sentences, results, pool, jobs, args.chunksize)
+                for error, output, record in converted:
+                    if record is not None:
+                        if report_file is not None:
+                            report_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                        if args.verbose:
+                            sys.stdout.write(grammar.format_report(record))
+                    if error:
+                        problematic.write(output)
+                        problematic_count += 1
+                    else:
+                        outfile.write(output)
+                    sentence_count += 1
+                    if progress is not None:
+                        progress.update()
+
+            if profiler is not None:
+                profiler.disable()
+                profiles.append(profile_report(profiler, args.profile, filepath))
+            # the peak memory of the processes so far, which is that of the largest file converted up to this one
+            file_stats.append({'input': filepath, 'output': out_path, 'sentences': sentence_count,
+                               'problematic': problematic_count, 'wall': round(time.perf_counter() - file_wall, 6),
+                               'cpu': round(time.process_time() - file_cpu, 6),
+                               'peak_rss_kb': max(instrument.peak_rss(), instrument.workers_peak_rss)})
+
+    if progress is not None:
+        progress.close()
+    if args.stats:
+        wall = time.perf_counter() - start_wall
+        sentence_total = sum(stats['sentences'] for stats in file_stats)
+        with open(args.stats, 'w', encoding='utf8') as f:
+            json.dump({'grammar': os.path.basename(grammar.__file__), 'jobs': jobs, 'wall': round(wall, 6),
+                       'cpu': round(time.process_time() - start_cpu, 6), 'sentences': sentence_total,
+                       'sentences_per_second': round(sentence_total / wall, 1) if wall else None,
+                       'peak_rss_kb': max(instrument.peak_rss(), instrument.workers_peak_rss),
+                       'stages': instrument.stage_report(), 'counters': dict(sorted(instrument.counters.items())),
+                       'caches': instrument.cache_report(),
+                       'files': file_stats, 'profiles': profiles}, f, indent=1, ensure_ascii=False)
+
+    if report_file is not None:
+        report_file.close()
+    if results is not None:
+        results.save()
+    if pool is not None:
+        pool.close()
+        pool.join()
@@ -0,0 +1,254 @@
+'''
+The sentence representation used by the grammar. conllu.Token is a dict, so comparing two tokens compares all their
+fields and they cannot be put in sets. Nodes keep the CoNLL-U columns, and the columns added by the conversion, in slots,
+are compared by identity, and their lemma, upos and deprel strings are interned.
+
+Sentences are read from and written to text directly rather than through conllu.TokenList. Only the columns the grammar
+looks at are parsed when a line is read: id and head become ints, FEATS is parsed into a dict the first time it is
+accessed, and the other columns are kept as they are in the file. A sentence the grammar did not change is therefore
+written back byte for byte, comment lines included.
+
+UD+ files are written with a Writer, which collects the output in memory and writes it to the file in large chunks.
+'''
+import sys
+import time
+import hashlib
+import argparse
+
+import conllu
+from conllu.exceptions import ParseException
+from conllu.parser import parse_comment_line, parse_dict_value, parse_id_value, parse_int_value
+from conllu.serializer import serialize_field
+
+FIELDS = ('id', 'form', 'lemma', 'upos', 'xpos', 'feats', 'head', 'deprel', 'deps', 'misc')
+
+# marks FEATS that has not been parsed from raw_feats yet
+UNPARSED = object()
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Node:
+    '''
+    One line of a sentence. ms_feats is the added morpho-syntactic features column and fixed_lemma the lemma of the
+    fixed expression the node heads while the grammar handles it; both are None until they are set.
+    raw_feats is the FEATS column as it was read, it is written back instead of feats unless feats is assigned to.
+    '''
+    __slots__ = ('id', 'form', 'lemma', 'upos', 'xpos', '_feats', 'raw_feats', 'head', 'deprel', 'deps', 'misc',
+                 'ms_feats', 'fixed_lemma')
+
+    def __init__(self, id, form, lemma, upos, xpos, feats, head, deprel, deps, misc, ms_feats=None):
+        self.id = id
+        self.form = form
+        self.lemma = intern(lemma)
+        self.upos = intern(upos)
+        self.xpos = xpos
+        self.feats = feats
+        self.head = head
+        self.deprel = intern(deprel)
+        self.deps = deps
+        self.misc = misc
+        self.ms_feats = ms_feats
+        self.fixed_lemma = None
+
+    @classmethod
+    def from_columns(cls, id, form, lemma, upos, xpos, raw_feats, head, deprel, deps, misc):
+        '''
+        a node whose FEATS is parsed when it is first accessed; id and head are already parsed.
+        '''
+        node = cls.__new__(cls)
+        node.id = id
+        node.form = form
+        node.lemma = sys.intern(lemma)
+        node.upos = sys.intern(upos)
+        node.xpos = xpos
+        node._feats = UNPARSED
+        node.raw_feats = raw_feats
+        node.head = head
+        node.deprel = sys.intern(deprel)
+        node.deps = deps
+        node.misc = misc
+        node.ms_feats = None
+        node.fixed_lemma = None
+        return node
+
+    @classmethod
+    def from_line(cls, line):
+        columns = line.split('\t')
+        if len(columns) != 10:
+            raise ParseException(f'Expected 10 tab-separated columns, found {len(columns)}: {line!r}')
+        id, form, lemma, upos, xpos, feats, head, deprel, deps, misc = columns
+        return cls.from_columns(int(id) if id.isdigit() else parse_id_value(id), form, lemma, upos, xpos, feats,
+                                int(head) if head.isdigit() else parse_int_value(head), deprel, deps, misc)
+
+    @property
+    def feats(self):
+        if self._feats is UNPARSED:
+            self._feats = parse_dict_value(self.raw_feats)
+        return self._feats
+
+    @feats.setter
+    def feats(self, value):
+        self._feats = value
+        self.raw_feats = None
+
+    def to_line(self, ms_feats=True):
+        feats = self.raw_feats if self.raw_feats is not None else serialize_field(self.feats)
+        columns = [self.id, self.form, self.lemma, self.upos, self.xpos, feats, self.head, self.deprel, self.deps,
+                   self.misc]
+        if ms_feats:
+            columns.append(self.ms_feats)
+        return '\t'.join(column if type(column) is str else serialize_field(column) for column in columns)
+
+    def __repr__(self):
+        return f'Node({self.id}, {self.form!r}, {self.deprel!r}->{self.head})'
+
+
+class Sentence:
+    '''
+    The nodes of a sentence, in file order, with its metadata. comments are the comment lines as they were read.
+    added are the abstract nodes created by the conversion, with ids like 3.1 for a node that goes after word 3. They are
+    kept out of nodes, so that the positions of the nodes do not change, and are put in place when the sentence is written.
+    '''
+    __slots__ = ('nodes', 'metadata', 'comments', 'by_id', 'added')
+
+    def __init__(self, nodes, metadata, comments=None):
+        self.nodes = nodes
+        self.metadata = metadata
+        if comments is None:
+            comments = [f'# {key} = {value}' if value else f'# {key}' for key, value in metadata.items()]
+        self.comments = comments
+        # multiword ranges and empty nodes are not part of the tree and cannot be looked up
+        self.by_id = {node.id: node for node in nodes if isinstance(node.id, int)}
+        self.added = []
+
+
+def from_text(text: str) -> Sentence:
+    '''
+    parses one sentence, as yielded by conllu.parse_sentences(). Metadata is read the way conllu reads it.
+    '''
+    nodes, metadata, comments = [], {}, []
+    for line in text.split('\n'):
+        line = line.rstrip('\r')
+        if not line:
+            continue
+        if line[0] == '#':
+            comments.append(line)
+            for key, value in parse_comment_line(line):
+                metadata[key] = value
+        else:
+            nodes.append(Node.from_line(line))
+    return Sentence(nodes, metadata, comments)
+
+
+def text_digest(text: str) -> bytes:
+    '''
+    identifies the text of a sentence, as yielded by conllu.parse_sentences().
+    '''
+    return hashlib.blake2b(text.encode('utf8'), digest_size=16).digest()
+
+
+def to_record(sentence: Sentence, digest=None) -> tuple:
+    '''
+    the sentence as read, in plain tuples and strings: these are much faster to pickle and unpickle than nodes.
+    :param digest: the text_digest() of the text the sentence was read from, kept as the last item of the record.
+    '''
+    return sentence.comments, sentence.metadata, [
+        (node.id, node.form, node.lemma, node.upos, node.xpos, node.raw_feats, node.head, node.deprel, node.deps,
+         node.misc) for node in sentence.nodes], digest
+
+
+def from_record(record: tuple) -> Sentence:
+    comments, metadata, rows, _ = record
+    return Sentence([Node.from_columns(*row) for row in rows], metadata, comments)
+
+
+def to_text(sentence: Sentence, ms_feats=True) -> str:
+    '''
+    :param ms_feats: whether to add the morpho-syntactic features as an eleventh column.
+    :return: the sentence in the format of conllu's TokenList.serialize(), ending with an empty line.
+    '''
+    lines = sentence.comments.copy()
+    if not sentence.added:
+        lines.extend(node.to_line(ms_feats) for node in sentence.nodes)
+        return '\n'.join(lines) + '\n\n'
+
+    # the added nodes are merged in a single pass: the ones after word k are written after the node with id k
+    added_after = {}
+    for node in sorted(sentence.added, key=lambda node: node.id):
+        added_after.setdefault(node.id[0], []).append(node)
+    lines.extend(node.to_line(ms_feats) for node in added_after.pop(0, []))
+    for node in sentence.nodes:
+        lines.append(node.to_line(ms_feats))
+        if node.id in added_after:
+            lines.extend(added.to_line(ms_feats) for added in added_after.pop(node.id))
+    assert not added_after, f'abstract nodes after missing words: {list(added_after)}'
+    return '\n'.join(lines) + '\n\n'
+
+
+class Writer:
+    '''
+    Writes text to a file in chunks of about buffer_size characters instead of one write per sentence.
+    Use it as a context manager, or call flush() when done, so that the last chunk is written.
+    '''
+
+    def __init__(self, file, buffer_size=1 << 20):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+def read_sentences(filepath):
+    '''
+    yields the sentences of a treebank file one at a time.
+    '''
+    with open(filepath, encoding='utf8') as f:
+        for text in conllu.parse_sentences(f):
+            yield from_text(text)
+
+
+if __name__ == '__main__':
+    '''
+    compares reading with from_text() to conllu.parse_incr() and checks that every sentence is written back unchanged:
+        python3 -m morphosyntax.sentence swe/UD/swe/*/*.conllu
+    '''
+    parser = argparse.ArgumentParser(description='Benchmarks the CoNLL-U reader against conllu.parse_incr.')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    for filepath in args.files:
+        start = time.perf_counter()
+        with open(filepath, encoding='utf8') as f:
+            n_conllu = sum(1 for _ in conllu.parse_incr(f))
+        conllu_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        n_fast = sum(1 for _ in read_sentences(filepath))
+        fast_time = time.perf_counter() - start
+        assert n_fast == n_conllu, (n_fast, n_conllu)
+
+        with open(filepath, encoding='utf8') as f:
+            changed = sum(to_text(from_text(text), ms_feats=False) != text + '\n\n' for text in conllu.parse_sentences(f))
+
+        print(f'{filepath}: {n_fast} sentences, conllu.parse_incr {conllu_time:.2f}s, from_text {fast_time:.2f}s '
+              f'({conllu_time / fast_time:.1f}x), {changed} not written back unchanged')
@@ -0,0 +1,119 @@
+'''
+Tests of when the parse cache reads a file from the cache and when it parses it again, run from the root of the
+repository with
+
+    python3 -m pytest
+'''
+import os
+from itertools import islice
+
+from morphosyntax import parse_cache
+from morphosyntax.parse_cache import ParseCache
+from morphosyntax.sentence import from_text, to_record, text_digest
+
+SENTENCE = '''# sent_id = {n}
+# text = Hon läser.
+1	Hon	hon	PRON	_	Case=Nom	2	nsubj	_	_
+2	läser	läsa	VERB	_	Tense=Pres	0	root	_	_
+3	.	.	PUNCT	_	_	2	punct	_	_
+
+'''
+
+
+def write_treebank(path, sentences=5, first=1):
+    with open(path, 'w', encoding='utf8') as f:
+        f.write(''.join(SENTENCE.format(n=n) for n in range(first, first + sentences)))
+    return str(path)
+
+
+def parsed(path):
+    with open(path, encoding='utf8') as f:
+        texts = f.read().split('\n\n')[:-1]
+    return [to_record(from_text(text), text_digest(text)) for text in texts]
+
+
+def cached_files(cache):
+    return sorted(name for name in os.listdir(cache.directory) if name != 'index.json')
+
+
+def test_unchanged_file_is_read_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CHUNK_SIZE', 2)
+    path = write_treebank(tmp_path / 'a.conllu')
+    cache = ParseCache(tmp_path / 'cache')
+    assert list(cache.records(path)) == parsed(path)
+    assert list(cache.records(path)) == parsed(path)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a new instance finds the entry in the index
+    cache = ParseCache(tmp_path / 'cache')
+    assert list(cache.records(path)) == parsed(path)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_touched_file_is_hit_and_changed_file_is_miss(tmp_path):
+    path = write_treebank(tmp_path / 'a.conllu')
+    cache = ParseCache(tmp_path / 'cache')
+    list(cache.records(path))
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    list(cache.records(path))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    write_treebank(path, first=10)
+    assert list(cache.records(path)) == parsed(path)
+    assert (cache.hits, cache.misses) == (1, 2)
+    # the file of the old content is removed
+    assert len(cached_files(cache)) == 1
+
+
+def test_other_reader_is_miss(tmp_path, monkeypatch):
+    path = write_treebank(tmp_path / 'a.conllu')
+    list(ParseCache(tmp_path / 'cache').records(path))
+
+    # as after an edit to sentence.py, with the size and mtime of the file unchanged
+    monkeypatch.setattr(parse_cache, 'READER_VERSION', '0123456789abcdef')
+    cache = ParseCache(tmp_path / 'cache')
+    assert list(cache.records(path)) == parsed(path)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.index[os.path.abspath(path)]['key'].endswith('0123456789abcdef')
+    assert len(cached_files(cache)) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    a = write_treebank(tmp_path / 'a.conllu')
+    b = write_treebank(tmp_path / 'b.conllu', first=10)
+    cache = ParseCache(tmp_path / 'cache', max_bytes=1)
+    list(cache.records(a))
+    list(cache.records(b))
+    # only the newest entry is kept when the cache is too small for both
+    assert list(cache.index) == [os.path.abspath(b)]
+    assert len(cached_files(cache)) == 1
+    list(cache.records(a))
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+def test_file_read_in_part_is_not_cached(tmp_path):
+    path = write_treebank(tmp_path / 'a.conllu')
+    cache = ParseCache(tmp_path / 'cache')
+    records = cache.records(path)
+    list(islice(records, 2))
+    records.close()
+    assert cache.index == {}
+    assert cached_files(cache) == []
+
+
+def test_damaged_cached_file_is_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CHUNK_SIZE', 2)
+    path = write_treebank(tmp_path / 'a.conllu')
+    cache = ParseCache(tmp_path / 'cache')
+    list(cache.records(path))
+    cached = os.path.join(cache.directory, cached_files(cache)[0])
+    with open(cached, 'rb') as f:
+        data = f.read()
+    with open(cached, 'wb') as f:
+        f.write(data[:len(data) * 2 // 3])
+
+    assert list(cache.records(path)) == parsed(path)
+    assert list(cache.records(path)) == parsed(path)
+    assert (cache.hits, cache.misses) == (1, 2)
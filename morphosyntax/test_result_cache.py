@@ -0,0 +1,98 @@
+'''
+Tests of which results the result cache keeps, and which it drops when the relation maps change, down to a rerun of
+swedish.py after an edit to swe_relations.py, run from the root of the repository with
+
+    python3 -m pytest
+'''
+import os
+import sys
+import shutil
+import subprocess
+
+from morphosyntax.result_cache import ResultCache, diff_maps
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_diff_maps():
+    old = {'case': {'av': 'Agt', 'på grund av': 'Cau', 'i': 'Ine'}, 'mark': {'om': 'Cnd'}}
+    new = {'case': {'av': 'Agt', 'på grund av': 'Rsn', 'till': 'All'}}
+    assert diff_maps(old, new) == {'på grund av', 'på', 'grund', 'av', 'i', 'till', 'om'}
+    assert diff_maps(old, old) == set()
+
+
+def test_update_maps_drops_the_results_of_changed_lemmas(tmp_path):
+    maps = {'case': {'av': 'Agt', 'på': 'Loc'}}
+    results = ResultCache('f', tmp_path)
+    assert results.update_maps(maps) == 0
+    results.put(b'1', (None, 'av\n', None), {'av'})
+    results.put(b'2', (None, 'på\n', None), {'på'})
+    results.put(b'3', (None, 'none\n', None))
+    results.save()
+
+    results = ResultCache('f', tmp_path)
+    assert results.update_maps(maps) == 0
+    assert results.update_maps({'case': {'av': 'Abl', 'på': 'Loc'}}) == 1
+    assert results.get(b'1') is None
+    assert results.get(b'2') == (None, 'på\n', None)
+    assert results.get(b'3') == (None, 'none\n', None)
+    assert (results.hits, results.misses) == (2, 1)
+    results.save()
+
+    # the new snapshot was saved with the results
+    results = ResultCache('f', tmp_path)
+    assert results.update_maps({'case': {'av': 'Abl', 'på': 'Loc'}}) == 0
+    results.save()
+
+
+def test_results_without_a_snapshot_are_dropped(tmp_path):
+    results = ResultCache('f', tmp_path)
+    results.put(b'1', (None, 'av\n', None), {'av'})
+    results.save()
+    results = ResultCache('f', tmp_path)
+    assert results.update_maps({'case': {'av': 'Agt'}}) == 1
+    assert results.get(b'1') is None
+    results.save()
+
+
+def test_results_are_only_kept_once_saved(tmp_path):
+    results = ResultCache('f', tmp_path)
+    results.put(b'1', (None, 'av\n', None))
+    results.db.close()
+    results = ResultCache('f', tmp_path)
+    assert results.get(b'1') is None
+    results.save()
+
+
+def convert(directory, output_dir, *options):
+    '''
+    the output of swedish.py on input.conllu, and what it printed to stderr.
+    '''
+    process = subprocess.run([sys.executable, 'swedish.py', '--no-cache', '--input', 'input.conllu', '--output-dir',
+                              output_dir, *options], cwd=directory, check=True, capture_output=True, encoding='utf8')
+    with open(os.path.join(directory, output_dir, 'input.conllu'), encoding='utf8') as f:
+        return f.read(), process.stderr
+
+
+def test_map_edit_gives_the_output_of_a_full_run(tmp_path):
+    swe_dir = tmp_path / 'swe'
+    ignore = shutil.ignore_patterns('UD', 'UD+', '*.txt', '.parse_cache', '.result_cache', '__pycache__')
+    shutil.copytree(os.path.join(REPO_DIR, 'morphosyntax'), tmp_path / 'morphosyntax', ignore=ignore)
+    shutil.copytree(os.path.join(REPO_DIR, 'swe'), swe_dir, ignore=ignore)
+    with open(os.path.join(REPO_DIR, 'swe', 'UD', 'swe', 'PUD', 'sv_pud-ud-test.conllu'), encoding='utf8') as f:
+        sentences = f.read().split('\n\n')[:200]
+    with open(swe_dir / 'input.conllu', 'w', encoding='utf8') as f:
+        f.write('\n\n'.join(sentences) + '\n\n')
+
+    before, _ = convert(swe_dir, 'before')
+    relations = (swe_dir / 'swe_relations.py').read_text(encoding='utf8')
+    assert relations.count("    'av': 'Agt', # ?") == 1
+    (swe_dir / 'swe_relations.py').write_text(relations.replace("    'av': 'Agt', # ?", "    'av': 'Abl', # ?"),
+                                              encoding='utf8')
+    incremental, messages = convert(swe_dir, 'incremental')
+    full, _ = convert(swe_dir, 'full', '--no-result-cache')
+    # only the sentences with 'av' were converted again
+    dropped = int(messages.split('relation maps changed, ')[1].split()[0])
+    assert 0 < dropped < len(sentences)
+    assert incremental != before
+    assert incremental == full
@@ -0,0 +1,54 @@
+'''
+Tests of what the runtime writes for the sentences a grammar fails on, run from the root of the repository with
+
+    python3 -m pytest
+'''
+import types
+
+from morphosyntax import runtime
+from morphosyntax.sentence import Node, from_text, to_record, text_digest
+
+TEXT = '''# sent_id = 1
+# text = They saw another one.
+1	They	they	PRON	_	Case=Nom|Number=Plur	2	nsubj	_	_
+2	saw	see	VERB	_	Tense=Past	0	root	_	_
+3	another	another	DET	_	_	4	det	_	_
+4	one	one	NUM	_	NumType=Card	2	obj	_	SpaceAfter=No
+5	.	.	PUNCT	_	_	2	punct	_	_'''
+
+
+def failing_convert_sentence(sentence):
+    '''
+    changes the sentence the way a grammar does before it fails: a lemma is rewritten, feats are written to and an
+    abstract node is added.
+    '''
+    sentence.nodes[2].lemma = 'other'
+    sentence.nodes[1].feats['Tense'] = 'Pres'
+    sentence.nodes[1].ms_feats = {'Tense': 'Past'}
+    sentence.added.append(Node(id=(1, '.', 1), form='-', lemma='-', upos='-', xpos='-', feats=None, head=2,
+                               deprel='nsubj', deps='-', misc='-', ms_feats={}))
+    return 'TEST_ERROR'
+
+
+GRAMMAR = types.SimpleNamespace(convert_sentence=failing_convert_sentence)
+
+
+def test_failed_sentence_is_written_as_it_was_read():
+    error, output, _ = runtime.convert_text(GRAMMAR, TEXT)
+    assert error == 'TEST_ERROR'
+    assert output == '# error_type = TEST_ERROR\n' + TEXT + '\n\n\n'
+
+    # as read from the parse cache
+    error, output, _ = runtime.convert_text(GRAMMAR, to_record(from_text(TEXT), text_digest(TEXT)))
+    assert output == '# error_type = TEST_ERROR\n' + TEXT + '\n\n\n'
+
+
+def test_failed_sentence_is_written_back_byte_identical(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('input.conllu', 'w', encoding='utf8') as f:
+        f.write(TEXT + '\n\n')
+    for options in (['--no-cache'], []):
+        args = runtime.argument_parser('test').parse_args(['--no-result-cache', *options])
+        runtime.run(GRAMMAR, args, [('input.conllu', 'output.conllu')])
+        with open('problematic_sentences.conllu', encoding='utf8') as f:
+            assert f.read() == '# error_type = TEST_ERROR\n' + TEXT + '\n\n\n'
@@ -0,0 +1,138 @@
+'''
+Writes the concordances of function words in 'aux.txt', 'case.txt', 'cc.txt', 'mark.txt' and 'part.txt', with one line
+per word, its feats and the text of its sentence:
+
+    lemma='kunna'	feats='Mood=Ind|Tense=Pres|VerbForm=Fin|Voice=Act'	text='Vi kan inte ...'
+
+Lines are sorted by the lowercased form of the word, then by their order in the treebanks, and each line is only written
+once. The treebanks in 'consts.py' are read in a single pass, by several worker processes when there are several files.
+Each worker sorts the lines of its file in runs of at most --run-size lines, written to temporary files, and the runs are
+merged into the concordances, so memory stays bounded however large the treebanks are.
+
+    python3 concordance.py --jobs 4
+'''
+import os
+import sys
+import heapq
+import argparse
+import tempfile
+import multiprocessing
+from itertools import groupby
+
+from consts import ud_dir, banks, splits
+# the modules shared by the languages, see morphosyntax/__init__.py
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from morphosyntax.sentence import read_sentences
+
+# the words each concordance is made of
+CATEGORIES = {
+    'aux': lambda node: node.upos == 'AUX',
+    'case': lambda node: node.deprel == 'case',
+    'cc': lambda node: node.deprel == 'cc',
+    'mark': lambda node: node.deprel == 'mark',
+    'part': lambda node: node.upos == 'PART',
+}
+
+
+def write_run(lines, category, tmp_dir):
+    '''
+    sorts lines and writes them to a temporary file, one 'key\\tfile\\tposition\\tline' per line.
+    '''
+    lines.sort()
+    fd, path = tempfile.mkstemp(prefix=category + '-', suffix='.run', dir=tmp_dir)
+    with open(fd, 'w', encoding='utf8') as f:
+        f.writelines(f'{key}\t{file_index}\t{position}\t{line}' for key, file_index, position, line in lines)
+    return path
+
+
+def extract(file_index, filepath, tmp_dir, run_size):
+    '''
+    reads one treebank file and writes the lines of each concordance in sorted runs.
+    :return: the paths of the runs of each category.
+    '''
+    buffers = {category: [] for category in CATEGORIES}
+    runs = {category: [] for category in CATEGORIES}
+    position = 0
+    for sentence in read_sentences(filepath):
+        text = sentence.metadata.get('text')
+        for node in sentence.nodes:
+            if not isinstance(node.id, int):
+                continue
+            line = None
+            for category, matches in CATEGORIES.items():
+                if matches(node):
+                    if line is None:
+                        line = f"lemma='{node.lemma}'\tfeats='{node.raw_feats}'\ttext='{text}'\t\n"
+                    buffers[category].append((node.form.lower(), file_index, position, line))
+                    if len(buffers[category]) >= run_size:
+                        runs[category].append(write_run(buffers[category], category, tmp_dir))
+                        buffers[category] = []
+            position += 1
+    for category, lines in buffers.items():
+        if lines:
+            runs[category].append(write_run(lines, category, tmp_dir))
+    return runs
+
+
+def extract_star(args):
+    return extract(*args)
+
+
+def read_run(path):
+    with open(path, encoding='utf8') as f:
+        for run_line in f:
+            key, file_index, position, line = run_line.split('\t', 3)
+            yield key, int(file_index), int(position), line
+
+
+def merge_runs(paths, out_path):
+    '''
+    merges sorted runs into a concordance, writing each line only once.
+    :return: the number of lines written.
+    '''
+    written = 0
+    with open(out_path, 'w', encoding='utf8') as outfile:
+        merged = heapq.merge(*[read_run(path) for path in paths])
+        # the same word of the same sentence has the same lowercased form, so duplicates are in the same group
+        for key, group in groupby(merged, key=lambda run_line: run_line[0]):
+            seen = set()
+            for _, _, _, line in group:
+                if line not in seen:
+                    seen.add(line)
+                    outfile.write(line)
+                    written += 1
+    return written
+
+
+def treebank_files():
+    '''
+    the treebank files in 'consts.py', in the order the converter reads them.
+    '''
+    return [os.path.join(ud_dir, lang, bank, split)
+            for lang, all_banks in banks.items()
+            for bank in all_banks
+            for split in [s for s in splits[bank].values() if s]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes the concordances of auxiliaries, cases, coordinating '
+                                                 'conjunctions, markers and particles in the treebanks in consts.py.')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of files read in parallel (default: 1).')
+    parser.add_argument('--run-size', type=int, default=100000,
+                        help='number of lines a worker sorts in memory at a time (default: 100000).')
+    parser.add_argument('--output-dir', default='.', help='where the concordances are written (default: .).')
+    args = parser.parse_args()
+
+    files = treebank_files()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tasks = [(file_index, filepath, tmp_dir, args.run_size) for file_index, filepath in enumerate(files)]
+        if args.jobs > 1:
+            with multiprocessing.Pool(args.jobs) as pool:
+                file_runs = pool.map(extract_star, tasks)
+        else:
+            file_runs = [extract(*task) for task in tasks]
+
+        for category in CATEGORIES:
+            paths = [path for runs in file_runs for path in runs[category]]
+            written = merge_runs(paths, os.path.join(args.output_dir, category + '.txt'))
+            print(f'{category}.txt: {written} lines')
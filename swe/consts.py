@@ -2,6 +2,9 @@ import os
 
 
 def find_file(directory, string):
+    # a bank that is not in ud_dir has no files, so that the others can still be converted
+    if not os.path.isdir(directory):
+        return None
     for file in os.listdir(directory):
         if string in file:
             return file
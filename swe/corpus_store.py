@@ -0,0 +1,155 @@
+'''
+Whole treebanks in columnar numpy arrays, for corpus-wide work that does not need the full CoNLL-U tokens.
+Every word of a treebank has its id and head in an array, and its lemma, upos and deprel as integer codes into a
+vocabulary of the strings. Sentences are ranges of these arrays given by an array of offsets, so looking at a sentence
+only takes slices of them. Multiword ranges and empty nodes are not stored.
+
+A store is saved as an .npz file, or as a directory of .npy files which can be memory-mapped when loaded:
+
+    python3 corpus_store.py UD/swe/PUD/sv_pud-ud-test.conllu -o PUD-test.npz
+'''
+import os
+import sys
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+# the modules shared by the languages, see morphosyntax/__init__.py
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from morphosyntax.sentence import read_sentences
+
+CODED = ('lemma', 'upos', 'deprel')
+ARRAYS = ('offsets', 'id', 'head') + CODED
+
+SentenceView = namedtuple('SentenceView', ('sent_id', 'id', 'head') + CODED)
+
+
+class CorpusStore:
+    '''
+    offsets has one more item than there are sentences: the words of sentence i are offsets[i]:offsets[i+1].
+    vocab maps each of 'lemma', 'upos' and 'deprel' to the list of strings its codes stand for.
+    '''
+
+    def __init__(self, arrays: dict, vocab: dict, sent_ids):
+        self.arrays = arrays
+        self.vocab = vocab
+        self.sent_ids = sent_ids
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.arrays['offsets']) - 1
+
+    @property
+    def n_words(self):
+        return int(self.arrays['offsets'][-1])
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def sentence(self, i) -> SentenceView:
+        '''
+        the columns of sentence i, as views of the corpus arrays (nothing is copied).
+        '''
+        start, end = self.arrays['offsets'][i], self.arrays['offsets'][i + 1]
+        return SentenceView(self.sent_ids[i], *[self.arrays[column][start:end] for column in ('id', 'head') + CODED])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.sentence(i)
+
+    def code(self, column, value):
+        '''
+        the integer code of a string in one of the coded columns, or -1 if it does not occur in the corpus.
+        '''
+        if column not in self._codes:
+            self._codes[column] = {string: code for code, string in enumerate(self.vocab[column])}
+        return self._codes[column].get(value, -1)
+
+    def decode(self, column, codes):
+        return [self.vocab[column][code] for code in codes]
+
+    @classmethod
+    def from_conllu(cls, paths):
+        '''
+        reads one or more CoNLL-U files, in order, into a single store.
+        '''
+        vocab = {column: [] for column in CODED}
+        codes = {column: {} for column in CODED}
+        columns = {column: [] for column in ('id', 'head') + CODED}
+        offsets = [0]
+        sent_ids = []
+
+        for path in [paths] if isinstance(paths, str) else paths:
+            for sentence in read_sentences(path):
+                for node in sentence.nodes:
+                    if not isinstance(node.id, int):
+                        continue
+                    columns['id'].append(node.id)
+                    columns['head'].append(-1 if node.head is None else node.head)
+                    for column in CODED:
+                        value = getattr(node, column)
+                        code = codes[column].get(value)
+                        if code is None:
+                            code = codes[column][value] = len(vocab[column])
+                            vocab[column].append(value)
+                        columns[column].append(code)
+                offsets.append(len(columns['id']))
+                sent_ids.append(sentence.metadata.get('sent_id', ''))
+
+        arrays = {column: np.array(values, dtype=np.int32) for column, values in columns.items()}
+        arrays['offsets'] = np.array(offsets, dtype=np.int64)
+        return cls(arrays, vocab, sent_ids)
+
+    @classmethod
+    def from_split(cls, ud_dir, lang, bank, split):
+        '''
+        reads a split of a treebank laid out as described in the README, e.g. from_split('UD', 'swe', 'PUD', 'test').
+        '''
+        directory = os.path.join(ud_dir, lang, bank)
+        filename = [file for file in sorted(os.listdir(directory)) if split in file and file.endswith('.conllu')]
+        if not filename:
+            raise FileNotFoundError(f'no {split} split in {directory}')
+        return cls.from_conllu(os.path.join(directory, filename[0]))
+
+    def save(self, path):
+        '''
+        saves the store to an .npz file if the path ends with '.npz', and otherwise to a directory of .npy files.
+        '''
+        strings = {f'{column}_vocab': np.array(self.vocab[column], dtype=str) for column in CODED}
+        strings['sent_ids'] = np.array(self.sent_ids, dtype=str)
+        if path.endswith('.npz'):
+            np.savez(path, **self.arrays, **strings)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in {**self.arrays, **strings}.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''
+        loads a saved store. The arrays of a directory store are memory-mapped unless mmap is False,
+        those of an .npz file are read into memory.
+        '''
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                data = {name: data[name] for name in data.files}
+        else:
+            data = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+                    for name in ARRAYS + tuple(f'{column}_vocab' for column in CODED) + ('sent_ids',)}
+        vocab = {column: [str(value) for value in data[f'{column}_vocab']] for column in CODED}
+        sent_ids = [str(value) for value in data['sent_ids']]
+        return cls({name: data[name] for name in ARRAYS}, vocab, sent_ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stores CoNLL-U files in columnar arrays.')
+    parser.add_argument('files', nargs='+', help='CoNLL-U files, stored in the given order.')
+    parser.add_argument('--output', '-o', required=True, help='an .npz file, or a directory for memory-mapped arrays.')
+    args = parser.parse_args()
+
+    store = CorpusStore.from_conllu(args.files)
+    store.save(args.output)
+    print(f'{len(store)} sentences, {store.n_words} words, '
+          f'{store.nbytes / store.n_words:.1f} bytes per word in the arrays')
@@ -1,10 +1,15 @@
 import os
+import sys
+# the modules shared by the languages, see morphosyntax/__init__.py
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import conllu
-from consts import ud_dir, banks, splits
 import utils
-from copy import deepcopy
+from consts import ud_dir, banks, splits
+from morphosyntax import runtime, instrument
+from morphosyntax.runtime import combine_fixed_nodes, copy_feats, set_leaf_feats
+from morphosyntax.sentence import Node, Sentence
 from collections import defaultdict
+from functools import lru_cache
 
 from swe_relations import case_feat_map, marker_feat_map, conjtype_feat_map
 
@@ -13,18 +18,6 @@ NOMINAL = {'NOUN', 'PROPN', 'PRON', 'NUM'}
 
 clausal_rels = {'conj','csubj','xcomp','ccomp','advcl','acl','advcl:relcl','acl:relcl'}
 
-def combine_fixed_nodes(head, fixed_children):
-    '''
-    In cases where several function words are combined to one meaning (e.g., because of, more then) they are tagged with
-     a 'fixed' deprel and are combined to one temporary lemma to look for in the relevant map in 'eng_relations.py'.
-    '''
-    if not fixed_children:
-        return head['lemma']
-
-    l = [head] + fixed_children
-    l.sort(key=lambda node: node['id'])
-    return ' '.join([node['lemma'] for node in l])
-
 def get_rel_feat(word):
     '''
         this function returns a case feature if a marker feature is not available
@@ -37,310 +30,214 @@ def get_conj_feat(word):
     '''
     return conjtype_feat_map.get(word, case_feat_map.get(word, word))
 
-def get_relation_feats(relation_nodes: list[conllu.Token], verb=True, clause=False) -> dict:
+# constructions recur across sentences, so the feats of a construction are cached under its signature, the parts of its
+# function words the feats depend on. FEATS_CACHE_SIZE bounds the number of constructions of each kind kept.
+FEATS_CACHE_SIZE = 2**14
+
+@lru_cache(maxsize=FEATS_CACHE_SIZE)
+def relation_feats(signature: tuple, verb=True, clause=False) -> tuple:
     '''
-    Generating morpho_syntactic features for relations. For nominals, cases are put under the 'Case' feature, markers are put under RelType, and
-    conjunctions under 'ConjType'. For verbs, all values are under 'RelType'.
-    The mapping from words to features is in 'swe_relations.py' and should be updated there.
+    the feats of a relation construction, see get_relation_feats().
+    :param signature: the (lemma, deprel) of the relation words in order, with the lemma of the whole expression for
+                      words heading a fixed expression.
+    :return: the feats, or None if there is a case on a verb, and the lemmas that are neither cases, markers nor
+             conjunctions. The feats are shared by every construction with the signature and are not to be written to.
     '''
     feats = {}
 
-    relation_nodes = deepcopy(relation_nodes)
-    for node in relation_nodes:
-        node['lemma'] = node.get('fixed lemma', node.get('lemma')) 
-
-    case_nodes = [node for node in relation_nodes if node['deprel'] == 'case']
-    marker_nodes = [node for node in relation_nodes if node['deprel'] == 'mark']
-    cc_nodes = [node for node in relation_nodes if node['deprel'] == 'cc']
+    lemma = [word_lemma for word_lemma, _ in signature]
+    case_nodes = [i for i, (_, deprel) in enumerate(signature) if deprel == 'case']
+    marker_nodes = [i for i, (_, deprel) in enumerate(signature) if deprel == 'mark']
+    cc_nodes = [i for i, (_, deprel) in enumerate(signature) if deprel == 'cc']
 
     if case_nodes and verb:
-        return f"REL_CASE_VERB_{'|'.join([str(n['id'])+'->'+str(n['head']) for n in case_nodes])}"
+        return None, ()
 
-    remaining_nodes = [node for node in relation_nodes if node not in case_nodes and node not in marker_nodes and node not in cc_nodes]
+    remaining_nodes = [i for i in range(len(signature)) if i not in case_nodes and i not in marker_nodes and i not in cc_nodes]
+    unclassified = ()
 
     if not verb:
         if clause:
             # if it's a noun heading a clause I assume adpositions are defaultly markers
-            marker_nodes += [node for node in remaining_nodes
-                             if node['lemma'] in marker_feat_map]
+            marker_nodes += [i for i in remaining_nodes
+                             if lemma[i] in marker_feat_map]
             
-            case_nodes += [node for node in remaining_nodes
-                           if node['lemma'] in case_feat_map
-                           and node not in marker_nodes]
-            cc_nodes += [node for node in remaining_nodes
-                        if node['lemma'] in conjtype_feat_map
-                        and node not in marker_nodes
-                        and node not in case_nodes]
+            case_nodes += [i for i in remaining_nodes
+                           if lemma[i] in case_feat_map
+                           and i not in marker_nodes]
+            cc_nodes += [i for i in remaining_nodes
+                        if lemma[i] in conjtype_feat_map
+                        and i not in marker_nodes
+                        and i not in case_nodes]
         else:
             # else, I assume adpositions are defaultly cases
-            case_nodes += [node for node in remaining_nodes
-                           if node['lemma'] in case_feat_map]
-            marker_nodes += [node for node in remaining_nodes
-                             if node['lemma'] in marker_feat_map
-                             and node not in case_nodes]
-            cc_nodes += [node for node in remaining_nodes 
-                        if node['lemma'] in conjtype_feat_map
-                        and node not in marker_nodes
-                        and node not in case_nodes]
-        
-        
-        # assert not [node for node in relation_nodes 
-        #             if node not in marker_nodes 
-        #             and node not in case_nodes 
-        #             and node not in cc_nodes], ' '.join([node['form']+'_'+str(node['id'])+'_'+node['deprel']+'_'+str(node['head']) for node in parse_list])
-
-        if [node for node in relation_nodes 
-               if node not in marker_nodes 
-               and node not in case_nodes 
-               and node not in cc_nodes]:
-            print(*[node['lemma'] for node in relation_nodes 
-                    if node not in marker_nodes 
-                    and node not in case_nodes 
-                    and node not in cc_nodes], sep='\n')
-            print(' '.join([node['form']+'_'+str(node['id'])+'_'+node['deprel']+'_'+str(node['head']) for node in parse_list]))
-            print()
-
+            case_nodes += [i for i in remaining_nodes
+                           if lemma[i] in case_feat_map]
+            marker_nodes += [i for i in remaining_nodes
+                             if lemma[i] in marker_feat_map
+                             and i not in case_nodes]
+            cc_nodes += [i for i in remaining_nodes 
+                        if lemma[i] in conjtype_feat_map
+                        and i not in marker_nodes
+                        and i not in case_nodes]
+
+        unclassified = tuple(lemma[i] for i in range(len(signature))
+                             if i not in marker_nodes
+                             and i not in case_nodes
+                             and i not in cc_nodes)
 
         if marker_nodes:
-            feats['RelType'] = ','.join([marker_feat_map.get(node['lemma'], node['lemma']) for node in marker_nodes])
+            feats['RelType'] = ','.join([marker_feat_map.get(lemma[i], lemma[i]) for i in marker_nodes])
         if case_nodes:
-            feats['Case'] = ','.join([case_feat_map.get(node['lemma'], node['lemma']) for node in case_nodes])
+            feats['Case'] = ','.join([case_feat_map.get(lemma[i], lemma[i]) for i in case_nodes])
         if cc_nodes:
-            feats['ConjType'] = ','.join([conjtype_feat_map.get(node['lemma'], node['lemma']) for node in cc_nodes])
+            feats['ConjType'] = ','.join([conjtype_feat_map.get(lemma[i], lemma[i]) for i in cc_nodes])
 
     else:
-        marker_nodes = [node for node in relation_nodes if node['deprel'] != 'cc']
-        feats['RelType'] = ','.join([get_rel_feat(node['lemma']) for node in marker_nodes])
+        marker_nodes = [i for i, (_, deprel) in enumerate(signature) if deprel != 'cc']
+        feats['RelType'] = ','.join([get_rel_feat(lemma[i]) for i in marker_nodes])
 
-        cc_nodes = [node for node in relation_nodes if node not in marker_nodes]
-        feats['ConjType'] = ','.join([get_conj_feat(node['lemma']) for node in cc_nodes])
+        cc_nodes = [i for i in range(len(signature)) if i not in marker_nodes]
+        feats['ConjType'] = ','.join([get_conj_feat(lemma[i]) for i in cc_nodes])
     
-    return feats
+    return feats, unclassified
 
-def get_nTAM_feats(aux_nodes: list[conllu.Token],
-                   head_feats: dict,
-                   children: list[conllu.Token],
-                   verb=True) -> dict:
+def get_relation_feats(relation_nodes: list[Node], verb=True, clause=False) -> dict:
     '''
-        this function goes through a list of auxiliary verbs and particles
-        giving the head of the auxiliary verb the appropriate feats
+    Generating morpho_syntactic features for relations. For nominals, cases are put under the 'Case' feature, markers are put under RelType, and
+    conjunctions under 'ConjType'. For verbs, all values are under 'RelType'.
+    The mapping from words to features is in 'swe_relations.py' and should be updated there.
     '''
-    feats = defaultdict(str)
-    modality = ''
-
-    foreign = {'do', 'not', 'to'}
-
-    aux_lemmas = {aux['lemma'] for aux in aux_nodes if aux['lemma'] not in foreign}
-    
-    if 'att' in aux_lemmas:
-        feats['VerbForm'] = 'Inf'
-        aux_lemmas.discard('att')
-    else:
-        feats['VerbForm'] = 'Fin'
-
-    if 'bli' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'bli']
-        if len(node) != 1:
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        feats['Voice'] = 'Pass'
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-        aux_lemmas.discard('bli')
-
-    if 'få' in aux_lemmas: # Nec or Prms
-        node = [node for node in aux_nodes if node['lemma'] == 'få']
-        if len(node) != 1:
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text'])
-        node = node[0]
-
-        modality += ',Prms' # Oklart om den finns
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        elif node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])         
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-        aux_lemmas.discard('få')
-
-    if 'vara' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'vara']
-        if len(node) != 1:
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        elif node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])         
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('vara')
-
-    if 'komma' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'komma']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = 'Fut' if node['feats'].get('Tense', None) == 'Pres' else 'Past'
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('komma')
-
-    if 'måste' in aux_lemmas:
-        modality += ',Nec'
-
-        feats['Tense'] = 'Pres'
-        if not feats['Mood']: feats['Mood'] = 'Ind'
-
-        aux_lemmas.discard('måste')
-
-    if 'torde' in aux_lemmas:
-        modality += ',Nec' # osäker
-
-        feats['Tense'] = 'Past'
-        if not feats['Mood']: feats['Mood'] = 'Ind'
+    # the lemma of a node heading a fixed expression is the whole expression
+    signature = tuple((node.fixed_lemma or node.lemma, node.deprel) for node in relation_nodes)
+    feats, unclassified = relation_feats(signature, verb, clause)
 
-        aux_lemmas.discard('torde')
+    if feats is None:
+        case_nodes = [node for node in relation_nodes if node.deprel == 'case']
+        return f"REL_CASE_VERB_{'|'.join([str(n.id)+'->'+str(n.head) for n in case_nodes])}"
 
-    if 'böra' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'böra']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
+    # assert not unclassified, ' '.join([node.form+'_'+str(node.id)+'_'+node.deprel+'_'+str(node.head) for node in parse_list])
+    if unclassified:
+        # they are listed in the report of the sentence
+        unclassified_relations.append(list(unclassified))
 
-        modality += ',Nec'
-
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('böra')
-
-    if 'behöva' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'behöva']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        modality += ',Nec' 
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        elif node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('behöva')
-
-    if 'kunna' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'kunna']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        modality += ',Pot'
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        elif node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
+    return feats
 
-        aux_lemmas.discard('kunna')
+def copy_tense(aux_feats, tense):
+    return aux_feats.get('Tense', tense)
+
+def future_tense(aux_feats, tense):
+    return 'Fut' if aux_feats.get('Tense', None) == 'Pres' else 'Past'
+
+def shifted_tense(aux_feats, tense):
+    # like future_tense, but an auxiliary without a tense of its own takes the one set before it
+    return 'Fut' if aux_feats.get('Tense', tense) == 'Pres' else 'Past'
+
+# the auxiliaries and particles giving TAM feats to their head, in the order they are applied: a later auxiliary sets the
+# tense over an earlier one, while the mood is only set by the first one.
+#   voice: the voice of the head.
+#   modality: added to the mood of the head.
+#   perfect: 'Sup' if the head is perfect when the auxiliary is a supine, True if it always is.
+#   tense: for a finite auxiliary, a function of it and the current tense giving the tense of the head. A fixed tense
+#          is given as a string, for auxiliaries that are always finite and are not looked at.
+AUX_RULES = [
+    ('bli', {'voice': 'Pass', 'perfect': 'Sup', 'tense': copy_tense}),
+    ('få', {'modality': 'Prms', 'perfect': 'Sup', 'tense': copy_tense}),  # Oklart om den finns
+    ('vara', {'perfect': 'Sup', 'tense': copy_tense}),
+    ('komma', {'perfect': 'Sup', 'tense': future_tense}),
+    ('måste', {'modality': 'Nec', 'tense': 'Pres'}),
+    ('torde', {'modality': 'Nec', 'tense': 'Past'}),  # osäker
+    ('böra', {'modality': 'Nec', 'tense': copy_tense}),
+    ('behöva', {'modality': 'Nec', 'perfect': 'Sup', 'tense': copy_tense}),
+    ('kunna', {'modality': 'Pot', 'perfect': 'Sup', 'tense': copy_tense}),
+    ('lär', {'modality': 'Nec', 'tense': 'Pres'}),  # osäker (Nec)
+    ('vilja', {'modality': 'Des', 'perfect': 'Sup', 'tense': copy_tense}),
+    ('må', {'modality': 'Pot', 'tense': copy_tense}),  # or maybe Jus/Prms/Opt?
+    ('skola', {'tense': shifted_tense}),
+    ('ha', {'perfect': True, 'tense': copy_tense}),
+    ('så', {'modality': 'Cnd'}),
+]
+NEGATION = {'inte', 'icke', 'ej'}
+# lemmas of other languages that are tagged as auxiliaries in the treebanks
+FOREIGN_AUX = {'do', 'not', 'to'}
+
+def compile_aux_rules(rules):
+    '''
+        the rules by lemma, with their position in the table
+    '''
+    return {lemma: (position, rule) for position, (lemma, rule) in enumerate(rules)}
 
-    if 'lär' in aux_lemmas:
-        modality += ',Nec' # osäker (Nec)
+AUX_DISPATCH = compile_aux_rules(AUX_RULES)
 
-        feats['Tense'] = 'Pres'
+def apply_aux_rule(rule, aux_feats, feats):
+    '''
+        sets the feats given by one auxiliary, aux_feats are the feats of the auxiliaries with its lemma.
+        :return: its modality, or None if the rule needs a single auxiliary and there are several.
+    '''
+    tense = rule.get('tense')
+    node_feats = verb_form = None
+    if callable(tense):
+        if len(aux_feats) != 1:
+            return None
+        node_feats = aux_feats[0]
+        verb_form = node_feats.get('VerbForm', None)
+
+    if 'voice' in rule:
+        feats['Voice'] = rule['voice']
+
+    perfect = rule.get('perfect')
+    if perfect is True or (perfect and verb_form == perfect):
+        feats['Aspect'] += ',Perf'
+
+    if isinstance(tense, str):
+        feats['Tense'] = tense
         if not feats['Mood']: feats['Mood'] = 'Ind'
+    elif tense is not None and verb_form == 'Fin':
+        feats['Tense'] = tense(node_feats, feats['Tense'])
+        if not feats['Mood']: feats['Mood'] = node_feats.get('Mood', 'Ind')
 
-        aux_lemmas.discard('lär')
-
-    if 'vilja' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'vilja']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-
-        modality += ',Des'
-
-        if node['feats'].get('VerbForm', None) == 'Sup':
-            feats['Aspect'] += ',Perf'
-
-        elif node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('vilja')
-
-    if 'må' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'må']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
-        
-        modality += ',Pot' # or maybe Jus/Prms/Opt?
-
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-
-        aux_lemmas.discard('må')
-
-    if 'skola' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'skola']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
+    return ',' + rule['modality'] if 'modality' in rule else ''
 
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = 'Fut' if node['feats'].get('Tense', feats['Tense']) == 'Pres' else 'Past'
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-            
-        aux_lemmas.discard('skola')
+# the feats of an auxiliary the rules look at
+AUX_SIGNATURE_FEATS = ('VerbForm', 'Tense', 'Mood')
 
-    if 'ha' in aux_lemmas:
-        node = [node for node in aux_nodes if node['lemma'] == 'ha']
-        if len(node) != 1: 
-            return f"TAM_MULTIPLE_{node[0]['lemma']}_{'-'.join([str(n['id']) for n in node])}" # assert len(node) == 1, (parse_list.metadata['sent_id'], parse_list.metadata['text']) 
-        node = node[0]
+@lru_cache(maxsize=FEATS_CACHE_SIZE)
+def tam_feats(signature: tuple):
+    '''
+        the TAM feats of a construction, see get_nTAM_feats().
+        :param signature: the lemma of each auxiliary in order, with the AUX_SIGNATURE_FEATS it has as a tuple of
+                          (feat, value) pairs, or None if it has no feats.
+        :return: the feats, shared by every construction with the signature and not to be written to, or a 2-tuple
+                 (error prefix, lemmas) if the auxiliaries cannot be treated, the ids of the auxiliaries with these lemmas
+                 complete the error.
+    '''
+    feats = defaultdict(str)
+    modality = ''
 
-        if 'Perf' not in feats['Aspect']:
-            feats['Aspect'] += ',Perf'
+    by_lemma = defaultdict(list)
+    for lemma, aux_feats in signature:
+        if lemma not in FOREIGN_AUX:
+            by_lemma[lemma].append(dict(aux_feats) if aux_feats is not None else None)
 
-        if node['feats'].get('VerbForm', None) == 'Fin':
-            feats['Tense'] = node['feats'].get('Tense', feats['Tense'])
-            if not feats['Mood']: feats['Mood'] = node['feats'].get('Mood', 'Ind')
-        aux_lemmas.discard('ha')
+    if 'att' in by_lemma:
+        feats['VerbForm'] = 'Inf'
+        del by_lemma['att']
+    else:
+        feats['VerbForm'] = 'Fin'
 
-    if 'så' in aux_lemmas:
-        modality += ',Cnd'
-        aux_lemmas.discard('så')
+    for lemma in sorted(by_lemma.keys() & AUX_DISPATCH.keys(), key=lambda lemma: AUX_DISPATCH[lemma][0]):
+        added = apply_aux_rule(AUX_DISPATCH[lemma][1], by_lemma.pop(lemma), feats)
+        if added is None:
+            return f'TAM_MULTIPLE_{lemma}_', (lemma,)
+        modality += added
 
-    if aux_lemmas&{'inte', 'icke', 'ej'}:
+    if by_lemma.keys() & NEGATION:
         if modality:
-            modality = f',neg({"+".join(sorted(list(set([m for m in modality.split(",") if i])))).strip("+")})'
+            modality = f',neg({"+".join(sorted(list(set([m for m in modality.split(",") if m])))).strip("+")})'
         elif not modality:
             feats['Polarity'] = 'Neg'
-        aux_lemmas.discard('inte')
-        aux_lemmas.discard('icke')
-        aux_lemmas.discard('ej')
+        for lemma in NEGATION:
+            by_lemma.pop(lemma, None)
 
     else:
         feats['Polarity'] = 'Pos'
@@ -348,10 +245,8 @@ def get_nTAM_feats(aux_nodes: list[conllu.Token],
     feats['Mood'] += modality
     feats['Mood'] = feats['Mood'].strip(',')
 
-    if aux_lemmas:
-        untreated_node = [node['id'] for node in aux_nodes if node['lemma'] in aux_lemmas]
-        return f"TAM_UNTREATED_{'-'.join(untreated_node)}"
-        raise ValueError(f'untreated auxiliaries. their lemmas: {aux_lemmas}')
+    if by_lemma:
+        return 'TAM_UNTREATED_', tuple(by_lemma)
 
     feats = {k: ','.join(sorted(list(set([i for i in v.split(',') if i])))) for k, v in feats.items() if v}
     if 'Mood' in feats:
@@ -359,347 +254,321 @@ def get_nTAM_feats(aux_nodes: list[conllu.Token],
 
     return feats
 
-def copy_feats(ms_feats, morpho_feats, values):
+def get_nTAM_feats(aux_nodes: list[Node],
+                   head_feats: dict,
+                   children: list[Node],
+                   verb=True) -> dict:
     '''
-        copies features from morpho_feats to ms_feats only is they do not exist in morpho_feats.
+        this function goes through a list of auxiliary verbs and particles
+        giving the head of the auxiliary verb the appropriate feats, following AUX_RULES.
+        The rules only look at the auxiliaries, so the feats are those of the signature of aux_nodes in tam_feats().
     '''
-    morpho_feats = {} if morpho_feats is None else morpho_feats
-    for value in values:
-        ms_feats[value] = ms_feats.get(value, morpho_feats.get(value, None))
-    
-    return ms_feats
+    signature = tuple((aux.lemma,
+                       None if aux.feats is None else tuple((feat, aux.feats[feat]) for feat in AUX_SIGNATURE_FEATS
+                                                            if feat in aux.feats))
+                      for aux in aux_nodes)
+    feats = tam_feats(signature)
+    if instrument.enabled:
+        count_tam_branches(signature, feats)
+    if isinstance(feats, tuple):
+        error, lemmas = feats
+        return error + '-'.join([str(aux.id) for aux in aux_nodes if aux.lemma in lemmas])
+    return feats
 
-def set_nodes(nodes):
+def count_tam_branches(signature, feats):
     '''
-        conllu.Token is not hashable so sets consist of ids
+        counts the rules of AUX_RULES that fired for a construction, the infinitive and the negation, or the error it gave
     '''
-    return {node['id'] for node in nodes}
+    if isinstance(feats, tuple):
+        instrument.count('tam:' + feats[0].strip('_'))
+        return
+    lemmas = {lemma for lemma, _ in signature}
+    for lemma in lemmas & AUX_DISPATCH.keys():
+        instrument.count('tam:' + lemma)
+    if 'att' in lemmas:
+        instrument.count('tam:att')
+    if lemmas & NEGATION:
+        instrument.count('tam:negation')
 
 def check_special(node):
     '''
         this function checks if the node is the first node in an advcl and modifies the head
         of said advcl
     '''
-    if node['lemma'] in {'då', 'när'} and node['deprel'] == 'advmod' and node['upos'] == 'ADV':
-        head = parse_list[id2idx[node['head']]]
-        if head['deprel'] == 'advcl':
-            children_ids = [n['id'] for n in parse_list if n['head'] == head['id']]
-            return node['id'] == min(children_ids)   
+    if node.lemma in {'då', 'när'} and node.deprel == 'advmod' and node.upos == 'ADV':
+        head = id2node[node.head]
+        if head.deprel == 'advcl':
+            return node.id == first_child_of[head.id]
     return False
 
 def check_fixed(node):
     ''' 
         This function checks if the node heads a fixed phrase
     '''
-    children = [child for child in parse_list if node['id'] == child['head'] and child['deprel'] == 'fixed']
-    return True if len(children) else False
+    return node.id in fixed_children_of
+
+# the feats determiners give their head, by lemma.
+#   feats: given by every form.
+#   fixed: given when the determiner heads a fixed expression, e.g. 'den här'.
+#   forms: given by a form, or else by other_forms.
+DET_RULES = {
+    'en': {'feats': {'Definite': 'Ind', 'Number': 'Sing'},
+           'forms': {'ett': {'Gender': 'Neut'}}, 'other_forms': {'Gender': 'Com'}},
+    'den': {'feats': {'Definite': 'Def', 'Number': 'Sing'},
+            'fixed': {'den här': {'Dem': 'Prox'}, 'den där': {'Dem': 'Dist'}},
+            'forms': {'den': {'Gender': 'Com'}, 'det': {'Gender': 'Neut'}}},
+    'de': {'feats': {'Definite': 'Def', 'Number': 'Plur'},
+           'fixed': {'de här': {'Dem': 'Prox'}, 'de där': {'Dem': 'Dist'}}},
+    'denna': {'feats': {'Definite': 'Def', 'Dem': 'Prox'},
+              'forms': {'dessa': {'Number': 'Plur', 'Gender': 'Com'}, 'detta': {'Number': 'Sing', 'Gender': 'Neut'}},
+              'other_forms': {'Number': 'Sing', 'Gender': 'Com'}},
+}
+# determiners with another lemma, by form
+DET_FORMS = {
+    # fråga omer om detta, var drar vi gränsen? (PronType=Neg)
+    'ingen': {'Definite': 'Ind', 'Gender': 'Com', 'Number': 'Sing'},
+    'inget': {'Definite': 'Ind', 'Gender': 'Neut', 'Number': 'Sing'},
+    'inga': {'Definite': 'Ind', 'Number': 'Plur'},
+}
+# the forms of adverbs marking the degree of an adjective or adverb, the first one found is used
+DEGREE_FORMS = {'mer': 'Cmp', 'mest': 'Sup'}
+
+def get_det_feats(det_node):
+    '''
+        the feats a determiner gives its head, or None if it is not one of DET_RULES or DET_FORMS
+    '''
+    form = det_node.form.lower()
+    rule = DET_RULES.get(det_node.lemma)
+    if rule is None:
+        return DET_FORMS.get(form)
+
+    feats = dict(rule['feats'])
+    feats.update(rule.get('fixed', {}).get(det_node.fixed_lemma or det_node.lemma, {}))
+    feats.update(rule.get('forms', {}).get(form, rule.get('other_forms', {})))
+    return feats
+
+def count_det_branch(det_node, det_feats):
+    '''
+        counts the rule of DET_RULES or DET_FORMS a determiner was treated by, or that it was not
+    '''
+    if det_feats is None:
+        instrument.count('det:untreated')
+    elif det_node.lemma in DET_RULES:
+        instrument.count('det:' + (det_node.fixed_lemma or det_node.lemma))
+    else:
+        instrument.count('det:form:' + det_node.form.lower())
 
-def apply_grammar(head: conllu.Token, children: list[conllu.Token]):
+def apply_grammar(head: Node, children: list[Node]):
 
     # remove children that are not of interest
-    children = [child for child in children if not child['deprel'] in {'parataxis', 'reparandum', 'punct'}]
+    children = [child for child in children if not child.deprel in {'parataxis', 'reparandum', 'punct'}]
 
-    fixed_children = [child for child in children if child['deprel'] == 'fixed']
-    head['fixed lemma'] = combine_fixed_nodes(head, fixed_children)
-    children = [child for child in children if child['deprel'] != 'fixed']
+    fixed_children = [child for child in children if child.deprel == 'fixed']
+    head.fixed_lemma = combine_fixed_nodes(head, fixed_children)
+    children = [child for child in children if child.deprel != 'fixed']
 
-    is_verb = head['upos'] in VERBAL
-    is_noun = head['upos'] in NOMINAL
+    is_verb = head.upos in VERBAL
+    is_noun = head.upos in NOMINAL
 
     if is_verb:
-        head['ms feats'] = {}
+        head.ms_feats = {}
     else:
-        if head['feats']:
-            head['ms feats'] = deepcopy(head['feats'])
+        if head.feats:
+            # feature values are strings, so a shallow copy is enough to write to
+            head.ms_feats = dict(head.feats)
         else:
-            head['ms feats'] = {}
+            head.ms_feats = {}
     
-    # if head['deprel'] == 'conj' and parse_list[id2idx[head['head']]]['deprel'] in {'case', 'mark', 'cc', 'det', 'aux', 'aux:pass', 'cop'}:
+    # if head.deprel == 'conj' and id2node[head.head].deprel in {'case', 'mark', 'cc', 'det', 'aux', 'aux:pass', 'cop'}:
     #     print('FOUND')
-    #     return f"CONJ_FUNC_HEAD_{head['id']}<-{parse_list[id2idx[head['head']]]['id']}"
+    #     return f"CONJ_FUNC_HEAD_{head.id}<-{id2node[head.head].id}"
         
 
-    TAM_nodes = [child for child in children if child['upos'] == 'PART' or (child['upos'] == 'AUX' and child['deprel'] in {'aux', 'aux:pass', 'cop'})]
+    TAM_nodes = [child for child in children if child.upos == 'PART' or (child.upos == 'AUX' and child.deprel in {'aux', 'aux:pass', 'cop'})]
 
     if TAM_nodes:
-        TAM_feats = get_nTAM_feats(TAM_nodes, head['feats'], children, is_verb)
+        TAM_feats = get_nTAM_feats(TAM_nodes, head.feats, children, is_verb)
         if isinstance(TAM_feats, dict):
-            head['ms feats'].update(TAM_feats)
+            head.ms_feats.update(TAM_feats)
         else: return TAM_feats
 
-        if not head['ms feats'].get('Mood', None): head['ms feats']['Mood'] = 'Ind'
-        if not head['ms feats'].get('Polarity', None): head['ms feats']['Polarity'] = 'Pos'
-        if not head['ms feats'].get('VerbForm', None): head['ms feats']['VerbForm'] = 'Fin'
-        if not head['ms feats'].get('Voice', None): head['ms feats']['Voice'] = 'Act'
+        if not head.ms_feats.get('Mood', None): head.ms_feats['Mood'] = 'Ind'
+        if not head.ms_feats.get('Polarity', None): head.ms_feats['Polarity'] = 'Pos'
+        if not head.ms_feats.get('VerbForm', None): head.ms_feats['VerbForm'] = 'Fin'
+        if not head.ms_feats.get('Voice', None): head.ms_feats['Voice'] = 'Act'
 
     relation_nodes = [child for child in children if
-                      (child['deprel'] in {'case', 'mark', 'cc'}
+                      (child.deprel in {'case', 'mark', 'cc'}
                        or check_special(child))
                       and child not in TAM_nodes]
     
     if relation_nodes:
-        to_update = get_relation_feats(relation_nodes, verb=is_verb, clause=head['deprel'] in clausal_rels)
+        to_update = get_relation_feats(relation_nodes, verb=is_verb, clause=head.deprel in clausal_rels)
         if isinstance(to_update, dict):
-            head['ms feats'].update(to_update)
+            head.ms_feats.update(to_update)
         else: return to_update
     
-    assert not set_nodes(TAM_nodes) & set_nodes(relation_nodes)
+    assert not set(TAM_nodes) & set(relation_nodes)
 
-    children = [node for node in children if node not in relation_nodes + TAM_nodes]
+    consumed = set(relation_nodes) | set(TAM_nodes)
+    children = [node for node in children if node not in consumed]
 
     if is_verb:
         # copy values from the morphological feats if they were not set by now
-        head['ms feats'] = copy_feats(head['ms feats'], head['feats'], ['Mood','Tense','Aspect','Voice','VerbForm','Polarity'])
+        head.ms_feats = copy_feats(head.ms_feats, head.feats, ['Mood','Tense','Aspect','Voice','VerbForm','Polarity'])
 
         # set default values for feats underspecified in UD
-        if not head['ms feats'].get('Voice', None): 
-            head['ms feats']['Voice'] = 'Act'
+        if not head.ms_feats.get('Voice', None): 
+            head.ms_feats['Voice'] = 'Act'
 
-    elif is_noun or head['upos'] in {'ADV', 'ADJ'}:
+    elif is_noun or head.upos in {'ADV', 'ADJ'}:
         # treat determiners
-        det_nodes = [child for child in children if child['deprel'] == 'det']
-        children = [node for node in children if node['deprel'] != 'det']
-        if det_nodes:
-            for det_node in det_nodes:
-                if det_node['lemma'] == 'en':
-                    head['ms feats']['Definite'] = 'Ind'
-                    head['ms feats']['Number'] = 'Sing'
-
-                    if det_node['form'].lower() == 'ett':
-                        head['ms feats']['Gender'] = 'Neut'
-                    else:
-                        head['ms feats']['Gender'] = 'Com'
-
-                elif det_node['lemma'] == 'den':
-                    head['ms feats']['Definite'] = 'Def'
-                    head['ms feats']['Number'] = 'Sing'
-
-                    if det_node.get('fixed lemma', det_node['lemma']) == 'den här':
-                            head['ms feats']['Dem'] = 'Prox'
-                    elif det_node.get('fixed lemma', det_node['lemma']) == 'den där':
-                            head['ms feats']['Dem'] = 'Dist'
-
-                    if det_node['form'].lower() == 'den':
-                        head['ms feats']['Gender'] = 'Com'
-                    
-
-                    elif det_node['form'].lower() == 'det':          
-                        head['ms feats']['Gender'] = 'Neut'
-              
-                elif det_node['lemma'] == 'de':
-                    head['ms feats']['Definite'] = 'Def'
-                    head['ms feats']['Number'] = 'Plur'
-
-                    if det_node.get('fixed lemma', det_node['lemma']) == 'de här':
-                            head['ms feats']['Dem'] = 'Prox'
-                    elif det_node.get('fixed lemma', det_node['lemma']) == 'de där':
-                            head['ms feats']['Dem'] = 'Dist'
-
-                elif det_node['lemma'] == 'denna':
-                    head['ms feats']['Definite'] = 'Def'
-                    head['ms feats']['Dem'] = 'Prox'
-
-                    if det_node['form'].lower() == 'dessa':
-                        head['ms feats']['Number'] = 'Plur'
-                    else:
-                        head['ms feats']['Number'] = 'Sing'
-
-                    if det_node['form'].lower() == 'detta':
-                        head['ms feats']['Gender'] = 'Neut'
-                    else:
-                        head['ms feats']['Gender'] = 'Com'
-
-
-                elif det_node['form'].lower() in {'ingen',       # fråga omer om detta, var drar vi gränsen?
-                                                  'inget',
-                                                  'inga'}:
-                    head['ms feats']['Definite'] = 'Ind'
-                    # head['ms feats']['PronType'] = 'Neg'
-
-                    if det_node['form'].lower() == 'ingen':
-                        head['ms feats']['Gender'] = 'Com'
-                        head['ms feats']['Number'] = 'Sing'
-                    elif det_node['form'].lower() == 'inget':
-                        head['ms feats']['Gender'] = 'Neut'
-                        head['ms feats']['Number'] = 'Sing'
-                    else:
-                        head['ms feats']['Number'] = 'Plur'
-
-                else:
-                    children = [det_node] + children
-                
-
-        if head['upos'] in {'ADV', 'ADJ'} and children:
-            advj_children = [child['form'].lower() for child in children]
-            if 'mer' in advj_children:
-                head['ms feats']['Degree'] = 'Cmp'
-              
-            elif 'mest' in advj_children:
-                head['ms feats']['Degree'] = 'Sup'
-
-            children = [node for node in children if node['form'].lower() not in {'mer', 'mest'}]
-
-    if head['ms feats']:
-        head['ms feats'] = {k: v for k, v in head['ms feats'].items() if v}
-
-    for child in children:
-        if (child['upos'] in {'ADV', 'ADJ', 'INTJ', 'DET'} | VERBAL | NOMINAL) and not child.get('ms feats', None):
-            ms_feats = deepcopy(child['feats'])
-            if ms_feats is None:
-                ms_feats = '|'
-            child['ms feats'] = ms_feats
-
-    del head['fixed lemma']
-
-def find_missing_head(parse_list):
-    parse_list = deepcopy(parse_list)
-    new_list = []
-    new_ids = {0}
-
-    problem_nodes = []
-
-    for node in parse_list:
-        if node['ms feats']:
-            new_list.append(node)
-            new_ids.add(node['id'])
-    for node in new_list:
-        if node['head'] not in new_ids:
-            problem_nodes.append(f"{node['id']}->{node['head']}")
-    return '|'.join(problem_nodes)
+        det_nodes = [child for child in children if child.deprel == 'det']
+        children = [node for node in children if node.deprel != 'det']
+        for det_node in det_nodes:
+            det_feats = get_det_feats(det_node)
+            if instrument.enabled:
+                count_det_branch(det_node, det_feats)
+            if det_feats is None:
+                children = [det_node] + children
+            else:
+                head.ms_feats.update(det_feats)
+
+        if head.upos in {'ADV', 'ADJ'} and children:
+            advj_children = {child.form.lower() for child in children}
+            for form, degree in DEGREE_FORMS.items():
+                if form in advj_children:
+                    head.ms_feats['Degree'] = degree
+                    if instrument.enabled:
+                        instrument.count('degree:' + form)
+                    break
+
+            children = [node for node in children if node.form.lower() not in DEGREE_FORMS]
+
+    if head.ms_feats:
+        head.ms_feats = {k: v for k, v in head.ms_feats.items() if v}
+
+    set_leaf_feats(children, {'ADV', 'ADJ', 'INTJ', 'DET'} | VERBAL | NOMINAL)
+
+    head.fixed_lemma = None
+
+def convert_sentence(sentence: Sentence):
+    '''
+    converts one sentence in place, setting the ms_feats of its nodes. runtime.py verifies that the result is still a
+    tree.
+    :return: None if the sentence was converted, otherwise a string describing why the grammar failed.
+    '''
+    global parse_list, id2node, fixed_children_of, first_child_of, reattached, unclassified_relations
+    parse_list = sentence.nodes
+    # what the conversion found, for report_sentence()
+    reattached, unclassified_relations = [], []
+
+    # mapping token id to nodes
+    id2node = sentence.by_id
+    # children lookups used by check_fixed() and check_special(), built once per sentence
+    fixed_children_of, first_child_of = utils.index_children(parse_list)
+
+    # utils.span() goes through the tree and yields all the nodes
+    # in the tree that have children, as tuples containing a head id
+    # and a list of child ids. The heads come bottom-up so that each
+    # node is handled as a head before it is handled as a child.
+    for head, children in utils.span(parse_list, reattached):
+        # retrieve the head node
+        head: Node = id2node[head]
+        # and a list of child nodes
+        children = [id2node[child] for child in children]
+        # we apply the conversion of features
+        # if the apply_grammar() function returns a string, and not None
+        # it means the grammar has failed to parse the sentence correctly.
+        error = apply_grammar(head, children)
+        if error:
+            return error
+
+    # if the sentence is parsed correctly so far we set the ms-feats for
+    # the content nodes that do not have children and thus are not heads.
+    set_leaf_feats([node for node in parse_list if node.deprel != 'fixed'], {'ADJ', 'INTJ'} | VERBAL | NOMINAL)
+
+    # if the node is a function node, but is heading a fixed expression,
+    # the node is treated as a content node instead and given ms-feats
+    set_leaf_feats([node for node in parse_list if check_fixed(node)], {'ADP', 'ADV'})
+
+    # function nodes end up with empty ms-feats
+
+def report_sentence(sentence: Sentence, error=None) -> dict:
+    '''
+    what the conversion did to a sentence: the conjuncts span() gave a new head, the relation lemmas that are in no map,
+    and unless the grammar failed, the nodes with ms feats and the children they absorbed. The absorbed children are
+    collected in one pass over the sentence.
+    '''
+    form_of = {0: '_'}
+    form_of.update((node.id, node.form) for node in parse_list)
+    record = {'sent_id': sentence.metadata.get('sent_id'), 'error': error,
+              'conjuncts': [{'form': form_of[node], 'head': form_of[head], 'new_head': form_of[new_head]}
+                            for node, head, new_head in reattached]}
+    if unclassified_relations:
+        tokens = ' '.join([node.form+'_'+str(node.id)+'_'+node.deprel+'_'+str(node.head) for node in parse_list])
+        record['unclassified'] = [{'lemmas': lemmas, 'tokens': tokens} for lemmas in unclassified_relations]
+    if error:
+        return record
+
+    # function words are absorbed by their head, conjuncts by the head of the node they are conjoined with
+    absorbed = defaultdict(list)
+    for child in parse_list:
+        if child.ms_feats is not None:
+            continue
+        if child.deprel != 'conj':
+            absorbed[child.head].append(child.form)
+        elif child.head != 0 and child.head in id2node:
+            absorbed[id2node[child.head].head].append(child.form)
+
+    record['unabsorbed_conjuncts'] = [node.form+':'+str(node.id) for node in parse_list
+                                      if node.deprel == 'conj' and node.ms_feats is None]
+    record['text'] = ' '.join(node.form.lower() if node.ms_feats is None else node.form.upper() for node in parse_list)
+    record['nodes'] = [{'id': node.id, 'form': node.form, 'lemma': node.lemma, 'upos': node.upos, 'deprel': node.deprel,
+                        'ms_feats': node.ms_feats, 'absorbed_children': absorbed.get(node.id, [])}
+                       for node in parse_list if node.ms_feats is not None]
+    return record
+
+def format_report(record: dict) -> str:
+    '''
+    the report of a sentence as text, for --verbose.
+    '''
+    lines = []
+    for conjunct in record['conjuncts']:
+        lines += [f"token: {conjunct['form']}", f"original head: {conjunct['head']}",
+                  f"new head: {conjunct['new_head']}"]
+    for unclassified in record.get('unclassified', []):
+        lines += unclassified['lemmas'] + [unclassified['tokens'], '']
+    if 'nodes' in record:
+        if record['unabsorbed_conjuncts']:
+            lines.append('CONJ FOUND: ' + '|'.join(record['unabsorbed_conjuncts']))
+        lines.append(record['text'])
+        for node in record['nodes']:
+            lines.append(f"\tForm: {node['form']} \tLemma: {node['lemma']} \tUpos: {node['upos']} "
+                         f"\tDeprel: {node['deprel']} \tMSFeats: {node['ms_feats']} "
+                         f"\tAbsorbed_Children: {node['absorbed_children']}")
+        lines.append('')
+    return ''.join(line + '\n' for line in lines)
+
+# the children whose lemmas are looked up in the relation maps: case, mark and cc, the parts of fixed expressions, and
+# the advmods check_special() turns into markers
+RELATION_DEPRELS = {'case', 'mark', 'cc', 'fixed', 'advmod'}
+
+# the code the output of a sentence depends on, results are cached for a fingerprint of these files. Changes to the
+# relation maps are handled by the result cache lemma by lemma.
+GRAMMAR_FILES = ['swedish.py', 'utils.py', '../morphosyntax/sentence.py', '../morphosyntax/runtime.py']
+# the stages of the grammar timed with --stats
+TIMED_FUNCTIONS = ['utils.span', 'apply_grammar', 'get_nTAM_feats', 'get_relation_feats']
+# the feats caches, whose hits and misses are written with --stats
+CACHES = {'TAM': tam_feats, 'relations': relation_feats}
+RELATION_MAPS = {'case_feat_map': case_feat_map, 'marker_feat_map': marker_feat_map,
+                 'conjtype_feat_map': conjtype_feat_map}
 
 if __name__ == '__main__':
     '''
     This script loads treebanks according to the specified settings in the 
     'consts.py' file and adds an additional collumn for a new set of features based on dependent  function words. 
+    The conversion is run by runtime.py, which streams the sentences of each treebank to its output file.
     '''
-    problematic = [] # List to store trees which the script fails to handle
-    for lang, all_banks in banks.items():
-        for bank in all_banks:
-            for split in [s for s in splits[bank].values() if s]:
-                ''' 
-                    These three for-loops retreieves the file paths for
-                    the different treebanks and their train/dev/test splits
-                    based on the settings in the 'consts.py' file.
-                ''' 
-
-                # file paths are constructed
-                filepath = os.path.join(ud_dir, lang, bank, split)
-                out_path = os.path.join(ud_dir+'+', lang, bank, split)
-
-                # two versions of the current treebank split is opened
-                # one containing the sentence in a tree hierarchical structure
-                # and one in a flat list of nodes
-                with open(filepath, encoding='utf8') as f:
-                    parse_trees = list(conllu.parse_tree_incr(f))
-                with open(filepath, encoding='utf8') as f:
-                    parse_lists = list(conllu.parse_incr(f))
-
-                assert len(parse_lists) == len(parse_trees)
-                
-
-                with open(out_path, 'w', encoding='utf8') as outfile:
-                    # loops through each sentence one at a time
-                    for i in range(len(parse_trees)):
-                        parse_tree = parse_trees[i]
-                        parse_list: conllu.TokenList = parse_lists[i]
-                        # assert all([node['head'] is not None for node in parse_list]), parse_list
-
-                        errors = []
-                        # mapping token id to parse list positions and vice versa
-                        id2idx = {token['id']:i for i, token in enumerate(parse_list) if isinstance(token['id'], int)}
-                        idx2id = [token['id'] if isinstance(token['id'], int) else None for token in parse_list]
-
-                        # utils.span() descends the tree and creates a flat list of all 
-                        # nodes in the tree that have children. It is a list of tuples
-                        # containing a head id and a list of child ids.
-                        heads = utils.span(parse_tree)
-                        # checks that each child appears as a child before it appears as a head?
-                        assert utils.verify_span(heads)
-                        # loop through the list of heads in reverse so that each node is handled
-                        # as a head before it is handled as a child.
-                        for head, children in heads[::-1]:
-                            # retrieve the head node
-                            head: conllu.Token = parse_list[id2idx[head]]
-                            # and a list of child nodes
-                            children = [parse_list[id2idx[child]] for child in children]
-                            # we apply the conversion of features
-                            # if the apply_grammar() function returns a string, and not None
-                            # it means the grammar has failed to parse the sentence correctly.
-                            error = apply_grammar(head, children)
-                            if error:
-                                break
-
-                        # if the sentence is parsed correctly so far we set the ms-feats for
-                        # the content nodes that do not have children and thus are not heads.
-                        if not error:
-                            for node in parse_list:
-                                # we catch nodes that have content node upos
-                                if node['upos'] in {'ADJ', 'INTJ'} | VERBAL | NOMINAL and not node.get('ms feats', None) and node['deprel'] != 'fixed':
-                                    ms_feats = deepcopy(node['feats'])
-                                    # pipe is set as the value for content nodes without any feats to make sure that they do not disappear in the final tree.
-                                    if ms_feats is None:
-                                        ms_feats = '|'
-                                    node['ms feats'] = ms_feats
-                                
-                                # if the node is a function node, but is heading a fixed expression,
-                                # the node is treated as a content node instead and given ms-feats
-                                elif node['upos'] in {'ADP', 'ADV'} and check_fixed(node) and not node.get('ms feats', None):
-                                    ms_feats = deepcopy(node['feats'])
-                                    if ms_feats is None:
-                                        ms_feats = '|'
-                                    node['ms feats'] = ms_feats
-
-                                # function nodes end up with empty ms-feats
-                                else:
-                                    node['ms feats'] = node.get('ms feats', None)
-                        
-                            # once the parse is complete, we check if the tree is still a valid tree
-                            if utils.verify_treeness(parse_list):
-                                if any([node for node in parse_list if node['deprel'] == 'conj' and node['ms feats'] is None]):
-                                    print('CONJ FOUND:', '|'.join([node['form']+':'+str(node['id']) for node in parse_list if node['deprel'] == 'conj' and node['ms feats'] is None]))
-                                print(' '.join(node['form'].lower() if node['ms feats'] is None else node['form'].upper() for node in parse_list))
-                                for node in parse_list:
-                                    if node['ms feats'] is not None:
-                                        print('\tForm:', node['form'], 
-                                            '\tLemma:', node['lemma'],
-                                            '\tUpos:', node['upos'],
-                                            '\tDeprel:', node['deprel'],
-                                            '\tMSFeats:', node['ms feats'], 
-                                            '\tAbsorbed_Children:', [child['form'] for child in parse_list if (child['deprel'] != 'conj' and 
-                                                           child['ms feats'] is None and 
-                                                           child['head'] == node['id']) 
-                                                           or 
-                                                           (child['deprel'] == 'conj' and 
-                                                            child['ms feats'] is None and 
-                                                            (child['head'] != 0 and 
-                                                             node['id'] == parse_list[id2idx[child['head']]]['head']))])
-                                print()
-
-                                to_write = parse_list.serialize()
-                                outfile.write(to_write + '\n')
-
-                            # if there was no previous error but the verification did not go through
-                            # we set the error to a verification error
-                            else:
-                                error = f'VER_{find_missing_head(parse_list)}'
-                        
-                        else:
-                            problematic.append((error, parse_list))    
-
-
-    with open('problematic_sentences.conllu', 'w') as f:
-        for error, parse_list in problematic:
-            for node in parse_list:
-                if 'ms feats' in node:
-                    del node['ms feats']
-                if 'fixed lemma' in node:
-                    del node['fixed lemma']
-            f.write(f'# error_type = {error}\n')
-            f.write(parse_list.serialize() + '\n')                
-
-                
-                            
-                        
-                        
-                    
-        
\ No newline at end of file
+    args = runtime.argument_parser('Adds a morpho-syntactic features column to the treebanks in consts.py.').parse_args()
+    runtime.run(sys.modules[__name__], args, runtime.input_files(args, runtime.treebank_files(ud_dir, banks, splits)))
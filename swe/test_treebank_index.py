@@ -0,0 +1,57 @@
+'''
+Tests of the queries of the treebank index and of which files it indexes again, run from the root of the repository with
+
+    python3 -m pytest
+'''
+import os
+import sys
+import subprocess
+
+from treebank_index import TreebankIndex
+
+SWE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SENTENCE = '''# sent_id = {n}
+# text = Vem som läser.
+1	Vem	vem	PRON	_	PronType=Int	2	nsubj	_	_
+2	läser	läsa	VERB	_	Tense=Pres	0	root	_	_
+3	som	som	PRON	_	PronType=Int,Rel	2	obj	_	_
+
+'''
+
+
+def write_treebank(path, first=1):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf8') as f:
+        f.write(''.join(SENTENCE.format(n=n) for n in range(first, first + 2)))
+
+
+def test_multi_value_feature_is_found_by_each_value(tmp_path):
+    write_treebank(tmp_path / 'bank' / 'a.conllu')
+    index = TreebankIndex(str(tmp_path))
+    found = {(hit.sent_id, hit.id) for hit in index.query({'PronType': 'Int'})}
+    assert found == {('1', 1), ('1', 3), ('2', 1), ('2', 3)}
+    assert {hit.id for hit in index.query({'PronType': 'Rel'})} == {3}
+    assert {hit.id for hit in index.query({'PronType': 'Int,Rel'}, lemma='som')} == {3}
+
+    process = subprocess.run([sys.executable, os.path.join(SWE_DIR, 'treebank_index.py'), str(tmp_path),
+                              '--feat', 'PronType=Int', '--deprel', 'obj'],
+                             check=True, capture_output=True, encoding='utf8')
+    lines = process.stdout.splitlines()
+    assert lines[1:-1] == [f'{os.path.join("bank", "a.conllu")}\t{n}\t3\tVem som läser.' for n in (1, 2)]
+    assert lines[-1].startswith('2 hits in ')
+
+
+def test_only_changed_files_are_indexed_again(tmp_path):
+    a, b = tmp_path / 'bank' / 'a.conllu', tmp_path / 'bank' / 'b.conllu'
+    write_treebank(a)
+    write_treebank(b, first=10)
+    assert TreebankIndex(str(tmp_path), update=False).update() == [os.path.join('bank', 'a.conllu'),
+                                                                  os.path.join('bank', 'b.conllu')]
+
+    stat = os.stat(a)
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    write_treebank(b, first=20)
+    index = TreebankIndex(str(tmp_path), update=False)
+    assert index.update() == [os.path.join('bank', 'b.conllu')]
+    assert sorted({hit.sent_id for hit in index.query(lemma='vem')}) == ['1', '2', '20', '21']
@@ -0,0 +1,229 @@
+'''
+An inverted index over the CoNLL-U files of a directory, to find where a word or construction occurs without parsing the
+treebanks again. Every word is posted under its lemma, deprel, upos and each value of its features, and under the upos
+and lemma of its head, so that e.g. the mark dependents with lemma 'fastän' of a noun are found with
+
+    index = TreebankIndex('UD/swe')
+    index.query(lemma='fastän', deprel='mark', head_upos='NOUN')
+
+or from the command line with
+
+    python3 treebank_index.py UD/swe --lemma fastän --deprel mark --head-upos NOUN
+
+The index is kept in a directory with one file per treebank file, and update() only indexes the files that were added or
+changed since it was last run, as parse_cache.py does. A posting is sentence << 16 | id, the index of the sentence in its
+file and the id of the word. The postings of a file are kept in a single array, where those of each term are a sorted
+range so that they can be intersected with numpy, and the sent_ids and texts of the sentences in a separate file, which
+is only read for files with hits. Loading the postings of a file then takes a few milliseconds.
+'''
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+# the modules shared by the languages, see morphosyntax/__init__.py
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from morphosyntax.sentence import read_sentences
+from morphosyntax.parse_cache import file_hash
+
+# the fields words are posted under, besides their features
+FIELDS = ('lemma', 'deprel', 'upos', 'head_lemma', 'head_upos')
+# indexes written by another version of this file are built again
+INDEX_VERSION = 3
+
+Hit = namedtuple('Hit', ('file', 'sentence', 'id', 'sent_id', 'text'))
+
+
+def index_file(path) -> tuple[dict, dict]:
+    '''
+    the postings of the words of one CoNLL-U file, and the sent_id and text of its sentences.
+    '''
+    postings = defaultdict(list)
+    sent_ids, texts = [], []
+    for i, sentence in enumerate(read_sentences(path)):
+        sent_ids.append(sentence.metadata.get('sent_id'))
+        texts.append(sentence.metadata.get('text'))
+        for node in sentence.nodes:
+            if not isinstance(node.id, int):
+                continue
+            posting = i << 16 | node.id
+            head = sentence.by_id.get(node.head)
+            postings['lemma', node.lemma].append(posting)
+            postings['deprel', node.deprel].append(posting)
+            postings['upos', node.upos].append(posting)
+            postings['head_lemma', head.lemma if head else 'ROOT'].append(posting)
+            postings['head_upos', head.upos if head else 'ROOT'].append(posting)
+            for feat, values in (node.feats or {}).items():
+                # a multi-value feature such as PronType=Int,Rel is found by each of its values
+                for value in values.split(','):
+                    postings['feats', f'{feat}={value}'].append(posting)
+    terms, start = {}, 0
+    for term, posting_list in postings.items():
+        terms[term] = (start, start + len(posting_list))
+        start += len(posting_list)
+    all_postings = np.fromiter((posting for posting_list in postings.values() for posting in posting_list),
+                               dtype=np.int64, count=start)
+    return {'terms': terms, 'postings': all_postings}, {'sent_ids': sent_ids, 'texts': texts}
+
+
+class TreebankIndex:
+
+    def __init__(self, treebank_dir, index_dir=None, update=True):
+        '''
+        :param index_dir: where the index is kept, '.treebank_index' in treebank_dir by default.
+        :param update: whether to bring the index up to date with the files in treebank_dir right away.
+        '''
+        self.treebank_dir = treebank_dir
+        self.index_dir = index_dir or os.path.join(treebank_dir, '.treebank_index')
+        self.manifest_path = os.path.join(self.index_dir, 'manifest.json')
+        os.makedirs(self.index_dir, exist_ok=True)
+        try:
+            with open(self.manifest_path, encoding='utf8') as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+        if self.manifest.get('version') != INDEX_VERSION:
+            self.manifest = {'version': INDEX_VERSION, 'files': {}}
+        # file -> the output of index_file(), each part loaded when first needed
+        self.segments = {}
+        self.sentences = {}
+        if update:
+            self.update()
+
+    def files(self):
+        '''
+        the CoNLL-U files in the treebank directory, relative to it.
+        '''
+        found = []
+        for directory, _, names in os.walk(self.treebank_dir):
+            found += [os.path.relpath(os.path.join(directory, name), self.treebank_dir)
+                      for name in names if name.endswith('.conllu')]
+        return sorted(found)
+
+    def update(self) -> list:
+        '''
+        indexes the files that are new or changed since the last update and forgets the ones that were removed.
+        :return: the files that were indexed.
+        '''
+        entries = self.manifest['files']
+        files = self.files()
+        indexed = []
+        for file in files:
+            path = os.path.join(self.treebank_dir, file)
+            stat = os.stat(path)
+            entry = entries.get(file)
+            if entry is not None and (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            key = file_hash(path)
+            if entry is None or entry['key'] != key:
+                segment, sentences = index_file(path)
+                with open(os.path.join(self.index_dir, key + '.pickle'), 'wb') as f:
+                    pickle.dump(segment, f, protocol=pickle.HIGHEST_PROTOCOL)
+                with open(os.path.join(self.index_dir, key + '.sentences.pickle'), 'wb') as f:
+                    pickle.dump(sentences, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.segments[file], self.sentences[file] = segment, sentences
+                indexed.append(file)
+                if entry is not None:
+                    self._remove_segment(entry['key'], file)
+            entries[file] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'key': key}
+
+        for file in set(entries) - set(files):
+            entry = entries.pop(file)
+            self.segments.pop(file, None)
+            self.sentences.pop(file, None)
+            self._remove_segment(entry['key'], file)
+
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        return indexed
+
+    def _remove_segment(self, key, file):
+        # files with the same content share their segment
+        if all(entry['key'] != key for other, entry in self.manifest['files'].items() if other != file):
+            for suffix in ('.pickle', '.sentences.pickle'):
+                try:
+                    os.remove(os.path.join(self.index_dir, key + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _load(self, loaded, file, suffix):
+        if file not in loaded:
+            with open(os.path.join(self.index_dir, self.manifest['files'][file]['key'] + suffix), 'rb') as f:
+                loaded[file] = pickle.load(f)
+        return loaded[file]
+
+    def postings(self, file, term):
+        '''
+        the sorted postings of a term, e.g. ('lemma', 'i') or ('feats', 'Case=Nom'), in one file.
+        '''
+        segment = self._load(self.segments, file, '.pickle')
+        if term not in segment['terms']:
+            return None
+        start, end = segment['terms'][term]
+        return segment['postings'][start:end]
+
+    def query(self, feats=None, **fields) -> list[Hit]:
+        '''
+        the words matching all the given values, e.g. query(lemma='i', deprel='case', feats={'Case': 'Nom'}).
+        :param fields: values for any of the FIELDS.
+        :param feats: feature values the words must have, several values of a feature as e.g. {'PronType': 'Int,Rel'}.
+        '''
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f'cannot query {", ".join(sorted(unknown))}, fields are {", ".join(FIELDS)}')
+        terms = list(fields.items()) + [('feats', f'{feat}={value}') for feat, values in (feats or {}).items()
+                                        for value in values.split(',')]
+        if not terms:
+            raise ValueError('a query needs at least one value')
+
+        hits = []
+        for file in sorted(self.manifest['files']):
+            postings = [self.postings(file, term) for term in terms]
+            if any(posting_list is None for posting_list in postings):
+                continue
+            postings.sort(key=len)
+            matches = postings[0]
+            for posting_list in postings[1:]:
+                matches = np.intersect1d(matches, posting_list, assume_unique=True)
+            if not len(matches):
+                continue
+            sentences = self._load(self.sentences, file, '.sentences.pickle')
+            for posting in matches.tolist():
+                sentence = posting >> 16
+                hits.append(Hit(file, sentence, posting & 0xFFFF, sentences['sent_ids'][sentence],
+                                sentences['texts'][sentence]))
+        return hits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Finds words in the treebanks of a directory by lemma, deprel, upos, '
+                                                 'features and head, indexing new and changed files first.')
+    parser.add_argument('treebank_dir')
+    parser.add_argument('--index-dir', help='where the index is kept (default: TREEBANK_DIR/.treebank_index).')
+    for field in FIELDS:
+        parser.add_argument('--' + field.replace('_', '-'))
+    parser.add_argument('--feat', action='append', default=[], metavar='FEAT=VALUE',
+                        help='a feature value the words must have, can be given several times.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = TreebankIndex(args.treebank_dir, args.index_dir, update=False)
+    indexed = index.update()
+    print(f'indexed {len(indexed)} new or changed files in {time.perf_counter() - start:.2f}s')
+
+    fields = {field: getattr(args, field) for field in FIELDS if getattr(args, field) is not None}
+    feats = dict(feat.split('=', 1) for feat in args.feat)
+    if fields or feats:
+        start = time.perf_counter()
+        hits = index.query(feats, **fields)
+        elapsed = time.perf_counter() - start
+        for hit in hits:
+            print(f'{hit.file}\t{hit.sent_id}\t{hit.id}\t{hit.text}')
+        print(f'{len(hits)} hits in {elapsed * 1000:.1f}ms')
@@ -1,43 +1,78 @@
 from typing import List, Union
-from copy import deepcopy
 import sys
 
 
-def span(parse_tree):
+def span(parse_list, reattached=None):
     '''
-    creates a list of all node ids that have children (i.e. that are heads) along with their children's ids.
-    :return: a list of 2-tuples, each of form (head, list_of_children).
-             [(head_id, [child_id, child_id, ...]), (head_id, [child_id, child_id, ...]), ...]
+    yields all node ids that have children (i.e. that are heads) along with their children's ids, bottom-up, so that
+    each node is yielded as a head before it appears as a child.
+    The head/children table is built in a single pass over the 'head' column. Conjuncts are not children of the node
+    they are conjoined with but of that node's head.
+    Multiword ranges, empty nodes and tokens without a head are left out, like conllu.TokenList.to_tree() does.
+    :param reattached: a list the (id, original head, new head) of the conjuncts are appended to, if given.
+    :return: a generator of 2-tuples, each of form (head, list_of_children).
+             (head_id, [child_id, child_id, ...]), (head_id, [child_id, child_id, ...]), ...
     '''
-    res = []
-    waiting_list = [parse_tree]
-    while waiting_list:
-        curr = waiting_list[0]
-        if curr.children:
-            children = []
-            for child in curr.children:
-                if child.token['deprel'] != 'conj':
-                    children.append(child)
-                if child.children:
-                    for c in child.children:
-                        if c.token['deprel'] == 'conj':
-                            print('token:', c.token['form'])
-                            print('original head:', child.token['form'])
-                            print('new head:', curr.token['form'])
-                            children.append(c)
-            
-            children = sorted([child.token['id'] for child in children])
-            if children:
-                res.append([curr.token['id'], children])
-            waiting_list += curr.children
-        waiting_list = waiting_list[1:]
-    return res
+    tokens = [token for token in parse_list
+              if isinstance(token.id, int) and token.head is not None and token.head >= 0]
+    tree = {}
+    head_of = {}
+    for token in tokens:
+        tree.setdefault(token.head, []).append(token.id)
+        head_of[token.id] = token.head
+
+    roots = tree.get(0, [])
+    if not roots:
+        raise ValueError("Found no head node, can't build tree")
+    # several roots hang from an artificial node 0, as in conllu.TokenList.to_tree()
+    root = roots[0] if len(roots) == 1 else 0
+
+    # tokens are in id order, so every list of children comes out sorted
+    children = {}
+    for token in tokens:
+        if token.deprel != 'conj':
+            children.setdefault(token.head, []).append(token.id)
+            continue
+        new_head = head_of.get(token.head)
+        if new_head is None or (new_head == 0 and root != 0):
+            continue
+        if reattached is not None:
+            reattached.append((token.id, token.head, new_head))
+        children.setdefault(new_head, []).append(token.id)
+
+    # breadth-first order of the tree, the list grows while it is being read
+    order = [root]
+    for node in order:
+        order.extend(tree.get(node, []))
+    for node in reversed(order):
+        if node in children:
+            yield node, children[node]
+
+
+def index_children(parse_list):
+    '''
+    indexes the children of every head of a sentence in one pass, so that the grammar can look them up
+    instead of scanning the whole sentence for each node.
+    :return: a 2-tuple of dicts (fixed_children, first_child), mapping a head id to the ids of its 'fixed' children
+             and to the smallest id among all of its children.
+    '''
+    fixed_children = {}
+    first_child = {}
+    for token in parse_list:
+        if not isinstance(token.id, int) or token.head is None:
+            continue
+        if token.deprel == 'fixed':
+            fixed_children.setdefault(token.head, []).append(token.id)
+        if token.head not in first_child or token.id < first_child[token.head]:
+            first_child[token.head] = token.id
+    return fixed_children, first_child
 
 
 def verify_span(heads: List[List[Union[List[int], int]]]):
     '''
     verifies that for a given list of heads and children, all heads appear in ascending id order
-    :param heads: output of utils.span()
+    (a top-down order, e.g. the reversed output of utils.span(); not needed when converting)
+    :param heads: list of (head, list_of_children) pairs
     :return: bool
     '''
     first_head = {}
@@ -52,24 +87,6 @@ def verify_span(heads: List[List[Union[List[int], int]]]):
             return False
     return True
 
-def verify_treeness(parse_list):
-    '''
-    After assignment of ms_feats, making sure that the content nodes still make a tree.
-    '''
-    parse_list = deepcopy(parse_list)
-    new_list = []
-    new_ids = {0}
-    for node in parse_list:
-        node['feats'] = node['ms feats']
-        if node['feats']:
-            new_list.append(node)
-            new_ids.add(node['id'])
-    for node in new_list:
-        if node['head'] is not None and node['head'] not in new_ids:
-            return False
-    return True
-
-
 def get_response(possible_responses, prompt):
     '''
     When one construction may serve several features, let the annotator decide which it is.
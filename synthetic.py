@@ -0,0 +1,311 @@
+'''
+Generates synthetic treebanks for stress and scaling tests of the converters. The bundled treebanks have short sentences
+and few of the constructions that are expensive to convert, so the generator builds valid UD trees whose size and shape
+are controlled: the length of the sentences, the depth of embedded clauses and nominals, the number of dependents of a
+head, the length of conj chains, and how often auxiliary chains, case, mark and fixed expressions occur. The case, mark
+and cc lemmas are drawn from swe/swe_relations.py and eng/eng_relations.py, and the multiword entries of these maps are
+written as fixed expressions.
+
+    python3 synthetic.py swe synthetic.conllu --sentences 1000 --length 200 --conj 8 --aux 3
+
+Sentences are built bottom-up from phrases, lists of tokens whose head is the index of another token of the phrase, or
+None for the head of the phrase. A sentence grows until it has --length words: the clauses of the root are coordinated,
+in chains of at most --conj clauses that are joined by parataxis.
+'''
+import os
+import sys
+import runpy
+import random
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# language -> the relation maps, the words that are not function words, the auxiliaries, and the negation
+LANGUAGES = {
+    'swe': {
+        'relations': 'swe/swe_relations.py',
+        # the maps of the case, mark and cc lemmas, by deprel
+        'maps': {'case': 'case_feat_map', 'mark': 'marker_feat_map', 'cc': 'conjtype_feat_map'},
+        'nouns': ['hus', 'bok', 'stad', 'vän', 'regering', 'fråga', 'dag', 'land', 'barn', 'bil'],
+        'verbs': ['se', 'göra', 'ta', 'ge', 'läsa', 'skriva', 'köpa', 'hitta', 'bygga', 'visa'],
+        'adjectives': ['stor', 'ny', 'gammal', 'liten', 'viktig', 'svår'],
+        'determiners': [('en', 'en'), ('den', 'den'), ('de', 'de'), ('denna', 'denna'), ('ingen', 'ingen')],
+        'noun_feats': 'Case=Nom|Definite=Ind|Gender=Com|Number=Sing',
+        'adjective_feats': 'Case=Nom|Definite=Ind|Degree=Pos|Gender=Com|Number=Sing',
+        'finite_feats': 'Mood=Ind|Tense=Pres|VerbForm=Fin|Voice=Act',
+        # auxiliaries are chained in any order, the first one is finite and the others infinitive, like the verb
+        'auxiliaries': ['kunna', 'vilja', 'skola', 'måste', 'böra', 'komma', 'få', 'ha', 'bli'],
+        'aux_feats': 'Mood=Ind|Tense=Pres|VerbForm=Fin|Voice=Act',
+        'nonfinite_aux_feats': 'VerbForm=Inf|Voice=Act',
+        'verb_after_aux_feats': 'VerbForm=Inf|Voice=Act',
+        'negation': 'inte',
+    },
+    'eng': {
+        'relations': 'eng/eng_relations.py',
+        # the cc lemmas are in case_feat_map, English has no map of its own for them
+        'maps': {'case': 'case_feat_map', 'mark': 'marker_feat_map'},
+        'cc': ['and', 'or', 'nor'],
+        'nouns': ['house', 'book', 'city', 'friend', 'government', 'question', 'day', 'country', 'child', 'car'],
+        'verbs': ['see', 'make', 'take', 'give', 'read', 'write', 'buy', 'find', 'build', 'show'],
+        'adjectives': ['big', 'new', 'old', 'small', 'important', 'hard'],
+        'determiners': [('a', 'a'), ('the', 'the'), ('this', 'this'), ('that', 'that'), ('no', 'no')],
+        'noun_feats': 'Number=Sing',
+        'adjective_feats': 'Degree=Pos',
+        'finite_feats': 'Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin',
+        # the modals the grammar treats without asking, followed by a perfect or a progressive, or by the verb itself
+        'auxiliaries': ['can', 'may', 'might', 'must', 'should', 'will'],
+        'aux_feats': 'VerbForm=Fin',
+        'chains': [('have', 'Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin', 'Tense=Past|VerbForm=Part'),
+                   ('be', 'Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin', 'VerbForm=Ger')],
+        'nonfinite_chains': [('have', 'VerbForm=Inf', 'Tense=Past|VerbForm=Part'),
+                             ('be', 'VerbForm=Inf', 'VerbForm=Ger')],
+        'verb_after_aux_feats': 'VerbForm=Inf',
+        'negation': 'not',
+    },
+}
+
+
+def relation_lemmas(language) -> dict:
+    '''
+    the case, mark and cc lemmas of a language from its relation maps, by deprel, as lists of words: the words of a
+    multiword entry are written as a fixed expression.
+    '''
+    profile = LANGUAGES[language]
+    maps = runpy.run_path(os.path.join(REPO_DIR, profile['relations']))
+    lemmas = {deprel: [entry.split(' ') for entry in maps[name]] for deprel, name in profile['maps'].items()}
+    if 'cc' in profile:
+        lemmas['cc'] = [[lemma] for lemma in profile['cc']]
+    # the entries that are punctuation or abbreviations are left out
+    return {deprel: [words for words in entries if all(word.isalpha() and word.islower() for word in words)]
+            for deprel, entries in lemmas.items()}
+
+
+def token(lemma, upos, feats='_', form=None):
+    return {'form': form or lemma, 'lemma': lemma, 'upos': upos, 'feats': feats, 'head': None, 'deprel': None}
+
+
+def attach(phrase, dependent, deprel, before=False) -> list:
+    '''
+    attaches the head of a dependent phrase to the head of a phrase, the dependent goes before or after it.
+    '''
+    dependent_head = next(i for i, tok in enumerate(dependent) if tok['head'] is None)
+    phrase_head = next(i for i, tok in enumerate(phrase) if tok['head'] is None)
+    if before:
+        offset, dependent_offset = len(dependent), 0
+    else:
+        offset, dependent_offset = 0, len(phrase)
+    combined = [dict(tok, head=None if tok['head'] is None else tok['head'] + offset) for tok in phrase]
+    added = [dict(tok, head=None if tok['head'] is None else tok['head'] + dependent_offset) for tok in dependent]
+    added[dependent_head]['head'] = phrase_head + offset
+    added[dependent_head]['deprel'] = deprel
+    return added + combined if before else combined + added
+
+
+def function_phrase(words, upos) -> list:
+    '''
+    a case, mark or cc phrase, with the words after the first one as its fixed dependents.
+    '''
+    phrase = [token(words[0], upos)]
+    for word in words[1:]:
+        phrase = attach(phrase, [token(word, upos)], 'fixed')
+    return phrase
+
+
+class Generator:
+
+    def __init__(self, language, seed=0, length=20, depth=2, fan_out=2, conj=3, conj_density=0.2, aux=2,
+                 aux_density=0.3, case_density=0.5, mark_density=0.3, fixed_density=0.1):
+        '''
+        :param length: the number of words of each sentence.
+        :param depth: how many clauses or nominals can be embedded in each other.
+        :param fan_out: the most obliques and modifiers of a head.
+        :param conj: the most conjuncts of a conj chain.
+        :param aux: the most auxiliaries of a verb.
+        :param conj_density, aux_density, case_density, mark_density, fixed_density: how often a nominal or clause is
+               coordinated, a verb has auxiliaries, a dependent nominal has a case, a clause has a mark, and a case or
+               mark is a fixed expression, if there are any in the maps.
+        '''
+        self.language = language
+        self.profile = LANGUAGES[language]
+        self.lemmas = relation_lemmas(language)
+        self.random = random.Random(seed)
+        self.length = length
+        self.depth = depth
+        self.fan_out = fan_out
+        self.conj = conj
+        self.conj_density = conj_density
+        self.aux = aux
+        self.aux_density = aux_density
+        self.case_density = case_density
+        self.mark_density = mark_density
+        self.fixed_density = fixed_density
+        # words left to the sentence being generated
+        self.budget = 0
+
+    def chance(self, density) -> bool:
+        return self.budget > 0 and self.random.random() < density
+
+    def relation(self, deprel, upos) -> list:
+        entries = self.lemmas[deprel]
+        fixed = [words for words in entries if len(words) > 1]
+        single = [words for words in entries if len(words) == 1]
+        words = self.random.choice(fixed if fixed and self.random.random() < self.fixed_density else single)
+        self.budget -= len(words)
+        return function_phrase(words, upos)
+
+    def coordinate(self, make, depth) -> list:
+        '''
+        a conj chain of phrases made by make(depth), each conjunct after the first one with a cc.
+        '''
+        phrase = make(depth)
+        if not self.chance(self.conj_density):
+            return phrase
+        for _ in range(self.random.randint(1, max(self.conj - 1, 1))):
+            if self.budget <= 0:
+                break
+            conjunct = attach(make(depth), self.relation('cc', 'CCONJ'), 'cc', before=True)
+            phrase = attach(phrase, conjunct, 'conj')
+        return phrase
+
+    def nominal(self, depth) -> list:
+        profile = self.profile
+        phrase = [token(self.random.choice(profile['nouns']), 'NOUN', profile['noun_feats'])]
+        self.budget -= 1
+        for _ in range(self.random.randint(0, self.fan_out)):
+            if not self.chance(0.3):
+                break
+            phrase = attach(phrase, [token(self.random.choice(profile['adjectives']), 'ADJ', profile['adjective_feats'])],
+                            'amod', before=True)
+            self.budget -= 1
+        if self.chance(0.6):
+            form, lemma = self.random.choice(profile['determiners'])
+            phrase = attach(phrase, [token(lemma, 'DET', form=form)], 'det', before=True)
+            self.budget -= 1
+        if depth > 0 and self.chance(0.3):
+            phrase = attach(phrase, self.oblique(depth - 1), 'nmod')
+        return phrase
+
+    def oblique(self, depth) -> list:
+        '''
+        a nominal with a case, or without one.
+        '''
+        phrase = self.coordinate(self.nominal, depth)
+        if self.chance(self.case_density):
+            phrase = attach(phrase, self.relation('case', 'ADP'), 'case', before=True)
+        return phrase
+
+    def auxiliaries(self, finite):
+        '''
+        the auxiliaries of a verb in order, as (lemma, feats) pairs, and the feats of the verb after them.
+        '''
+        profile = self.profile
+        count = self.random.randint(1, max(self.aux, 1))
+        if 'chains' not in profile:
+            lemmas = self.random.sample(profile['auxiliaries'], min(count, len(profile['auxiliaries'])))
+            auxes = [(lemma, profile['aux_feats'] if finite and i == 0 else profile['nonfinite_aux_feats'])
+                     for i, lemma in enumerate(lemmas)]
+            return auxes, profile['verb_after_aux_feats']
+
+        # a modal, then a perfect or progressive auxiliary, which decides the form of the verb
+        auxes, verb_feats = [], profile['verb_after_aux_feats']
+        if count > 1 or self.random.random() < 0.5:
+            auxes.append((self.random.choice(profile['auxiliaries']), profile['aux_feats']))
+        if count > len(auxes):
+            chains = profile['nonfinite_chains'] if auxes else profile['chains']
+            lemma, aux_feats, verb_feats = self.random.choice(chains)
+            auxes.append((lemma, aux_feats))
+        return auxes, verb_feats
+
+    def clause(self, depth) -> list:
+        profile = self.profile
+        verb = self.random.choice(profile['verbs'])
+        auxes, verb_feats = [], profile['finite_feats']
+        if self.aux and self.chance(self.aux_density):
+            auxes, verb_feats = self.auxiliaries(finite=True)
+        phrase = [token(verb, 'VERB', verb_feats)]
+        self.budget -= 1 + len(auxes)
+        if self.chance(0.2):
+            # the negation goes right after the first auxiliary, or before the verb
+            phrase = attach(phrase, [token(profile['negation'], 'PART', 'Polarity=Neg')], 'advmod', before=True)
+            self.budget -= 1
+        for lemma, aux_feats in reversed(auxes):
+            phrase = attach(phrase, [token(lemma, 'AUX', aux_feats)], 'aux', before=True)
+        # the subject comes first, before the auxiliaries, so that the clause is not taken for a question
+        phrase = attach(phrase, self.coordinate(self.nominal, depth), 'nsubj', before=True)
+        if self.chance(0.7):
+            phrase = attach(phrase, self.coordinate(self.nominal, depth), 'obj')
+        for _ in range(self.random.randint(0, self.fan_out)):
+            if self.budget <= 0:
+                break
+            phrase = attach(phrase, self.oblique(depth), 'obl')
+        if depth > 0 and self.chance(0.4):
+            phrase = attach(phrase, self.subordinate(depth - 1), self.random.choice(['advcl', 'ccomp']))
+        return phrase
+
+    def subordinate(self, depth) -> list:
+        phrase = self.clause(depth)
+        if self.chance(self.mark_density):
+            phrase = attach(phrase, self.relation('mark', 'SCONJ'), 'mark', before=True)
+        return phrase
+
+    def sentence(self) -> list:
+        '''
+        the tokens of a sentence of about self.length words, their heads are indexes into the list.
+        '''
+        self.budget = self.length - 1
+        phrase = self.coordinate(self.clause, self.depth)
+        while self.budget > 0:
+            # the clauses the conj chains did not take are coordinated in chains of their own, joined by parataxis
+            chain = self.clause(self.depth)
+            for _ in range(self.conj - 1):
+                if self.budget <= 0:
+                    break
+                conjunct = attach(self.clause(self.depth), self.relation('cc', 'CCONJ'), 'cc', before=True)
+                chain = attach(chain, conjunct, 'conj')
+            phrase = attach(phrase, chain, 'parataxis')
+        return attach(phrase, [token('.', 'PUNCT')], 'punct')
+
+    def write(self, f, sentences):
+        '''
+        writes sentences to a file in CoNLL-U.
+        '''
+        for n in range(1, sentences + 1):
+            tokens = self.sentence()
+            f.write(f'# sent_id = synthetic_{self.language}-{n}\n')
+            f.write(f"# text = {' '.join(tok['form'] for tok in tokens)}\n")
+            for i, tok in enumerate(tokens):
+                head, deprel = (0, 'root') if tok['head'] is None else (tok['head'] + 1, tok['deprel'])
+                f.write(f"{i + 1}\t{tok['form']}\t{tok['lemma']}\t{tok['upos']}\t_\t{tok['feats']}\t{head}\t{deprel}"
+                        f"\t_\t_\n")
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic treebank for stress and scaling tests.')
+    parser.add_argument('language', choices=list(LANGUAGES))
+    parser.add_argument('output', help='the CoNLL-U file to write, - for stdout.')
+    parser.add_argument('--sentences', type=int, default=1000, help='the number of sentences (default: 1000).')
+    parser.add_argument('--length', type=int, default=20, help='the number of words of each sentence (default: 20).')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='how many clauses or nominals can be embedded in each other (default: 2).')
+    parser.add_argument('--fan-out', type=int, default=2, help='the most obliques and modifiers of a head (default: 2).')
+    parser.add_argument('--conj', type=int, default=3, help='the most conjuncts of a conj chain (default: 3).')
+    parser.add_argument('--conj-density', type=float, default=0.2,
+                        help='how often a nominal or clause is coordinated (default: 0.2).')
+    parser.add_argument('--aux', type=int, default=2, help='the most auxiliaries of a verb (default: 2).')
+    parser.add_argument('--aux-density', type=float, default=0.3, help='how often a verb has auxiliaries (default: 0.3).')
+    parser.add_argument('--case-density', type=float, default=0.5,
+                        help='how often a dependent nominal has a case (default: 0.5).')
+    parser.add_argument('--mark-density', type=float, default=0.3, help='how often a clause has a mark (default: 0.3).')
+    parser.add_argument('--fixed-density', type=float, default=0.1,
+                        help='how often a case or mark is a fixed expression (default: 0.1).')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = Generator(args.language, args.seed, args.length, args.depth, args.fan_out, args.conj, args.conj_density,
+                          args.aux, args.aux_density, args.case_density, args.mark_density, args.fixed_density)
+    if args.output == '-':
+        generator.write(sys.stdout, args.sentences)
+    else:
+        with open(args.output, 'w', encoding='utf8') as f:
+            generator.write(f, args.sentences)